@@ -1,27 +1,70 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+import time
 
 # Register your models here.
 
-from .models import UserIdentifier, Project, Issue, Note, GitlabAccountRequest
+from .models import UserIdentifier, Project, Issue, Note, GitlabAccountRequest, GitlabJob
+from .outbox import approve_items, process_jobs
+from .sync import sync_projects
 admin.site.register(UserIdentifier)
-admin.site.register(Project)
 admin.site.register(GitlabAccountRequest)
 
+def bulk_approve(modeladmin, request, queryset, kind):
+    """Approve the selected items in one transaction, then post them to 
+    GitLab through the job queue's worker pool, and report how each went.
+    Items that could not be posted are left queued for the worker."""
+    started = time.perf_counter()
+    items = list(queryset.select_related('linked_project'))
+    names = {item.pk: str(item) for item in items}
+    jobs = approve_items(kind, items)
+    process_jobs(len(jobs), pks=[job.pk for job in jobs])
+    sent = 0
+    for job in GitlabJob.objects.filter(pk__in=[job.pk for job in jobs]):
+        if job.status == GitlabJob.DONE:
+            sent += 1
+        else:
+            modeladmin.message_user(
+                request, 
+                f'Could not post "{names[job.object_id]}" to GitLab '
+                f'({job.get_status_display().lower()}): {job.last_error}',
+                messages.WARNING)
+    elapsed = time.perf_counter() - started
+    modeladmin.message_user(
+        request, 
+        f"Approved {len(items)} items and posted {sent} of {len(jobs)} "
+        f"to GitLab in {elapsed:.2f} s.",
+        messages.SUCCESS if sent == len(jobs) else messages.WARNING)
+
 def bulk_approve_issues(modeladmin, request, queryset):
     """Add a bulk approval method for issues to admin panel."""
-    for issue in queryset:
-        issue.reviewer_status = 'A'
-        issue.save()
+    bulk_approve(modeladmin, request, queryset, GitlabJob.ISSUE)
 
 bulk_approve_issues.short_description = "Approve selected issues and post to GitLab."
 
 def bulk_approve_notes(modeladmin, request, queryset):
-    """Add a bulk approval method for issues to admin panel."""
-    for note in queryset:
-        note.reviewer_status = 'A'
-        note.save()
+    """Add a bulk approval method for notes to admin panel."""
+    bulk_approve(modeladmin, request, queryset, GitlabJob.NOTE)
+
+bulk_approve_notes.short_description = "Approve selected notes and post to GitLab."
 
-bulk_approve_notes.short_description = "Approve selected issues and post to GitLab."
+def refresh_projects(modeladmin, request, queryset):
+    """Add a bulk refresh method for projects to admin panel."""
+    synced, failed, timings = sync_projects(queryset, workers=8)
+    for project, error in failed.items():
+        modeladmin.message_user(
+            request, f"Could not fetch project {project.gitlab_id}: {error!r}",
+            messages.WARNING)
+    modeladmin.message_user(
+        request, 
+        f"Refreshed {len(synced)} projects from GitLab in "
+        f"{timings['fetch'] + timings['write']:.2f} s.")
+
+refresh_projects.short_description = "Refresh selected projects from GitLab"
+
+@admin.register(Project)
+class ProjectModelAdmin(admin.ModelAdmin):
+    list_display = ('name_with_namespace', 'gitlab_id', 'slug')
+    actions = [refresh_projects]
 
 @admin.register(Issue)
 class IssueModelAdmin(admin.ModelAdmin):
@@ -33,4 +76,9 @@ class IssueModelAdmin(admin.ModelAdmin):
 class NoteModelAdmin(admin.ModelAdmin):
     list_display = ('body', 'linked_project','reviewer_status')
     list_filter = ('reviewer_status', )
-    actions = [bulk_approve_notes]
\ No newline at end of file
+    actions = [bulk_approve_notes]
+
+@admin.register(GitlabJob)
+class GitlabJobModelAdmin(admin.ModelAdmin):
+    list_display = ('idempotency_key', 'status', 'attempts', 'run_after', 'last_error')
+    list_filter = ('status', 'kind')
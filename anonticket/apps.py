@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class AnonticketConfig(AppConfig):
     name = 'anonticket'
+
+    def ready(self):
+        # Parse the wordlist once at startup, rather than on the first
+        # request that checks a user identifier.
+        from anonticket.wordlist import load_wordlist
+        load_wordlist()
@@ -1,15 +1,15 @@
 from django import forms
 from django.forms import ModelForm, modelformset_factory, BaseModelFormSet
 from django.conf import settings
-from django.shortcuts import get_object_or_404, render
+from django.core.paginator import Paginator
+from django.shortcuts import render
 from django.urls import reverse
 import gitlab
 import random
 from django.core.exceptions import ValidationError
 from .models import UserIdentifier, Project, Issue, Note, GitlabAccountRequest
-
-# Initialize GitLab Object
-gl = gitlab.Gitlab(settings.GITLAB_URL, private_token=settings.GITLAB_SECRET_TOKEN)
+from gl_bot.cache import local_cached
+from gl_bot.client import get_gitlab_client
 
 class LoginForm(forms.Form):
     """A form that allows users to enter in their keycodes to login."""
@@ -42,56 +42,38 @@ class Anonymous_Ticket_Base_Search_Form(forms.Form):
     projects, issues, and tickets."""
 
     def project_search(self):
-        """Pass the data from the gitlab_id to github and look up the 
-        project details."""
+        """Set up the project chosen in the form for searching. The project
+        is not fetched from gitlab: the search is made by project id, and
+        the details shown come from the database."""
+        from .views import database_project_attributes
         # Setup a results dictionary
         result = {}
-        # Setup messages dictionary for project.
-        messages = {
-            'gitlab_project_not_found_message': """This project could not be 
-            fetched from gitlab. It likely does not exist, or you don't 
-            have access to it.""",
-            'unknown_project_error_message': """This lookup failed for 
-            a reason not currently accounted for by our current error 
-            handling.""",
-        }
         result['project_status'] = 'pending'
-        if self.cleaned_data['choose_project']:
-            working_project = self.cleaned_data['choose_project']
-        # Try to grab project matching form selection out of database.
-        try: 
-            working_project = get_object_or_404(
-                Project, name_with_namespace=working_project)
-            self.database_project = working_project
-        # Once Project is found, grab project info from gitlab.
-            try:
-                id_to_grab = working_project.gitlab_id 
-                linked_project = gl.projects.get(id_to_grab)
-            # if project does not exist (python-gitlab raises GitlabGetError)
-            # pass failed status and failure message into result dictionary.
-            except gitlab.exceptions.GitlabGetError:
-                result['project_status'] = 'failed'
-                result['project_message'] = messages['gitlab_project_not_found_message']
-            except:
-                result['project_message'] = messages['unknown_project_error_message']
-                result['project_status'] = 'failed'
-        except Project.DoesNotExist:
-            raise Http404("No Project matches the given query.")
-        except:
-            pass
-        # If successful on project lookup, add project as attribute to
-        # form Object and save project in dictionary as 'matching_project'.
-        if result['project_status'] != 'failed':    
-            self.linked_project = linked_project
-            result['status'] = 'pending'
-            result['matching_project'] = linked_project
+        # The form's ModelChoiceField has already fetched the project.
+        working_project = self.cleaned_data['choose_project']
+        self.database_project = working_project
+        gl = get_gitlab_client()
+        self.linked_project = gl.projects.get(
+            working_project.gitlab_id, lazy=True)
+        result['status'] = 'pending'
+        result['matching_project'] = database_project_attributes(working_project)
         return result
 
+    @staticmethod
+    def normalize_search(search_string):
+        """GitLab's search ignores case, and runs of spaces don't change 
+        what it finds, so searches that differ only in those share a
+        cache entry."""
+        return ' '.join(search_string.split()).lower()
+
     def issue_search(self, project_result={}):
         """Pass the data from the search_term CharField to github and 
         look up the project details."""
         result = project_result
         messages = {
+            'gitlab_project_not_found_message': """This project could not be 
+            fetched from gitlab. It likely does not exist, or you don't 
+            have access to it.""",
             'could_not_fetch_issue_message': """Your project was found, but 
             this issue could not be fetched from gitlab. It likely does 
             not exist, or you don't have access to it.""",
@@ -105,15 +87,28 @@ class Anonymous_Ticket_Base_Search_Form(forms.Form):
         if result['status'] == 'pending':
             search_string = self.cleaned_data['search_terms']
             result['search_string'] = search_string
+            search_string = self.normalize_search(search_string)
             try:
-                search_issues = self.linked_project.search('issues', search_string)
-                result['matching_issues'] = search_issues
+                search_issues = local_cached(
+                    'search', 
+                    {'project': self.linked_project.id, 'search': search_string},
+                    lambda: self.linked_project.search('issues', search_string))
+                # Copy the cached issues, as links for this user are
+                # added to them.
+                result['matching_issues'] = [
+                    dict(issue) for issue in search_issues]
                 if result['matching_issues']:
                     result['status'] = 'success'
                     result['message'] = messages['successful_issue_lookup_message']
                 else:
                     result['status'] = 'no matches'
                     result['message'] = messages['no_matching_issues_message']
+            except gitlab.exceptions.GitlabSearchError as e:
+                result['status'] = 'failed'
+                if e.response_code == 404:
+                    result['message'] = messages['gitlab_project_not_found_message']
+                else:
+                    result['message'] = messages['unknown_issue_error_message']
             except gitlab.exceptions.GitlabGetError:
                 result['status'] = 'failed'
                 result['message'] = messages['could_not_fetch_issue_message']
@@ -192,11 +187,53 @@ class PendingIssueForm(forms.ModelForm):
     #    self.fields['title'].disabled = True
     #    self.fields['description'].disabled = True
 
-class BasePendingIssueFormSet(BaseModelFormSet):
-    """Subclass of Base Formset that sets issue queryset."""
-    def __init__(self, *args, **kwargs):
+class BasePendingFormSet(BaseModelFormSet):
+    """Base formset for the moderator queue. Unbound, it holds one page
+    (settings.MODERATOR_PAGE_SIZE rows) of pending items; bound, it only
+    loads the rows whose ids were posted, and reads no more than one
+    page's worth of forms, however many the POST claims to have."""
+    related = ('linked_project', 'linked_user')
+
+    def __init__(self, *args, page=1, **kwargs):
         super().__init__(*args, **kwargs)
-        self.queryset=Issue.objects.filter(reviewer_status='P')
+        self.page = None
+        if not self.is_bound:
+            paginator = Paginator(
+                self.pending_queryset(), settings.MODERATOR_PAGE_SIZE)
+            self.page = paginator.get_page(page)
+
+    def pending_queryset(self):
+        """Returns every pending item, oldest first, with the related rows
+        the moderator template shows."""
+        return self.model.objects.filter(reviewer_status='P').select_related(
+            *self.related).order_by('created_at', 'pk')
+
+    def total_form_count(self):
+        if self.is_bound:
+            return min(
+                super().total_form_count(), settings.MODERATOR_PAGE_SIZE)
+        return super().total_form_count()
+
+    def posted_pks(self):
+        """Returns the ids posted for this formset's forms."""
+        pks = []
+        for i in range(self.total_form_count()):
+            pk = self.data.get(self.add_prefix(f"{i}-id"))
+            if pk and str(pk).isdigit():
+                pks.append(int(pk))
+        return pks
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            if self.is_bound:
+                self._queryset = self.pending_queryset().filter(
+                    pk__in=self.posted_pks())
+            else:
+                self._queryset = self.page.object_list
+        return self._queryset
+
+class BasePendingIssueFormSet(BasePendingFormSet):
+    """Subclass of Base Formset that sets issue queryset."""
 
 class PendingNoteForm(forms.ModelForm):
     """A special version of the Note Form to be used with PendingNoteFormSet."""
@@ -210,11 +247,8 @@ class PendingNoteForm(forms.ModelForm):
     # Don't actually need this right now, but leave this for later.
     #    self.fields['linked_project'].disabled = True
 
-class BasePendingNoteFormSet(BaseModelFormSet):
+class BasePendingNoteFormSet(BasePendingFormSet):
     """Subclass of Base Formset that sets queryset."""
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.queryset=Note.objects.filter(reviewer_status='P')
 
 class PendingGitlabAccountRequestForm(forms.ModelForm):
     """A special version of the Note Form to be used with PendingNoteFormSet."""
@@ -226,11 +260,9 @@ class PendingGitlabAccountRequestForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
        super(PendingGitlabAccountRequestForm, self).__init__(*args, **kwargs)
 
-class BasePendingGitlabAccountRequestFormset(BaseModelFormSet):
+class BasePendingGitlabAccountRequestFormset(BasePendingFormSet):
     """Subclass of Base Formset that sets queryset."""
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.queryset=GitlabAccountRequest.objects.filter(reviewer_status='P')
+    related = ('linked_user',)
 
 # Formset Variables to be fed to Pending Admin View.
 PendingNoteFormSet = modelformset_factory(
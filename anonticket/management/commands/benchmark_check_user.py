@@ -0,0 +1,49 @@
+from django.core.management import BaseCommand
+from django.conf import settings
+import timeit
+
+from anonticket.views import check_user
+from anonticket.wordlist import get_parsed_wordlist
+
+
+def check_user_list_scan(user_identifier, wordlist_as_list):
+    """The previous check_user, which scanned the wordlist as a list."""
+    id_to_test = user_identifier.lower().split('-')
+    if len(id_to_test) != settings.DICE_ROLLS:
+        return False
+    if len(set(id_to_test)) != len(id_to_test):
+        return False
+    return all(item in wordlist_as_list for item in id_to_test)
+
+
+class Command(BaseCommand):
+
+    help = "Times check_user against the previous list-scanning version."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--number', type=int, default=10000,
+            help="Number of checks to time for each identifier.")
+
+    def handle(self, *args, **options):
+        number = options['number']
+        wordlist = get_parsed_wordlist()
+        wordlist_as_list = list(wordlist.words)
+        # The first words of the file are found quickly by a list scan, 
+        # the last words are its worst case, and a bad word scans it all.
+        identifiers = {
+            'first words': '-'.join(wordlist.words[:settings.DICE_ROLLS]),
+            'last words': '-'.join(wordlist.words[-settings.DICE_ROLLS:]),
+            'bad word': '-'.join(
+                wordlist.words[-settings.DICE_ROLLS + 1:] + ['notaword']),
+        }
+        self.stdout.write(
+            f"Microseconds per check ({len(wordlist)} words, {number} runs):")
+        for name, identifier in identifiers.items():
+            before = timeit.timeit(
+                lambda: check_user_list_scan(identifier, wordlist_as_list),
+                number=number)
+            after = timeit.timeit(lambda: check_user(identifier), number=number)
+            self.stdout.write(
+                f"  {name:12} list scan: {before / number * 1e6:8.2f}   "
+                f"frozenset: {after / number * 1e6:8.2f}")
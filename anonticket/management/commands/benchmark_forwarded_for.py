@@ -0,0 +1,51 @@
+from django.core.management import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory
+import time
+
+from shared.middleware.reverse_proxy_ip import XForwardedForMiddleware
+
+# X-Forwarded-For headers as sent through a trusted proxy (127.0.0.1): the
+# last entry is the client's address, anything before it came from the
+# client.
+CLIENT = '198.51.100.7'
+HEADERS = {
+    'no header': None,
+    'one hop': CLIENT,
+    'client-sent entries': f'unknown, 203.0.113.9, {CLIENT}',
+    'spoofed, 10,000 addresses': ', '.join(
+        f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}'
+        for i in range(10000)) + f', {CLIENT}',
+    'spoofed, 10,000 junk entries': 'x' * 60 + ', not-an-ip' * 10000 + f', {CLIENT}',
+}
+
+
+class Command(BaseCommand):
+
+    help = """Times XForwardedForMiddleware on ordinary and long spoofed
+    X-Forwarded-For headers, and fails if a spoofed header costs more
+    than --max-ratio times a one hop header."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--max-ratio', type=float, default=20)
+
+    def handle(self, *args, **options):
+        middleware = XForwardedForMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+        times = {}
+        for name, header in HEADERS.items():
+            extra = {} if header is None else {'HTTP_X_FORWARDED_FOR': header}
+            requests = [
+                factory.get('/', **extra) for i in range(options['requests'])]
+            started = time.perf_counter()
+            for request in requests:
+                middleware(request)
+            times[name] = (time.perf_counter() - started) / len(requests)
+            if header is not None and request.META['REMOTE_ADDR'] != CLIENT:
+                raise CommandError(
+                    f"{name}: got {request.META['REMOTE_ADDR']}, not {CLIENT}.")
+            self.stdout.write(f"{name:>30}: {times[name] * 1e6:6.2f} us per request")
+        worst = max(times[name] for name in HEADERS if name.startswith('spoofed'))
+        if worst > times['one hop'] * options['max_ratio']:
+            raise CommandError("Spoofed headers are too expensive to parse.")
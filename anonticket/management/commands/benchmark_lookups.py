@@ -0,0 +1,139 @@
+from django.core.management import BaseCommand
+from django.db import connection, migrations
+from django.db.migrations.loader import MigrationLoader
+import random
+import time
+
+from anonticket.models import UserIdentifier, Project, Issue, Note
+from anonticket.wordlist import get_parsed_wordlist, pack_identifier
+
+
+class Command(BaseCommand):
+
+    help = """Fills a scratch test database with issues and notes, then
+    prints the query plan and average time of the hot lookups used by the
+    user and moderator views. Use --before to time them without the
+    indexes added in migration 0007."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--issues', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--before', action='store_true',
+            help="Undo migration 0007 on the scratch database first.")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            if options['before']:
+                self.drop_lookup_indexes()
+            started = time.perf_counter()
+            users, projects = self.populate(options['issues'], options['users'])
+            self.stdout.write(
+                f"Created {options['issues']} issues, {options['issues'] // 5} "
+                f"notes and {options['users']} users in "
+                f"{time.perf_counter() - started:.1f} s.")
+            self.report(users, projects, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def drop_lookup_indexes(self):
+        """Undo the operations of migration 0007 (and nothing else) on the
+        current tables: its indexes are removed and its fields altered back
+        to their 0006 definitions. Each step starts from the state left by
+        the previous one, so SQLite's table rebuilds neither bring an
+        index back nor lose the columns added by later migrations."""
+        loader = MigrationLoader(connection)
+        migration = loader.get_migration('anonticket', '0007_hot_lookup_indexes')
+        before = loader.project_state(
+            ('anonticket', '0006_dedupe_before_unique'), at_end=True)
+        state = loader.project_state()
+        with connection.schema_editor() as schema_editor:
+            for operation in reversed(migration.operations):
+                if isinstance(operation, migrations.AddIndex):
+                    undo = migrations.RemoveIndex(
+                        operation.model_name, operation.index.name)
+                else:
+                    old_field = before.models['anonticket', operation.model_name_lower] \
+                        .fields[operation.name]
+                    undo = migrations.AlterField(
+                        operation.model_name, operation.name, old_field.clone())
+                new_state = state.clone()
+                undo.state_forwards('anonticket', new_state)
+                undo.database_forwards('anonticket', schema_editor, state, new_state)
+                state = new_state
+
+    def populate(self, issue_count, user_count):
+        """Bulk create projects, users, issues (1% pending) and notes.
+        bulk_create skips save(), so nothing is fetched from GitLab."""
+        words = get_parsed_wordlist().words
+        Project.objects.bulk_create([
+            Project(
+                gitlab_id=number,
+                slug=f"project-{number}",
+                name_with_namespace=f"Group / Project {number}")
+            for number in range(20)
+        ])
+        # bulk_create does not set primary keys on every backend, so the
+        # rows are read back.
+        projects = list(Project.objects.all())
+        identifiers = set()
+        while len(identifiers) < user_count:
+            identifiers.add('-'.join(random.sample(words, 6)))
+        UserIdentifier.objects.bulk_create([
+            UserIdentifier(
+                user_identifier=identifier,
+                packed_identifier=pack_identifier(identifier))
+            for identifier in identifiers
+        ], batch_size=5000)
+        users = list(UserIdentifier.objects.all())
+        project_ids = [project.pk for project in projects]
+        user_ids = [user.pk for user in users]
+        for model, count in [(Issue, issue_count), (Note, issue_count // 5)]:
+            for start in range(0, count, 10000):
+                batch = []
+                for number in range(start, min(start + 10000, count)):
+                    fields = {
+                        'linked_project_id': random.choice(project_ids),
+                        'linked_user_id': random.choice(user_ids),
+                        'reviewer_status': 'P' if number % 100 == 0 else 'A',
+                    }
+                    if model is Issue:
+                        fields.update(title='Title', description='Description')
+                    else:
+                        fields.update(body='Body', issue_iid=1)
+                    batch.append(model(**fields))
+                model.objects.bulk_create(batch)
+        return users, projects
+
+    def report(self, users, projects, repeat):
+        """Print the plan and average time of each lookup. Only primary
+        keys are fetched, so the times are not dominated by building model
+        instances."""
+        user = random.choice(users)
+        lookups = {
+            'user identifier (string)': UserIdentifier.objects.filter(
+                user_identifier=user.user_identifier),
+            'user identifier (packed)': UserIdentifier.objects.identified_by(
+                user.user_identifier),
+            'pending issues': Issue.objects.filter(
+                reviewer_status='P').order_by('created_at'),
+            'pending notes': Note.objects.filter(
+                reviewer_status='P').order_by('created_at'),
+            "a user's issues": Issue.objects.filter(
+                linked_user=user).order_by('created_at'),
+            "a user's notes": Note.objects.filter(
+                linked_user=user).order_by('created_at'),
+            'project by slug': Project.objects.filter(slug='project-7'),
+            'project by name': Project.objects.filter(
+                name_with_namespace='Group / Project 7'),
+        }
+        for name, queryset in lookups.items():
+            started = time.perf_counter()
+            for attempt in range(repeat):
+                rows = len(queryset.values_list('pk', flat=True))
+            elapsed = (time.perf_counter() - started) / repeat
+            self.stdout.write(f"\n{name}: {rows} rows, {elapsed * 1000:.3f} ms")
+            self.stdout.write(f"  {queryset.explain()}")
@@ -0,0 +1,119 @@
+from django.core.management import BaseCommand, CommandError
+import multiprocessing
+import time
+import uuid
+
+# All the checks are of one client, posting the same thing.
+REMOTE_ADDR = '203.0.113.1'
+PERIOD = 3600
+
+def benchmark_request():
+    from django.test import RequestFactory
+    return RequestFactory().post(
+        '/', {'body': 'A benchmark note.'}, REMOTE_ADDR=REMOTE_ADDR)
+
+def use_rate(group, limit):
+    """Count this run in its own group, at limit requests per hour."""
+    from django.conf import settings
+    from shared.ratelimits import RATE_KEYS
+    settings.MAIN_RATE_GROUP = group
+    settings.RATELIMIT_RATES = {
+        'benchmark': {name: f'{limit}/h' for name in RATE_KEYS}}
+
+def run_checks(caches, group, limit, checks, barrier, results):
+    """Run in a fresh process, like a gunicorn worker: make checks
+    ratelimit checks, starting together with the other processes, and put
+    the number allowed and the time taken in results. caches is the
+    CACHES setting of the process that started it, which may differ from
+    the settings module's (e.g., in tests)."""
+    import django
+    django.setup()
+    from django.conf import settings
+    from shared.ratelimits import is_limited
+    settings.CACHES = caches
+    use_rate(group, limit)
+    request = benchmark_request()
+    kwargs = {'user_identifier': 'benchmark-user'}
+    allowed = 0
+    barrier.wait()
+    started = time.perf_counter()
+    for check in range(checks):
+        if not is_limited(request, 'benchmark', kwargs):
+            allowed += 1
+    results.put((allowed, time.perf_counter() - started))
+
+
+class Command(BaseCommand):
+
+    help = """Runs ratelimit checks of one client from several processes at
+    once against the 'ratelimit' cache, prints the checks per second, and
+    fails if more requests were allowed than the limit. Then times one
+    check in this process, against the two django-ratelimit checks each
+    post used to make."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument(
+            '--checks', type=int, default=2000,
+            help="Number of checks made by each process.")
+        parser.add_argument(
+            '--limit', type=int, default=1000,
+            help="Requests allowed per hour in the benchmark.")
+
+    def run_processes(self, processes, checks, limit):
+        from django.conf import settings
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(processes)
+        results = context.Queue()
+        # A new group, so that earlier runs don't count.
+        group = f'benchmark-{uuid.uuid4().hex}'
+        workers = [
+            context.Process(target=run_checks, args=(
+                settings.CACHES, group, limit, checks, barrier, results))
+            for worker in range(processes)]
+        window = int(time.time() // PERIOD)
+        for worker in workers:
+            worker.start()
+        runs = [results.get() for worker in workers]
+        for worker in workers:
+            worker.join()
+        if int(time.time() // PERIOD) != window:
+            raise CommandError(
+                "The ratelimit window ended during the run; run it again.")
+        allowed = sum(run[0] for run in runs)
+        seconds = max(run[1] for run in runs)
+        self.stdout.write(
+            f"{processes} processes made {processes * checks} checks in "
+            f"{seconds:.2f} s: {processes * checks / seconds:.0f} checks/s.")
+        self.stdout.write(f"Allowed {allowed} requests (limit {limit}).")
+        if allowed != min(limit, processes * checks):
+            raise CommandError("The limit did not hold across processes.")
+
+    def time_overhead(self, checks):
+        """Time one check of a request, with no limit reached."""
+        from django.conf import settings
+        from ratelimit.core import is_ratelimited
+        from shared.ratelimits import is_limited
+        use_rate(f'benchmark-{uuid.uuid4().hex}', checks * 10)
+        request = benchmark_request()
+        kwargs = {'user_identifier': 'benchmark-user'}
+        started = time.perf_counter()
+        for check in range(checks):
+            is_limited(request, 'benchmark', kwargs)
+        new = (time.perf_counter() - started) / checks
+        started = time.perf_counter()
+        for check in range(checks):
+            for key in ('ip', 'post:'):
+                is_ratelimited(
+                    request, group=settings.MAIN_RATE_GROUP, key=key,
+                    rate=f'{checks * 10}/h', increment=True)
+        old = (time.perf_counter() - started) / checks
+        self.stdout.write(
+            f"Per request: {new * 1e6:.0f} us to check ip, post and user "
+            f"identifier at once; {old * 1e6:.0f} us for separate ip and "
+            f"post checks.")
+
+    def handle(self, *args, **options):
+        self.run_processes(
+            options['processes'], options['checks'], options['limit'])
+        self.time_overhead(options['checks'])
@@ -0,0 +1,76 @@
+from django.core.management import BaseCommand, CommandError
+from django.conf import settings
+import os
+import subprocess
+import sys
+
+# Run in a fresh interpreter: what a gunicorn worker imports before it can
+# serve a request. The last line of output says how many GitLab clients
+# were built along the way, which should be none.
+STARTUP_SCRIPT = """
+import django
+django.setup()
+import ticketlobby.urls
+from gl_bot import client
+print(len(client._CLIENTS))
+"""
+
+def parse_importtime(output):
+    """Parse the stderr of python -X importtime into a list of (module,
+    self time, cumulative time, depth) tuples, times in microseconds."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Each level of nesting is indented by two more spaces.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+class Command(BaseCommand):
+
+    help = """Profiles the imports of a cold worker start with
+    python -X importtime, prints the slowest modules, and fails if the
+    total is over --budget milliseconds or if a GitLab client was built
+    at import time."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget', type=float, default=settings.STARTUP_IMPORT_BUDGET,
+            help="Most milliseconds the imports may take.")
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help="Number of runs; the fastest is reported.")
+
+    def run_once(self):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'ticketlobby.settings')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+        rows = parse_importtime(result.stderr)
+        total = sum(row[2] for row in rows if row[3] == 0)
+        clients = int(result.stdout.split()[-1])
+        return total, rows, clients
+
+    def handle(self, *args, **options):
+        runs = [self.run_once() for attempt in range(max(options['repeat'], 1))]
+        total, rows, clients = min(runs, key=lambda run: run[0])
+        self.stdout.write("Slowest imports (self time):")
+        for name, self_us, cumulative_us, depth in sorted(
+                rows, key=lambda row: row[1], reverse=True)[:options['top']]:
+            self.stdout.write(
+                f"  {self_us / 1000:8.1f} ms  {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+        self.stdout.write(
+            f"Total import time: {total / 1000:.1f} ms "
+            f"(budget {options['budget']:.0f} ms, {len(rows)} modules)")
+        if clients:
+            raise CommandError(
+                f"{clients} GitLab clients were built at import time.")
+        if total / 1000 > options['budget']:
+            raise CommandError("Startup imports are over budget.")
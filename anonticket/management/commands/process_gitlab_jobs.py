@@ -0,0 +1,46 @@
+from django.core.management import BaseCommand
+from django.conf import settings
+import time
+
+from anonticket.outbox import (
+    process_jobs, requeue_failed, job_counts, resolve_issue_titles)
+
+
+class Command(BaseCommand):
+
+    help = """Posts approved issues and notes, and creates the users of
+    approved account requests, on GitLab, and fills in the issue titles
+    of new notes. Runs the ready jobs once, or with --loop keeps running
+    them until stopped."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.GITLAB_JOB_WORKERS,
+            help="Number of jobs to run at the same time.")
+        parser.add_argument(
+            '--batch', type=int, default=100,
+            help="Number of jobs to claim at a time.")
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running, checking for new jobs every --sleep seconds.")
+        parser.add_argument('--sleep', type=float, default=5)
+        parser.add_argument(
+            '--requeue-failed', action='store_true',
+            help="Queue failed jobs again before running.")
+
+    def handle(self, *args, **options):
+        if options['requeue_failed']:
+            count = requeue_failed()
+            self.stdout.write(f"Queued {count} failed jobs again.")
+        while True:
+            jobs = process_jobs(options['batch'], options['workers'])
+            if jobs:
+                self.stdout.write(f"Ran {len(jobs)} jobs: {job_counts()}")
+            titles = resolve_issue_titles(options['batch'])
+            if titles:
+                self.stdout.write(f"Filled in the issue titles of {titles} notes.")
+            if not options['loop']:
+                break
+            # Go straight on to the next batch if this one was full.
+            if len(jobs) < options['batch']:
+                time.sleep(options['sleep'])
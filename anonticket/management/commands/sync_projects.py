@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from anonticket.models import Project
+from anonticket.sync import sync_projects
+
+
+class Command(BaseCommand):
+
+    help = """Refreshes every project's details from GitLab, fetching
+    --workers projects at a time."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+
+    def handle(self, *args, **options):
+        synced, failed, timings = sync_projects(
+            Project.objects.order_by('pk'), options['workers'])
+        for project, error in failed.items():
+            self.stderr.write(
+                f"Could not fetch project {project.gitlab_id}: {error!r}")
+        self.stdout.write(
+            f"Refreshed {len(synced)} of {len(synced) + len(failed)} projects: "
+            f"fetched in {timings['fetch']:.2f} s, "
+            f"saved in {timings['write'] * 1000:.1f} ms.")
@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+from django.conf import settings
+import time
+import tracemalloc
+
+from anonticket.wordlist import read_wordlist
+
+
+class Command(BaseCommand):
+
+    help = "Reports how long the wordlist takes to load and how much memory it uses."
+
+    def handle(self, *args, **options):
+        path = settings.WORD_LIST_PATH
+        started = time.perf_counter()
+        wordlist = read_wordlist(path)
+        load_time = time.perf_counter() - started
+        # Load it again to measure memory, since tracing slows loading down.
+        tracemalloc.start()
+        wordlist = read_wordlist(path)
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f"Wordlist: {path}")
+        self.stdout.write(f"Words: {len(wordlist)}")
+        self.stdout.write(f"Load time: {load_time * 1000:.2f} ms")
+        self.stdout.write(f"Memory held: {size / 1024:.1f} KiB")
+        self.stdout.write(f"Peak memory while loading: {peak / 1024:.1f} KiB")
@@ -0,0 +1,36 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+def pack_existing_identifiers(apps, schema_editor):
+    """Fill in packed_identifier for existing user identifiers. If the
+    same identifier was saved more than once (e.g., in different cases),
+    only the oldest row is packed, and lookups will find that one."""
+    from anonticket.wordlist import pack_identifier
+    UserIdentifier = apps.get_model('anonticket', 'UserIdentifier')
+    seen = set()
+    for user in UserIdentifier.objects.order_by('pk').iterator():
+        packed = pack_identifier(user.user_identifier)
+        if packed is None or packed in seen:
+            continue
+        seen.add(packed)
+        user.packed_identifier = packed
+        user.save(update_fields=['packed_identifier'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anonticket', '0004_delete_gitlabgroup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useridentifier',
+            name='packed_identifier',
+            field=models.BinaryField(max_length=16, null=True, unique=True),
+        ),
+        migrations.RunPython(
+            pack_existing_identifiers, migrations.RunPython.noop),
+    ]
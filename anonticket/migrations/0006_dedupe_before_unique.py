@@ -0,0 +1,62 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:12
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_user_identifiers(apps, schema_editor):
+    """Before user_identifier becomes unique, merge rows that hold the same
+    identifier into the oldest one, moving their issues, notes and
+    account requests over to it."""
+    UserIdentifier = apps.get_model('anonticket', 'UserIdentifier')
+    linked_models = [
+        apps.get_model('anonticket', 'Issue'),
+        apps.get_model('anonticket', 'Note'),
+        apps.get_model('anonticket', 'GitlabAccountRequest'),
+    ]
+    duplicates = (
+        UserIdentifier.objects.values('user_identifier')
+        .annotate(rows=Count('pk'), keep=Min('pk'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        extra_rows = UserIdentifier.objects.filter(
+            user_identifier=duplicate['user_identifier']
+        ).exclude(pk=duplicate['keep'])
+        for model in linked_models:
+            model.objects.filter(linked_user__in=extra_rows).update(
+                linked_user=duplicate['keep'])
+        extra_rows.delete()
+
+
+def rename_duplicate_project_slugs(apps, schema_editor):
+    """Before slug becomes unique, add the gitlab id to the slug of every
+    project but the oldest that shares a slug (as Project.unique_slug does
+    for new projects)."""
+    Project = apps.get_model('anonticket', 'Project')
+    duplicates = (
+        Project.objects.exclude(slug=None).values('slug')
+        .annotate(rows=Count('pk'), keep=Min('pk'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        extra_rows = Project.objects.filter(
+            slug=duplicate['slug']).exclude(pk=duplicate['keep'])
+        for project in extra_rows:
+            suffix = f"-{project.gitlab_id}"
+            project.slug = project.slug[:50 - len(suffix)] + suffix
+            project.save(update_fields=['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anonticket', '0005_useridentifier_packed_identifier'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_user_identifiers, migrations.RunPython.noop),
+        migrations.RunPython(
+            rename_duplicate_project_slugs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anonticket', '0006_dedupe_before_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='project',
+            name='name_with_namespace',
+            field=models.CharField(blank=True, db_index=True, max_length=200, null=True),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='slug',
+            field=models.SlugField(blank=True, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='useridentifier',
+            name='user_identifier',
+            field=models.CharField(max_length=200, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='gitlabaccountrequest',
+            index=models.Index(fields=['reviewer_status', 'created_at'], name='glrequest_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['reviewer_status', 'created_at'], name='issue_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['linked_user', 'created_at'], name='issue_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['reviewer_status', 'created_at'], name='note_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['linked_user', 'created_at'], name='note_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def mark_existing_items(apps, schema_editor):
+    """Set gitlab_status on items approved before the job queue existed:
+    sent if they were posted to GitLab, and failed if not (the old code
+    dropped errors), so they can be queued again with
+    process_gitlab_jobs --requeue-failed."""
+    Issue = apps.get_model('anonticket', 'Issue')
+    Note = apps.get_model('anonticket', 'Note')
+    GitlabAccountRequest = apps.get_model('anonticket', 'GitlabAccountRequest')
+    Issue.objects.filter(reviewer_status='A', gitlab_iid__isnull=False).update(
+        gitlab_status='S')
+    Issue.objects.filter(reviewer_status='A', gitlab_iid__isnull=True).update(
+        gitlab_status='F')
+    Note.objects.filter(reviewer_status='A', gitlab_id__isnull=False).update(
+        gitlab_status='S')
+    Note.objects.filter(reviewer_status='A', gitlab_id__isnull=True).update(
+        gitlab_status='F')
+    # approved_to_GitLab was never set, so whether the user was created is
+    # not known; requeue_failed() marks its jobs maybe_sent, so they look
+    # the user up (by username, checking the email) before creating it.
+    GitlabAccountRequest.objects.filter(reviewer_status='A').update(
+        gitlab_status='F')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anonticket', '0007_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GitlabJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('issue', 'Post Issue'), ('note', 'Post Note'), ('account', 'Create GitLab Account')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('idempotency_key', models.CharField(max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('Q', 'Queued'), ('R', 'Running'), ('D', 'Done'), ('F', 'Failed'), ('C', 'Cancelled')], default='Q', max_length=1)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='gitlabaccountrequest',
+            name='gitlab_status',
+            field=models.CharField(blank=True, choices=[('', 'Not Approved'), ('Q', 'Queued for GitLab'), ('S', 'Sent to GitLab'), ('F', 'Failed to Send')], default='', editable=False, max_length=1),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='gitlab_status',
+            field=models.CharField(blank=True, choices=[('', 'Not Approved'), ('Q', 'Queued for GitLab'), ('S', 'Sent to GitLab'), ('F', 'Failed to Send')], default='', editable=False, max_length=1),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='gitlab_status',
+            field=models.CharField(blank=True, choices=[('', 'Not Approved'), ('Q', 'Queued for GitLab'), ('S', 'Sent to GitLab'), ('F', 'Failed to Send')], default='', editable=False, max_length=1),
+        ),
+        migrations.AddIndex(
+            model_name='gitlabjob',
+            index=models.Index(fields=['status', 'run_after'], name='gitlabjob_status_run_idx'),
+        ),
+        migrations.RunPython(mark_existing_items, migrations.RunPython.noop),
+    ]
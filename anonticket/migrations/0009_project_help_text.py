@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anonticket', '0008_gitlab_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='project',
+            name='gitlab_id',
+            field=models.IntegerField(help_text='IMPORTANT: Enter a \n    gitlab ID into this field and save, and the project\'s details will \n    be fetched from gitlab! NOTHING ELSE ON THIS FORM NEEDS TO BE \n    FILLED IN. If the gitlab ID is changed, a fresh copy of the gitlab\n    details will be fetched; to refresh projects without changing them,\n    use the "Refresh selected projects from GitLab" action.'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:57
+
+from django.db import migrations, models
+from django.utils.text import capfirst
+from shared.rendering import render_markdown
+
+
+def render_existing(apps, schema_editor):
+    """Render the markdown of issues and notes saved before it was
+    rendered on save."""
+    Issue = apps.get_model('anonticket', 'Issue')
+    Note = apps.get_model('anonticket', 'Note')
+    issues = list(Issue.objects.all())
+    for issue in issues:
+        issue.description_html = render_markdown(capfirst(issue.description))
+    Issue.objects.bulk_update(issues, ['description_html'])
+    notes = list(Note.objects.all())
+    for note in notes:
+        note.body_html = render_markdown(capfirst(note.body))
+    Note.objects.bulk_update(notes, ['body_html'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anonticket', '0009_project_help_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='description_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='body_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(render_existing, migrations.RunPython.noop),
+    ]
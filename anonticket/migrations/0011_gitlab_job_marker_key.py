@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:16
+
+import anonticket.models
+from django.db import migrations, models
+from django.db.models import F
+
+
+def keep_existing_markers(apps, schema_editor):
+    """Jobs queued before marker_key existed may already have posted with
+    their idempotency_key as the marker, so their retries look for that."""
+    GitlabJob = apps.get_model('anonticket', 'GitlabJob')
+    GitlabJob.objects.update(marker_key=F('idempotency_key'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anonticket', '0010_rendered_markdown'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gitlabjob',
+            name='marker_key',
+            field=models.CharField(default=anonticket.models.new_marker_key, editable=False, max_length=64),
+        ),
+        migrations.RunPython(keep_existing_markers, migrations.RunPython.noop),
+    ]
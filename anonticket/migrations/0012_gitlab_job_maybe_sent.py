@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('anonticket', '0011_gitlab_job_marker_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gitlabjob',
+            name='maybe_sent',
+            field=models.BooleanField(default=False),
+        ),
+    ]
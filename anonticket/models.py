@@ -1,58 +1,146 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
-from django.utils.text import slugify
+from django.utils import timezone
+from django.utils.text import slugify, capfirst
 from django.utils.translation import gettext_lazy as _
 from django import forms
 import gitlab
+import uuid
+from gl_bot.client import get_gitlab_client, PRIVATE, ACCOUNTS
+from gl_bot.cache import cached, peek
+from anonticket.wordlist import pack_identifier
+from shared.rendering import render_markdown
 
 # Create your models here.
 
+# Where an approved issue, note or account request is in the GitLab job
+# queue (see GitlabJob and anonticket/outbox.py).
+GITLAB_STATUS_CHOICES = [
+    ('', 'Not Approved'),
+    ('Q', 'Queued for GitLab'),
+    ('S', 'Sent to GitLab'),
+    ('F', 'Failed to Send'),
+]
+
+class GitlabUsernameTaken(Exception):
+    """The username (or email) of an approved account request belongs to
+    a GitLab user who is not the requester. Trying again won't help, so
+    the job fails at once for a moderator to look at."""
+
+def job_marker(marker_key):
+    """Returns an HTML comment, hidden when GitLab renders markdown, that
+    is added to what a GitLab job posts so that a retry can find it. The
+    comment is public, so it holds the job's random marker_key rather
+    than anything from the database."""
+    if marker_key is None:
+        return ''
+    return f"\n\n<!-- anonticket-job {marker_key} -->"
+
+def new_marker_key():
+    """Returns a random marker_key for a new GitlabJob."""
+    return uuid.uuid4().hex
+
+class UserIdentifierQuerySet(models.QuerySet):
+    def identified_by(self, user_identifier):
+        """Filter by user identifier, using the indexed packed_identifier
+        column if the identifier can be packed. Like a CharField lookup,
+        accepts anything that converts to the identifier string."""
+        packed = pack_identifier(str(user_identifier))
+        if packed is None:
+            return self.filter(user_identifier=user_identifier)
+        return self.filter(packed_identifier=packed)
+
 class UserIdentifier(models.Model):
-    """Representation of a user identifier."""
-    user_identifier = models.CharField(max_length=200)
+    """Representation of a user identifier. On save, the identifier is
+    also stored packed into a few bytes (see anonticket/wordlist.py) in 
+    packed_identifier, which lookups use instead of the string."""
+    user_identifier = models.CharField(max_length=200, unique=True)
+    packed_identifier = models.BinaryField(
+        max_length=16, unique=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, blank=False)
 
+    objects = UserIdentifierQuerySet.as_manager()
+
     def __str__(self):
         return self.user_identifier
 
+    def save(self, *args, **kwargs):
+        self.packed_identifier = pack_identifier(self.user_identifier)
+        super(UserIdentifier, self).save(*args, **kwargs)
+
 class Project(models.Model):
     """Representation of a project in the database. To add a GL project 
     to the database, only the gitlab id number needs to be supplied in the
-    gitlab_id field. Upon saving, the project details and any necessary
-    group details will be fetched from gitlab."""
+    gitlab_id field. Upon saving a new project, or one whose gitlab_id has
+    changed, the project details will be fetched from gitlab. Other saves
+    don't call gitlab unless asked to with save(refresh=True); the
+    sync_projects command refreshes every project at once."""
     gitlab_id = models.IntegerField(help_text="""IMPORTANT: Enter a 
     gitlab ID into this field and save, and the project's details will 
     be fetched from gitlab! NOTHING ELSE ON THIS FORM NEEDS TO BE 
-    FILLED IN. Additionally, if a project is saved, a fresh copy of
-    the gitlab details will be fetched and the database entries will
-    be updated.""")
+    FILLED IN. If the gitlab ID is changed, a fresh copy of the gitlab
+    details will be fetched; to refresh projects without changing them,
+    use the "Refresh selected projects from GitLab" action.""")
     name = models.CharField(max_length=200, null=True, blank=True)
-    name_with_namespace = models.CharField(max_length=200, null=True, blank=True)
+    name_with_namespace = models.CharField(
+        max_length=200, null=True, blank=True, db_index=True)
     description = models.TextField(null=True, blank=True)
-    slug = models.SlugField(max_length=50, null=True, blank=True)
+    slug = models.SlugField(max_length=50, null=True, blank=True, unique=True)
     url = models.URLField(null=True, blank=True)
 
+    # The fields filled in from gitlab.
+    GITLAB_FIELDS = ['name', 'name_with_namespace', 'description', 'slug', 'url']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the gitlab_id the project was loaded with, so that
+        save() can tell if it changed."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_gitlab_id = instance.__dict__.get('gitlab_id')
+        return instance
+
     def fetch_from_gitlab(self):
-        """Given the gitlab_id, fetch the relevant information from Gitlab."""
-        # Create the gitlab object
-        gl = gitlab.Gitlab(settings.GITLAB_URL, private_token=settings.GITLAB_SECRET_TOKEN)
+        """Given the gitlab_id, fetch the relevant information from Gitlab.
+        Returns True if it was fetched."""
+        # Grab the shared gitlab object
+        gl = get_gitlab_client(PRIVATE)
         # Grab the associated project from gitlab.
         try: 
-            working_project = gl.projects.get(self.gitlab_id)
-            self.name = working_project.name
-            self.name_with_namespace = working_project.name_with_namespace
-            self.description = working_project.description 
-            self.slug = slugify(working_project.name)
-            self.url = working_project.web_url
-        # if the project does not have a gitlab_group foreignkey, first
-        # check to see if a GitLabGroup object with the gitlab id exists.
+            self.set_gitlab_details(gl.projects.get(self.gitlab_id))
+            return True
         except:
-            pass
+            return False
 
-    def save(self, *args, **kwargs):
-        """Update the save method to fetch fresh info from gitlab when projects are saved."""
-        self.fetch_from_gitlab()
+    def set_gitlab_details(self, working_project, taken_slugs=None):
+        """Copy the details of a python-gitlab project to this project."""
+        self.name = working_project.name
+        self.name_with_namespace = working_project.name_with_namespace
+        self.description = working_project.description 
+        self.slug = self.unique_slug(slugify(working_project.name), taken_slugs)
+        self.url = working_project.web_url
+
+    def unique_slug(self, slug, taken_slugs=None):
+        """Returns slug, or slug with the gitlab id added if another project
+        (e.g., one with the same name in a different namespace) has it.
+        taken_slugs, if given, is the set of other projects' slugs, and
+        saves looking them up."""
+        if taken_slugs is None:
+            taken = Project.objects.filter(slug=slug).exclude(pk=self.pk).exists()
+        else:
+            taken = slug in taken_slugs
+        if taken:
+            suffix = f"-{self.gitlab_id}"
+            slug = slug[:50 - len(suffix)] + suffix
+        return slug
+
+    def save(self, *args, refresh=False, **kwargs):
+        """Fetch fresh info from gitlab when a project is added, when its 
+        gitlab_id changes, or when refresh is True."""
+        if (refresh or self.pk is None 
+                or self.gitlab_id != getattr(self, '_loaded_gitlab_id', None)):
+            self.fetch_from_gitlab()
         super(Project, self).save(*args, **kwargs)
+        self._loaded_gitlab_id = self.gitlab_id
 
     def __str__(self):
         return self.name_with_namespace
@@ -63,6 +151,8 @@ class Issue(models.Model):
     linked_project = models.ForeignKey(Project, on_delete=models.CASCADE)
     linked_user = models.ForeignKey(UserIdentifier, on_delete=models.CASCADE)
     description= models.TextField()
+    # The description rendered from markdown, on save.
+    description_html = models.TextField(blank=True, editable=False)
     gitlab_iid = models.IntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, blank=False)
     mod_comment = models.TextField(
@@ -88,29 +178,57 @@ class Issue(models.Model):
     )
     # Fields related to GitLab status
     posted_to_GitLab = models.BooleanField(default=False)
+    gitlab_status = models.CharField(
+        max_length=1, choices=GITLAB_STATUS_CHOICES, default='', 
+        blank=True, editable=False)
 
-    def approve_issue(self):
-        """Approve an issue and post to GitLab or return error."""
-        # Create the gitlab object
-        gl = gitlab.Gitlab(settings.GITLAB_URL, private_token=settings.GITLAB_SECRET_TOKEN)
-        # Grab the associated project from gitlab.
-        working_project = gl.projects.get(self.linked_project.gitlab_id)
-        # Try to create the issue in the gitlab API, saving the newly
-        # created issue iid to the model's issue.iid field.
-        try:
+    class Meta:
+        # The moderator page lists pending issues, and the user landing
+        # page lists a user's issues, both oldest first.
+        indexes = [
+            models.Index(
+                fields=['reviewer_status', 'created_at'], 
+                name='issue_status_created_idx'),
+            models.Index(
+                fields=['linked_user', 'created_at'], 
+                name='issue_user_created_idx'),
+        ]
+
+    def approve_issue(self, marker_key=None, retry=False):
+        """Post an approved issue to GitLab, setting gitlab_iid. Run by the
+        GitLab job worker, which retries on errors; on a retry, an issue 
+        that an earlier attempt posted is found and not posted again."""
+        # Grab the shared gitlab object
+        gl = get_gitlab_client(PRIVATE)
+        # The project is only needed for its issues URL, so don't fetch it.
+        working_project = gl.projects.get(
+            self.linked_project.gitlab_id, lazy=True)
+        marker = job_marker(marker_key)
+        new_issue = None
+        if retry and marker:
+            for found in working_project.issues.list(
+                    search=marker_key, **{'in': 'description'}):
+                if marker in (found.description or ''):
+                    new_issue = found
+        if new_issue is None:
             new_issue = working_project.issues.create(
                 {'title': self.title,
-                'description': self.description}
+                'description': self.description + marker}
                 )
-            self.posted_to_GitLab = True
-            self.gitlab_iid = new_issue.iid
-        except:
-            pass
+        self.posted_to_GitLab = True
+        self.gitlab_iid = new_issue.iid
 
     def save(self, *args, **kwargs):
-        if self.reviewer_status == 'A' and self.gitlab_iid == None:
-            self.approve_issue() 
-        super(Issue, self).save(*args, **kwargs) 
+        """Approving an issue queues a job to post it to GitLab, saved in
+        the same transaction as the issue."""
+        self.description_html = render_markdown(capfirst(self.description))
+        queue = self.reviewer_status == 'A' and self.gitlab_iid == None
+        if queue and not self.gitlab_status:
+            self.gitlab_status = 'Q'
+        with transaction.atomic():
+            super(Issue, self).save(*args, **kwargs) 
+            if queue:
+                GitlabJob.enqueue(GitlabJob.ISSUE, self)
 
     def __str__(self):
         return self.title
@@ -129,6 +247,8 @@ class Note(models.Model):
             can use <a href='https://docs.gitlab.com/ee/user/markdown.html'
             target="_blank">
             GitLab Flavored Markdown (GFM)</a> on this form.""")
+    # The body rendered from markdown, on save.
+    body_html = models.TextField(blank=True, editable=False)
     # issue_iid is not a ForeignKey because Issue objects in database
     # are for issues pending mod approval.
     issue_iid = models.IntegerField()
@@ -160,40 +280,84 @@ class Note(models.Model):
     )
     # Fields related to GitLab status
     posted_to_GitLab = models.BooleanField(default=False)
+    gitlab_status = models.CharField(
+        max_length=1, choices=GITLAB_STATUS_CHOICES, default='', 
+        blank=True, editable=False)
 
-    def approve_note(self):
-        """Approve a note and post to GitLab or return error."""
-        # Create the gitlab object
-        gl = gitlab.Gitlab(settings.GITLAB_URL, private_token=settings.GITLAB_SECRET_TOKEN)
-        # Grab the associated project from gitlab.
-        working_project = gl.projects.get(self.linked_project.gitlab_id)
-        # Grab the associated issue from gitlab.
-        working_issue = working_project.issues.get(self.issue_iid)
-        # Try to create the note in the gitlab API, saving the newly
-        # created note id to the note.gitlab_id field.
-        try:
+    class Meta:
+        # The moderator page lists pending notes, and the user landing
+        # page lists a user's notes, both oldest first.
+        indexes = [
+            models.Index(
+                fields=['reviewer_status', 'created_at'], 
+                name='note_status_created_idx'),
+            models.Index(
+                fields=['linked_user', 'created_at'], 
+                name='note_user_created_idx'),
+        ]
+
+    def approve_note(self, marker_key=None, retry=False):
+        """Post an approved note to GitLab, setting gitlab_id. Run by the
+        GitLab job worker, which retries on errors; on a retry, a note 
+        that an earlier attempt posted is found and not posted again."""
+        # Grab the shared gitlab object
+        gl = get_gitlab_client(PRIVATE)
+        # The project and issue are only needed for the notes URL.
+        working_project = gl.projects.get(
+            self.linked_project.gitlab_id, lazy=True)
+        working_issue = working_project.issues.get(self.issue_iid, lazy=True)
+        marker = job_marker(marker_key)
+        new_note = None
+        if retry and marker:
+            # An earlier attempt's note would be among the newest.
+            for found in working_issue.notes.list(
+                    sort='desc', order_by='created_at', per_page=100):
+                if marker in (found.body or ''):
+                    new_note = found
+        if new_note is None:
             new_note = working_issue.notes.create(
-                {'body': self.body,
+                {'body': self.body + marker,
                 }
                 )
-            self.posted_to_GitLab = True
-            self.gitlab_id = new_note.id
-        except:
-            pass
+        self.posted_to_GitLab = True
+        self.gitlab_id = new_note.id
+
+    def issue_cache_params(self):
+        """Returns the GitLab cache parameters of the note's issue, the
+        same ones the issue detail view caches it under."""
+        return {'project': self.linked_project.gitlab_id, 'issue': self.issue_iid}
 
     def get_issue_title(self):
-        """Returns the title of the issue from GitLab."""
-        gl = gitlab.Gitlab(settings.GITLAB_URL, private_token=settings.GITLAB_SECRET_TOKEN)
-        working_project = gl.projects.get(self.linked_project.gitlab_id)
-        working_issue = working_project.issues.get(self.issue_iid)
-        return working_issue.title
+        """Returns the title of the issue from GitLab, through the GitLab
+        cache."""
+        def fetch():
+            gl = get_gitlab_client(PRIVATE)
+            gl_project = gl.projects.get(self.linked_project.gitlab_id, lazy=True)
+            return gl_project.issues.get(self.issue_iid).attributes
+        return cached('issue', self.issue_cache_params(), fetch)['title']
+
+    def cached_issue_title(self):
+        """Returns the title of the issue if it is cached (e.g., because the
+        user was just viewing the issue), or '' if not. Never calls GitLab;
+        titles that aren't cached are filled in by the GitLab job worker."""
+        attributes = peek('issue', self.issue_cache_params())
+        if attributes is None:
+            return ''
+        return attributes['title']
 
     def save(self, *args, **kwargs):
         if not self.gitlab_issue_title:
-            self.gitlab_issue_title = self.get_issue_title()
-        if self.reviewer_status == 'A' and self.gitlab_id == None:
-            self.approve_note() 
-        super(Note, self).save(*args, **kwargs) 
+            self.gitlab_issue_title = self.cached_issue_title()
+        self.body_html = render_markdown(capfirst(self.body))
+        # Approving a note queues a job to post it to GitLab, saved in the
+        # same transaction as the note.
+        queue = self.reviewer_status == 'A' and self.gitlab_id == None
+        if queue and not self.gitlab_status:
+            self.gitlab_status = 'Q'
+        with transaction.atomic():
+            super(Note, self).save(*args, **kwargs) 
+            if queue:
+                GitlabJob.enqueue(GitlabJob.NOTE, self)
 
     def __str__(self):
         return self.body
@@ -203,11 +367,8 @@ class Note(models.Model):
 
 def check_if_user_in_gitlab(username_to_test):
     """Validator to check if a username already exists in GitLab."""
-    # Create the gitlab object using the ACCOUNTS token
-    gl = gitlab.Gitlab(
-        settings.GITLAB_URL, 
-        private_token=settings.GITLAB_ACCOUNTS_SECRET_TOKEN
-        )
+    # Grab the shared gitlab object using the ACCOUNTS token
+    gl = get_gitlab_client(ACCOUNTS)
     try: 
         user = gl.users.list(username=f"{username_to_test}")[0]
         raise ValidationError(
@@ -250,6 +411,9 @@ class GitlabAccountRequest(models.Model):
         default='P',  
     )
     approved_to_GitLab = models.BooleanField(default=False)
+    gitlab_status = models.CharField(
+        max_length=1, choices=GITLAB_STATUS_CHOICES, default='', 
+        blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, blank=False)
     linked_user = models.ForeignKey(
         UserIdentifier, 
@@ -264,34 +428,136 @@ class GitlabAccountRequest(models.Model):
         be seen by all moderators, but it will not be seen by users. """,
     )
 
-    def approve_request(self):
-        """Approve a request and create the user on Gitlab."""
-        # Create the gitlab object
-        gl = gitlab.Gitlab(
-            settings.GITLAB_URL, 
-            private_token=settings.GITLAB_ACCOUNTS_SECRET_TOKEN
-            )
-        try:
-            new_user = gl.users.create({
-                "name":              self.username,
-                "username":          self.username,
-                "email":             self.email,
-                "reset_password":    True,
-                "can_create_group":  False,
-                "skip_confirmation": True, # The password reset mail is enough.
-            })
-            new_user.projects_limit = 5
-            new_user.save()
-        except Exception as e:
-            print("Error: {}".format(e))
+    class Meta:
+        # The moderator page lists pending account requests.
+        indexes = [
+            models.Index(
+                fields=['reviewer_status', 'created_at'], 
+                name='glrequest_status_created_idx'),
+        ]
+
+    def approve_request(self, marker_key=None, retry=False):
+        """Create the user of an approved request on Gitlab. Run by the
+        GitLab job worker, which retries on errors; on a retry, a user 
+        that an earlier attempt created (with this username and email) is
+        not created again. Raises GitlabUsernameTaken if the username or
+        email belongs to someone else."""
+        # Grab the shared gitlab object using the ACCOUNTS token
+        gl = get_gitlab_client(ACCOUNTS)
+        new_user = None
+        if retry:
+            for found in gl.users.list(username=self.username):
+                if (getattr(found, 'email', None) or '').lower() != self.email.lower():
+                    raise GitlabUsernameTaken(
+                        f"GitLab user {self.username} has another email.")
+                new_user = found
+        if new_user is None:
+            try:
+                new_user = gl.users.create({
+                    "name":              self.username,
+                    "username":          self.username,
+                    "email":             self.email,
+                    "reset_password":    True,
+                    "can_create_group":  False,
+                    "skip_confirmation": True, # The password reset mail is enough.
+                })
+            except gitlab.exceptions.GitlabCreateError as e:
+                # GitLab answers 409 Conflict when the username or email
+                # is taken.
+                if e.response_code == 409:
+                    raise GitlabUsernameTaken(
+                        f"GitLab user {self.username} already exists: {e}") from e
+                raise
+        new_user.projects_limit = 5
+        new_user.save()
+        self.approved_to_GitLab = True
     
     def save(self, *args, **kwargs):
-        if self.reviewer_status == 'A' and self.approved_to_GitLab == False:
-            try:
-                self.approve_request()
-            except Exception as e:
-                print("Error: {}".format(e))
-        super(GitlabAccountRequest, self).save(*args, **kwargs) 
+        """Approving a request queues a job to create the user on GitLab,
+        saved in the same transaction as the request."""
+        queue = self.reviewer_status == 'A' and self.approved_to_GitLab == False
+        if queue and not self.gitlab_status:
+            self.gitlab_status = 'Q'
+        with transaction.atomic():
+            super(GitlabAccountRequest, self).save(*args, **kwargs) 
+            if queue:
+                GitlabJob.enqueue(GitlabJob.ACCOUNT, self)
+
+    def __str__(self):
+        return self.username
+
+class GitlabJob(models.Model):
+    """A GitLab write waiting to be made: posting an approved issue or
+    note, or creating the user of an approved account request. Jobs are
+    queued by the models' save() methods and run by the 
+    process_gitlab_jobs command (see anonticket/outbox.py)."""
+    ISSUE = 'issue'
+    NOTE = 'note'
+    ACCOUNT = 'account'
+    KIND_CHOICES = [
+        (ISSUE, 'Post Issue'),
+        (NOTE, 'Post Note'),
+        (ACCOUNT, 'Create GitLab Account'),
+    ]
+    QUEUED = 'Q'
+    RUNNING = 'R'
+    DONE = 'D'
+    FAILED = 'F'
+    CANCELLED = 'C'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # The pk of the Issue, Note or GitlabAccountRequest, depending on kind.
+    object_id = models.PositiveIntegerField()
+    # One job per approved row, so approving it twice queues it once.
+    idempotency_key = models.CharField(max_length=64, unique=True)
+    # Marks what the job posts to GitLab (see job_marker).
+    marker_key = models.CharField(
+        max_length=64, default=new_marker_key, editable=False)
+    # Set when the item may already have been sent (by an earlier run of
+    # a requeued job, or before the job queue existed), so that the first
+    # attempt looks for it on GitLab before sending it.
+    maybe_sent = models.BooleanField(default=False)
+    status = models.CharField(
+        max_length=1, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    # Queued jobs are run once run_after has passed; running jobs whose 
+    # worker died are run again once locked_until has passed.
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'run_after'], 
+                name='gitlabjob_status_run_idx'),
+        ]
+
+    @classmethod
+    def enqueue(cls, kind, item):
+        """Queue the job for an approved item, unless it is already queued.
+        A job that failed or was cancelled (e.g., the item was rejected
+        before it ran, then approved again) is queued again from
+        scratch."""
+        job, created = cls.objects.get_or_create(
+            idempotency_key=f"{kind}-{item.pk}",
+            defaults={'kind': kind, 'object_id': item.pk})
+        if not created and job.status in (cls.FAILED, cls.CANCELLED):
+            cls.objects.filter(
+                pk=job.pk, status__in=[cls.FAILED, cls.CANCELLED]).update(
+                status=cls.QUEUED, attempts=0, last_error='', 
+                locked_until=None, run_after=timezone.now(),
+                maybe_sent=job.maybe_sent or job.attempts > 0)
+            job.refresh_from_db()
+        return job
 
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return self.idempotency_key
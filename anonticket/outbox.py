@@ -0,0 +1,229 @@
+"""Runs the GitLab jobs queued when issues, notes and account requests are
+approved (see GitlabJob in anonticket/models.py).
+
+Approving an item only saves a GitlabJob row, in the same transaction as
+the item. The process_gitlab_jobs command claims ready jobs, makes their
+GitLab calls in parallel, and records the outcome on both the job and the
+item's gitlab_status. Failed jobs are retried with exponential backoff up
+to GITLAB_JOB_MAX_ATTEMPTS times. Jobs are claimed with conditional
+UPDATEs, so several workers can share a SQLite or PostgreSQL database
+without a message broker."""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from gl_bot.breaker import GitlabCircuitOpen
+from gl_bot.fanout import is_gitlab_down
+from .models import (
+    Issue, Note, GitlabAccountRequest, GitlabJob, GitlabUsernameTaken)
+
+logger = logging.getLogger(__name__)
+
+# Issue title saved on notes whose issue could not be fetched.
+ISSUE_NOT_FOUND = '(issue not found)'
+
+# For each kind of job: the model of its item, the method that makes the
+# GitLab call, and the fields that method sets.
+JOB_KINDS = {
+    GitlabJob.ISSUE: (
+        Issue, 'approve_issue', ['posted_to_GitLab', 'gitlab_iid']),
+    GitlabJob.NOTE: (
+        Note, 'approve_note', ['posted_to_GitLab', 'gitlab_id']),
+    GitlabJob.ACCOUNT: (
+        GitlabAccountRequest, 'approve_request', ['approved_to_GitLab']),
+}
+
+def ready_jobs():
+    """Returns the jobs that can be run now: queued jobs whose run_after
+    has passed, and running jobs whose worker's lease has run out."""
+    now = timezone.now()
+    return GitlabJob.objects.filter(
+        Q(status=GitlabJob.QUEUED, run_after__lte=now) |
+        Q(status=GitlabJob.RUNNING, locked_until__lt=now))
+
+def claim_jobs(limit, pks=None):
+    """Claim up to limit ready jobs (out of pks, if given) for this worker
+    and return them. A job is only claimed if the UPDATE that marks it
+    running still finds it ready, so no two workers claim the same job."""
+    ready = ready_jobs()
+    if pks is not None:
+        ready = ready.filter(pk__in=pks)
+    pks = list(ready.order_by(
+        'run_after', 'pk').values_list('pk', flat=True)[:limit])
+    claimed = []
+    for pk in pks:
+        now = timezone.now()
+        if ready_jobs().filter(pk=pk).update(
+                status=GitlabJob.RUNNING,
+                locked_until=now + timedelta(seconds=settings.GITLAB_JOB_LEASE),
+                attempts=F('attempts') + 1,
+                updated_at=now):
+            claimed.append(pk)
+    return list(GitlabJob.objects.filter(pk__in=claimed).order_by('pk'))
+
+def finish(job, status, error=''):
+    """Record a job's final status."""
+    job.status = status
+    job.locked_until = None
+    job.last_error = error
+    job.save(update_fields=['status', 'locked_until', 'last_error', 'updated_at'])
+
+def retry_later(job, error, delay, count_attempt=True):
+    """Queue a job to be run again after delay seconds."""
+    job.status = GitlabJob.QUEUED
+    job.locked_until = None
+    job.last_error = error
+    job.run_after = timezone.now() + timedelta(seconds=delay)
+    fields = ['status', 'locked_until', 'last_error', 'run_after', 'updated_at']
+    if not count_attempt:
+        job.attempts -= 1
+        fields.append('attempts')
+    job.save(update_fields=fields)
+
+def backoff(attempts):
+    """Seconds to wait before the next attempt: GITLAB_JOB_RETRY_DELAY,
+    doubled after each failed attempt, and never more than an hour."""
+    return min(settings.GITLAB_JOB_RETRY_DELAY * 2 ** (attempts - 1), 3600)
+
+def run_job(job):
+    """Make a claimed job's GitLab call and record how it went."""
+    model, method, fields = JOB_KINDS[job.kind]
+    # The GitLab calls need the item's project.
+    item = model.objects.filter(pk=job.object_id).select_related().first()
+    if item is None:
+        return finish(job, GitlabJob.CANCELLED, "The item was deleted.")
+    if item.reviewer_status != 'A':
+        model.objects.filter(pk=item.pk).update(gitlab_status='')
+        return finish(job, GitlabJob.CANCELLED, "The item is no longer approved.")
+    if item.gitlab_status == 'S':
+        return finish(job, GitlabJob.DONE)
+    try:
+        getattr(item, method)(
+            job.marker_key, retry=job.attempts > 1 or job.maybe_sent)
+    except GitlabCircuitOpen as e:
+        # GitLab is known to be down, so nothing was sent; wait for the
+        # breaker's cool-down without using up an attempt.
+        return retry_later(
+            job, repr(e), settings.GITLAB_BREAKER_COOLDOWN, count_attempt=False)
+    except GitlabUsernameTaken as e:
+        # Retrying won't help; a moderator has to sort out the clash.
+        model.objects.filter(pk=item.pk).update(gitlab_status='F')
+        return finish(job, GitlabJob.FAILED, repr(e))
+    except Exception as e:
+        logger.warning("GitLab job %s failed.", job, exc_info=True)
+        if job.attempts >= settings.GITLAB_JOB_MAX_ATTEMPTS:
+            model.objects.filter(pk=item.pk).update(gitlab_status='F')
+            return finish(job, GitlabJob.FAILED, repr(e))
+        return retry_later(job, repr(e), backoff(job.attempts))
+    item.gitlab_status = 'S'
+    item.save(update_fields=fields + ['gitlab_status'])
+    finish(job, GitlabJob.DONE)
+
+def run_job_in_thread(job):
+    """Run a job in a worker thread, then close the thread's database
+    connection."""
+    try:
+        run_job(job)
+    except Exception:
+        # The job will be run again once its lease runs out.
+        logger.exception("Could not run GitLab job %s.", job)
+    finally:
+        connections.close_all()
+
+def process_jobs(limit=100, workers=None, pks=None):
+    """Claim up to limit ready jobs (out of pks, if given) and run them, up
+    to workers at a time (settings.GITLAB_JOB_WORKERS by default). Returns
+    the claimed jobs."""
+    if workers is None:
+        workers = settings.GITLAB_JOB_WORKERS
+    jobs = claim_jobs(limit, pks)
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            run_job(job)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run_job_in_thread, jobs))
+    return jobs
+
+def approve_items(kind, items):
+    """Approve a list of items of one kind and queue the GitLab jobs of
+    those not yet sent, in one transaction: the items are written with
+    bulk_update and the jobs with bulk_create, rather than one save() 
+    each. Failed jobs are queued again. Returns the queued jobs."""
+    model, method, fields = JOB_KINDS[kind]
+    to_send = []
+    for item in items:
+        item.reviewer_status = 'A'
+        # The first field is posted_to_GitLab or approved_to_GitLab.
+        if not getattr(item, fields[0]):
+            item.gitlab_status = 'Q'
+            to_send.append(item)
+    keys = [f"{kind}-{item.pk}" for item in to_send]
+    with transaction.atomic():
+        model.objects.bulk_update(items, ['reviewer_status', 'gitlab_status'])
+        GitlabJob.objects.bulk_create([
+            GitlabJob(kind=kind, object_id=item.pk, idempotency_key=key)
+            for item, key in zip(to_send, keys)
+        ], ignore_conflicts=True)
+        requeued = GitlabJob.objects.filter(
+            idempotency_key__in=keys, 
+            status__in=[GitlabJob.FAILED, GitlabJob.CANCELLED])
+        requeued.filter(attempts__gt=0).update(maybe_sent=True)
+        requeued.update(
+            status=GitlabJob.QUEUED, attempts=0, last_error='', 
+            run_after=timezone.now())
+    return list(GitlabJob.objects.filter(idempotency_key__in=keys))
+
+def requeue_failed():
+    """Queue every failed job again, with its attempts reset, along with
+    approved items that are marked as failed but have no job (e.g., items
+    approved before the job queue existed). Any of them may already have
+    been sent, so their jobs look for them first (see 
+    GitlabJob.maybe_sent). Returns the number queued."""
+    count = 0
+    for kind, (model, method, fields) in JOB_KINDS.items():
+        for item in model.objects.filter(reviewer_status='A', gitlab_status='F'):
+            job = GitlabJob.enqueue(kind, item)
+            GitlabJob.objects.filter(pk=job.pk).update(
+                status=GitlabJob.QUEUED, attempts=0, last_error='',
+                locked_until=None, run_after=timezone.now(), maybe_sent=True)
+            model.objects.filter(pk=item.pk).update(gitlab_status='Q')
+            count += 1
+    return count
+
+def resolve_issue_titles(limit=100):
+    """Fill in the issue titles of notes that were saved before their
+    issue was cached, fetching each issue once. Returns the number of
+    notes updated."""
+    issues = {}
+    for note in Note.objects.filter(gitlab_issue_title='').select_related(
+            'linked_project').order_by('pk')[:limit]:
+        issues.setdefault((note.linked_project_id, note.issue_iid), []).append(note)
+    count = 0
+    for notes in issues.values():
+        try:
+            title = notes[0].get_issue_title()
+        except Exception as error:
+            if is_gitlab_down(error):
+                # Try again next time.
+                continue
+            # E.g., the issue does not exist; don't look it up again.
+            logger.warning(
+                "Could not fetch the issue of note %s.", notes[0].pk, 
+                exc_info=True)
+            title = ISSUE_NOT_FOUND
+        count += Note.objects.filter(
+            pk__in=[note.pk for note in notes]).update(gitlab_issue_title=title)
+    return count
+
+def job_counts():
+    """Returns the number of jobs in each status, by status name."""
+    names = dict(GitlabJob.STATUS_CHOICES)
+    counts = {name.lower(): 0 for name in names.values()}
+    for row in GitlabJob.objects.values('status').annotate(count=Count('pk')):
+        counts[names[row['status']].lower()] = row['count']
+    return counts
@@ -0,0 +1,39 @@
+"""Keyset pagination for lists of issues and notes ordered by (created_at,
+pk). Each page is fetched by seeking past the last row of the previous
+page, so later pages cost the same as the first one, unlike an OFFSET."""
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+def encode_cursor(row):
+    """Returns the cursor that points just past row."""
+    return f"{row.created_at.isoformat()}_{row.pk}"
+
+def decode_cursor(cursor):
+    """Returns (created_at, pk) from a cursor, or None if it is not valid."""
+    try:
+        created_at, pk = cursor.rsplit('_', 1)
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (AttributeError, ValueError):
+        return None
+    if created_at is None:
+        return None
+    return created_at, pk
+
+def keyset_page(queryset, cursor, page_size):
+    """Returns (rows, next_cursor) for the page of queryset, which must be
+    ordered by ('created_at', 'pk'), that starts after cursor. A missing 
+    or invalid cursor gives the first page, and next_cursor is None on 
+    the last page."""
+    position = decode_cursor(cursor) if cursor else None
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+    # Fetch one extra row to find out if there is a next page.
+    rows = list(queryset[:page_size + 1])
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
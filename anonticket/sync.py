@@ -0,0 +1,51 @@
+"""Refreshes Project rows from GitLab in bulk: the projects are fetched
+from GitLab concurrently, and written back with one bulk_update, rather
+than with one save() (and one GitLab call after another) each."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.db import transaction
+from gl_bot.client import get_gitlab_client, PRIVATE
+from .models import Project
+
+def fetch_gitlab_projects(gitlab_ids, workers):
+    """Fetch GitLab projects, workers at a time. Returns a dictionary of
+    gitlab id to python-gitlab project, or to the exception raised when
+    fetching it."""
+    gl = get_gitlab_client(PRIVATE)
+    def fetch(gitlab_id):
+        try:
+            return gl.projects.get(gitlab_id)
+        except Exception as e:
+            return e
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        return dict(zip(gitlab_ids, executor.map(fetch, gitlab_ids)))
+
+def sync_projects(projects, workers):
+    """Refresh projects from GitLab. Returns the refreshed projects, a
+    dictionary of project to the error raised for each project that could
+    not be fetched, and the time taken by each step."""
+    timings = {}
+    projects = list(projects)
+    started = time.perf_counter()
+    fetched = fetch_gitlab_projects(
+        sorted({project.gitlab_id for project in projects}), workers)
+    timings['fetch'] = time.perf_counter() - started
+    started = time.perf_counter()
+    synced = [
+        project for project in projects
+        if not isinstance(fetched[project.gitlab_id], Exception)]
+    failed = {
+        project: fetched[project.gitlab_id] for project in projects
+        if isinstance(fetched[project.gitlab_id], Exception)}
+    # Slugs must stay unique, both against the projects that aren't being
+    # refreshed and within the batch.
+    taken_slugs = set(Project.objects.exclude(
+        pk__in=[project.pk for project in synced]).values_list('slug', flat=True))
+    for project in synced:
+        project.set_gitlab_details(fetched[project.gitlab_id], taken_slugs)
+        taken_slugs.add(project.slug)
+    with transaction.atomic():
+        Project.objects.bulk_update(synced, Project.GITLAB_FIELDS)
+    timings['write'] = time.perf_counter() - started
+    return synced, failed, timings
@@ -1,8 +1,8 @@
 from django.conf import settings
-from django.test import SimpleTestCase, Client, tag
+from django.test import SimpleTestCase, Client, tag, override_settings
 from test_plus.test import TestCase, CBVTestCase
 from django.urls import reverse, resolve
-from anonticket.models import UserIdentifier, Project, Issue, GitlabAccountRequest
+from anonticket.models import UserIdentifier, Project, Issue, Note, GitlabAccountRequest
 from django.contrib.auth.models import User, Group, Permission
 # from django.views.generic import TemplateView, DetailView, CreateView, UpdateView
 from anonticket.views import *
@@ -13,7 +13,28 @@ from anonticket.forms import (
     CreateIssueForm)
 import pprint
 pp = pprint.PrettyPrinter(indent=4)
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from io import StringIO
+from django.core.exceptions import ImproperlyConfigured
+import time
+import tempfile
+import subprocess
+import sys
+
+# Keep the rate limit counters and the GitLab circuit breaker in memory
+# during tests rather than in the RATELIMIT_DB and GITLAB_BREAKER_DB files.
+TEST_CACHES = {
+    **settings.CACHES,
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit-test',
+    },
+    'gitlab_breaker': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gitlab-breaker-test',
+    },
+}
 
 #--------------------------TESTING NOTES -----------------------------
 # LOCATIONS:
@@ -362,6 +383,7 @@ class TestIdentifierAndLoginViewsWithoutDatabase(SimpleTestCase):
         self.assertTemplateUsed(response, 'anonticket/user_login_error.html')
 
 @tag('id_with_db')
+@override_settings(CACHES=TEST_CACHES)
 class TestIdentifierAndLoginViewsWithDatabase(TestCase):
     """ Test the functions in views.py under the Identifier and Login
     views section that require database."""
@@ -402,7 +424,89 @@ class TestIdentifierAndLoginViewsWithDatabase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'anonticket/user_landing.html')
 
+@tag('id_with_db')
+class TestUserLandingViewQueries(TestCase):
+    """Test that the user landing page makes a fixed number of queries,
+    however many issues and notes the user has."""
+
+    def setUp(self):
+        """Set up two projects and a user with 20 issues and 20 notes, half
+        of each posted to GitLab. bulk_create skips the GitLab calls in
+        save()."""
+        Project.objects.bulk_create([
+            Project(gitlab_id=1, slug='project-one', name_with_namespace='Group / Project One'),
+            Project(gitlab_id=2, slug='project-two', name_with_namespace='Group / Project Two'),
+        ])
+        projects = list(Project.objects.all())
+        new_user = UserIdentifier.objects.create(
+            user_identifier = 'duo-atlas-hypnotism-curry-creatable-rubble'
+        )
+        Issue.objects.bulk_create([
+            Issue(
+                title=f'Issue {number}',
+                description='A description',
+                linked_project=projects[number % 2],
+                linked_user=new_user,
+                gitlab_iid=number if number % 2 else None,
+            ) for number in range(20)
+        ])
+        Note.objects.bulk_create([
+            Note(
+                body=f'Note {number}',
+                issue_iid=number,
+                gitlab_issue_title=f'Issue {number}',
+                linked_project=projects[number % 2],
+                linked_user=new_user,
+                gitlab_id=number if number % 2 else None,
+            ) for number in range(20)
+        ])
+        self.client=Client()
+        self.user_landing_url = reverse('user-landing', args=[new_user])
+
+    def test_user_landing_view_query_count(self):
+        """One query for the user, one for the issues (with their projects)
+        and one for the notes (with their projects)."""
+        with self.assertNumQueries(3):
+            response = self.client.get(self.user_landing_url)
+        self.assertEqual(response.status_code, 200)
+        results = response.context['results']
+        self.assertEqual(len(results['linked_issues']), 20)
+        self.assertEqual(len(results['linked_notes']), 20)
+        self.assertContains(response, 'Group / Project Two')
+        self.assertContains(
+            response, '/projects/project-two/issues/1/details/')
+
+    @override_settings(LANDING_PAGE_SIZE=8)
+    def test_user_landing_view_keyset_pages(self):
+        """Issues and notes are listed a page at a time, and following the
+        next links walks through all of them once, in order."""
+        seen_issues = []
+        url = self.user_landing_url
+        while url:
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            results = response.context['results']
+            self.assertLessEqual(len(results['linked_issues']), 8)
+            seen_issues += [
+                issue['attributes'].title for issue in results['linked_issues']]
+            url = results.get('next_issues_url')
+        self.assertEqual(seen_issues, [f'Issue {number}' for number in range(20)])
+        # The notes list stays on its first page while paging issues.
+        self.assertEqual(results['linked_notes'][0]['attributes'].body, 'Note 0')
+        self.assertIn('next_notes_url', results)
+        self.assertIn('first_page_url', results)
+
+    def test_user_landing_view_bad_cursor(self):
+        """An invalid cursor shows the first page."""
+        response = self.client.get(
+            self.user_landing_url, {'issues_after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context['results']['linked_issues'][0]['attributes'].title,
+            'Issue 0')
+
 @tag('project')
+@override_settings(CACHES=TEST_CACHES)
 class TestProjectViews(TestCase):
     """Test the project functions in views.py minus pagination."""
 
@@ -443,6 +547,7 @@ class TestProjectViews(TestCase):
         self.assertTemplateUsed(response, 'anonticket/project_detail.html')
 
 @tag('pagination')
+@override_settings(CACHES=TEST_CACHES)
 class TestProjectDetailViewPagination(TestCase):
     """Test the project functions in views.py relating to pagination."""
 
@@ -725,6 +830,7 @@ class TestProjectDetailViewPagination(TestCase):
             )
 
 @tag('issues')
+@override_settings(CACHES=TEST_CACHES)
 class TestIssuesViews(TestCase):
     """Test the issues functions in views.py"""
 
@@ -853,8 +959,10 @@ class TestIssuesViews(TestCase):
     def tearDown(self):
         """Clear Cache"""
         cache.clear()
+        caches['ratelimit'].clear()
 
 @tag('rate-limit-issue')
+@override_settings(CACHES=TEST_CACHES)
 class TestIssueRateLimit(TestCase):
     """Test the rate-limit function for create_new_issue_view."""
 
@@ -890,8 +998,10 @@ class TestIssueRateLimit(TestCase):
     def tearDown(self):
         """Clear Cache"""
         cache.clear()
+        caches['ratelimit'].clear()
 
 @tag('notes')
+@override_settings(CACHES=TEST_CACHES)
 class TestNotesViews(TestCase):
     """Test the notes functions in views.py."""
 
@@ -956,8 +1066,10 @@ class TestNotesViews(TestCase):
     def tearDown(self):
         """Clear Cache"""
         cache.clear()
+        caches['ratelimit'].clear()
 
 @tag('rate-limit-note')
+@override_settings(CACHES=TEST_CACHES)
 class TestNoteViewRateLimit(TestCase):
     """Test the ratelimiting for NoteCreateView."""
 
@@ -1001,8 +1113,10 @@ class TestNoteViewRateLimit(TestCase):
     def tearDown(self):
         """Clear Cache"""
         cache.clear()
+        caches['ratelimit'].clear()
 
 @tag('rate-limit-combined')
+@override_settings(CACHES=TEST_CACHES)
 class TestNoteIssueCombinedRateLimit(TestCase):
     """Test that COMBINED rate-limit bucket is working correctly"""
 
@@ -1072,8 +1186,10 @@ class TestNoteIssueCombinedRateLimit(TestCase):
     def tearDown(self):
         """Clear Cache"""
         cache.clear()
+        caches['ratelimit'].clear()
 
 @tag('gitlab')
+@override_settings(CACHES=TEST_CACHES)
 class TestGitlabAccountRequestViews(TestCase):
     """Test the views associated with user-created Gitlab
     account requests."""
@@ -1290,6 +1406,7 @@ class TestGitlabAccountRequestViews(TestCase):
         self.assertEqual(len(try_to_get_new_request), 0)
 
 @tag('gitlab-rate-limit')
+@override_settings(CACHES=TEST_CACHES)
 class TestGitlabAccountRateLimitNoUser(TestCase):
     """Test that rate-limiting is working properly as applied to
     GitLab User Account Requests."""
@@ -1326,6 +1443,188 @@ class TestGitlabAccountRateLimitNoUser(TestCase):
     def tearDown(self):
         """Clear Cache"""
         cache.clear()
+        caches['ratelimit'].clear()
+
+@tag('rate-limit-counters')
+class TestSQLiteCounterCache(SimpleTestCase):
+    """Test the shared counter cache used for rate-limiting."""
+
+    def setUp(self):
+        from shared.counters import SQLiteCounterCache
+        self.directory = tempfile.TemporaryDirectory()
+        location = self.directory.name + '/counters.sqlite3'
+        self.counters = SQLiteCounterCache(location, {})
+        # The benchmark's processes share a counters file in the temporary
+        # directory, rather than the RATELIMIT_DB one.
+        self.caches = override_settings(CACHES={
+            **TEST_CACHES,
+            'ratelimit': {
+                'BACKEND': 'shared.counters.SQLiteCounterCache',
+                'LOCATION': self.directory.name + '/ratelimit.sqlite3',
+            },
+        })
+        self.caches.enable()
+
+    def test_add_and_incr(self):
+        """add only sets missing or expired keys, and incr counts up."""
+        self.assertTrue(self.counters.add('ip', 1, 60))
+        self.assertFalse(self.counters.add('ip', 5, 60))
+        self.assertEqual(self.counters.incr('ip'), 2)
+        self.assertEqual(self.counters.get('ip'), 2)
+        with self.assertRaises(ValueError):
+            self.counters.incr('missing')
+        with self.assertRaises(TypeError):
+            self.counters.set('ip', 'not a number')
+
+    def test_expired_keys(self):
+        """Expired keys are missing, and can be added again."""
+        self.counters.set('ip', 3, 0)
+        self.assertIsNone(self.counters.get('ip'))
+        self.assertTrue(self.counters.add('ip', 1, 60))
+        self.assertEqual(self.counters.get('ip'), 1)
+
+    def test_limit_holds_across_processes(self):
+        """Processes checking the same client share one counter."""
+        output = StringIO()
+        call_command(
+            'benchmark_ratelimit', processes=2, checks=60, limit=50,
+            stdout=output)
+        self.assertIn('Allowed 50 requests', output.getvalue())
+
+    def test_windows_match_generic_caches(self):
+        """Sliding windows count the same in SQLite as in other caches."""
+        from shared.ratelimits import hit_windows
+        hits = [('ip', 10, 1.0, 2, time.time() + 60)]
+        later = [('ip', 11, 0.5, 2, time.time() + 60)]
+        for counters in (self.counters, cache):
+            results = [hit_windows(counters, hits)[0] for i in range(3)]
+            # Half of the previous window's two hits still count.
+            results += [hit_windows(counters, later)[0] for i in range(2)]
+            self.assertEqual(results, [True, True, False, True, False])
+
+    def test_windows_zero_limit(self):
+        """A window with a limit of 0 turns down even its first hit, and
+        isn't counted by it."""
+        hits = [('blocked', 10, 1.0, 0, time.time() + 60), 
+            ('open', 10, 1.0, 1, time.time() + 60)]
+        self.assertEqual(self.counters.hit_windows(hits), [False, True])
+        self.assertEqual(self.counters.hit_windows(hits), [False, False])
+        self.assertEqual(self.counters.execute(
+            "SELECT current FROM windows ORDER BY key", ()).fetchall(), 
+            [(0,), (1,)])
+
+    def tearDown(self):
+        self.caches.disable()
+        self.directory.cleanup()
+        cache.clear()
+
+@tag('rate-limit-routes')
+@override_settings(
+    CACHES=TEST_CACHES, MAIN_RATE_GROUP='test-routes', 
+    RATELIMIT_RATES={'create-note': {'post': '1/h'}})
+class TestRateLimitRoutes(SimpleTestCase):
+    """Test checking several keys at once with per-route rates."""
+
+    def setUp(self):
+        from django.test import RequestFactory
+        self.factory = RequestFactory()
+        self.kwargs = {'user_identifier': 'duo-atlas-hypnotism-curry-creatable-rubble'}
+
+    def test_parse_rate(self):
+        from shared.ratelimits import parse_rate
+        self.assertEqual(parse_rate('100/m'), (100, 60))
+        self.assertEqual(parse_rate('5/10m'), (5, 600))
+        with self.assertRaises(ImproperlyConfigured):
+            parse_rate('None')
+
+    def test_same_post_limited_by_route(self):
+        """The same post is limited by the route's rate for 'post', while
+        other posts still get LIMIT_RATE."""
+        from shared.ratelimits import is_limited
+        post = self.factory.post('/', {'body': 'Same note.'})
+        other = self.factory.post('/', {'body': 'Another note.'})
+        self.assertFalse(is_limited(post, 'create-note', self.kwargs))
+        self.assertTrue(is_limited(post, 'create-note', self.kwargs))
+        self.assertFalse(is_limited(other, 'create-note', self.kwargs))
+        self.assertFalse(is_limited(post, 'create-issue', self.kwargs))
+
+    @override_settings(RATELIMIT_POST_PREFIX=10)
+    def test_post_fingerprint(self):
+        """Posts are fingerprinted by user, length and a capped prefix,
+        and the time taken is recorded."""
+        from shared.ratelimits import (
+            post_key, reset_stats, is_limited, ratelimit_stats)
+        def key(body, user=self.kwargs['user_identifier']):
+            request = self.factory.post('/', {'body': body})
+            return post_key(request, {'user_identifier': user})
+        long_body = 'a' * 100000
+        self.assertEqual(key(long_body), key(long_body[:-1] + 'b'))
+        self.assertNotEqual(key(long_body), key(long_body[:-1]))
+        self.assertNotEqual(key(long_body), key(long_body, 'another-user'))
+        reset_stats()
+        is_limited(self.factory.post('/', {'body': long_body}), 'create-note', self.kwargs)
+        stats = ratelimit_stats()
+        self.assertEqual(stats['checks'], 1)
+        self.assertGreater(stats['fingerprint_us'], 0)
+
+    @override_settings(BLOCK_ALL=True)
+    def test_block_all(self):
+        from shared.ratelimits import is_limited
+        post = self.factory.post('/', {'body': 'A note.'})
+        self.assertTrue(is_limited(post, 'create-note', self.kwargs))
+
+    def tearDown(self):
+        caches['ratelimit'].clear()
+
+@tag('markdown')
+class TestMarkdownRendering(TestCase):
+    """Test rendering markdown once, on save or through the cache."""
+
+    def setUp(self):
+        from shared.rendering import reset_render_cache
+        reset_render_cache()
+        Project.objects.bulk_create([Project(
+            gitlab_id=1, slug='fake-project', name='Fake Project', 
+            name_with_namespace='Fakes / Fake Project')])
+        self.project = Project.objects.get(gitlab_id=1)
+        self.user = UserIdentifier.objects.create(
+            user_identifier='duo-atlas-hypnotism-curry-creatable-rubble')
+
+    def test_rendered_on_save(self):
+        """Issues and notes keep their sanitized HTML."""
+        issue = Issue.objects.create(
+            title='An issue', linked_project=self.project, 
+            linked_user=self.user,
+            description='a **bold** issue <script>alert(1)</script>')
+        self.assertIn('<strong>bold</strong>', issue.description_html)
+        self.assertTrue(issue.description_html.startswith('A '))
+        self.assertNotIn('<script>', issue.description_html)
+        note = Note(
+            body='A *note*.', linked_project=self.project, 
+            linked_user=self.user, issue_iid=1, 
+            gitlab_issue_title='An issue')
+        note.save()
+        self.assertEqual(note.body_html, 'A <em>note</em>.')
+        url = reverse('pending-note', args=[
+            self.user.user_identifier, self.project.slug, 1, note.pk])
+        self.assertContains(self.client.get(url), '<em>note</em>')
+
+    def test_render_cache(self):
+        """The same text is only rendered once."""
+        from shared.rendering import render_markdown, render_stats
+        first = render_markdown('Some *markdown*.')
+        second = render_markdown('Some *markdown*.')
+        self.assertEqual(first, second)
+        stats = render_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    @override_settings(MARKDOWN_CACHE_SIZE=2)
+    def test_render_cache_bounded(self):
+        from shared.rendering import render_markdown, get_render_cache
+        for text in ('one', 'two', 'three'):
+            render_markdown(text)
+        self.assertEqual(len(get_render_cache()), 2)
 
 @tag('other_with_db')
 class TestViewsOtherWithDatabase(TestCase):
@@ -1347,6 +1646,62 @@ class TestViewsOtherWithDatabase(TestCase):
         test_known_bad_user = user_identifier_in_database(known_bad_user)
         self.assertEqual(test_known_bad_user, False)
 
+    def test_user_identifier_packed_on_save(self):
+        """Test that saving a user identifier stores it packed, and that
+        lookups by the packed identifier find it."""
+        from anonticket.wordlist import pack_identifier, unpack_identifier
+        packed = bytes(self.new_user.packed_identifier)
+        self.assertEqual(len(packed), 10)
+        self.assertEqual(packed, pack_identifier(self.new_user.user_identifier))
+        self.assertEqual(unpack_identifier(packed), self.new_user.user_identifier)
+        self.assertEqual(
+            get_user_as_object(self.new_user.user_identifier.upper()), 
+            self.new_user)
+
+    def test_project_unique_slug(self):
+        """Test that a project whose name is already used as a slug gets
+        its gitlab id added to its slug."""
+        Project.objects.bulk_create([Project(gitlab_id=1, slug='tor')])
+        new_project = Project(gitlab_id=2)
+        self.assertEqual(new_project.unique_slug('tor'), 'tor-2')
+        self.assertEqual(new_project.unique_slug('arti'), 'arti')
+
+    def test_pack_identifier_invalid(self):
+        """Test that identifiers that are not wordlist words can't be packed."""
+        from anonticket.wordlist import pack_identifier
+        self.assertIsNone(pack_identifier('test-test-test-test-test-test'))
+        self.assertIsNone(pack_identifier('duo-atlas-hypnotism'))
+        invalid_user = UserIdentifier.objects.create(user_identifier='not-valid')
+        self.assertIsNone(invalid_user.packed_identifier)
+        self.assertTrue(user_identifier_in_database('not-valid'))
+
+@tag('lookup-benchmark')
+class TestBenchmarkLookups(SimpleTestCase):
+    """Smoke test the benchmark_lookups command. It creates and destroys
+    its own scratch database, so it runs in another process rather than
+    against the test database."""
+
+    def run_benchmark(self, *arguments):
+        return subprocess.run(
+            [sys.executable, 'manage.py', 'benchmark_lookups', '--issues', '200',
+                '--users', '20', '--repeat', '1', *arguments],
+            cwd=settings.BASE_DIR, capture_output=True, text=True)
+
+    def test_benchmark(self):
+        result = self.run_benchmark()
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('Created 200 issues', result.stdout)
+        self.assertIn('issue_status_created_idx', result.stdout)
+
+    def test_benchmark_before(self):
+        """--before undoes migration 0007 only, so the lookups run without
+        its indexes on the current schema."""
+        result = self.run_benchmark('--before')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('Created 200 issues', result.stdout)
+        self.assertNotIn('_created_idx', result.stdout)
+        self.assertNotIn('name_with_namespace', result.stdout)
+
 @tag('other_no_db')
 class TestViewsOtherWithoutDatabase(SimpleTestCase):
     """Test the functions in views.py not directly related to one of the above
@@ -1360,6 +1715,35 @@ class TestViewsOtherWithoutDatabase(SimpleTestCase):
         test_wordlist = get_wordlist()
         self.assertEqual(known_wordlist, test_wordlist)
 
+    def test_get_parsed_wordlist(self):
+        """Test that the parsed wordlist matches the file, and that words
+        can be found in it and mapped to their positions."""
+        word_list_path = settings.WORD_LIST_PATH
+        with open(word_list_path) as f:
+            known_wordlist = f.read().splitlines()
+        wordlist = get_parsed_wordlist()
+        self.assertEqual(wordlist.words, known_wordlist)
+        self.assertIsInstance(wordlist.word_set, frozenset)
+        self.assertIn('abacus', wordlist)
+        self.assertNotIn('notaword', wordlist)
+        self.assertEqual(wordlist.index[known_wordlist[-1]], len(known_wordlist) - 1)
+        self.assertTrue(wordlist.contains_all(known_wordlist[:6]))
+        self.assertFalse(wordlist.contains_all(['abacus', 'notaword']))
+
+    def test_get_wordlist_memoized(self):
+        """Test that the wordlist is only read once, and read again when
+        WORD_LIST_PATH changes."""
+        import tempfile, os
+        self.assertIs(get_wordlist(), get_wordlist())
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('alpha\nbeta\n')
+        try:
+            with self.settings(WORD_LIST_PATH=f.name):
+                self.assertEqual(get_wordlist(), ['alpha', 'beta'])
+        finally:
+            os.remove(f.name)
+        self.assertEqual(len(get_wordlist()), 7603)
+
     def test_generate_user_identifier_list(self):
         """Test the generate_user_identifier_list function from CreateIdentifierView."""
         word_list = get_wordlist()
@@ -1494,6 +1878,7 @@ class TestLoginFormAttributes(SimpleTestCase):
         self.assertEqual(result, 'duo-atlas-hypnotism-curry-creatable-rubble')
 
 @tag('search_form')
+@override_settings(CACHES=TEST_CACHES)
 class TestAnonymousTicketProjectSearchForm(TestCase):
     """Test the Anonymous_Ticket_Project_Search_Form"""
 
@@ -1520,6 +1905,7 @@ class TestAnonymousTicketProjectSearchForm(TestCase):
         self.assertEquals(len(form.errors), 2)
 
 @tag('create_issue_form')
+@override_settings(CACHES=TEST_CACHES)
 class TestCreateIssueForm(TestCase):
     """Test the CreateIssueForm"""
 
@@ -1558,6 +1944,7 @@ class TestCreateIssueForm(TestCase):
 # ----------------------------------------------------------------------
 
 @tag('moderators')
+@override_settings(CACHES=TEST_CACHES)
 class TestModeratorViews(TestCase):
     """Test the Views associated with Moderators."""
 
@@ -1844,6 +2231,122 @@ class TestModeratorViews(TestCase):
         self.assertEqual(
             updated_issue.description, "An updated issue description")
 
+@tag('moderators')
+@override_settings(MODERATOR_PAGE_SIZE=5)
+class TestModeratorQueue(TestCase):
+    """Test that the moderator queue is paged, loads related rows in the
+    same query and accepts at most one page of forms per POST."""
+
+    def setUp(self):
+        """Set up a superuser, a project, a user, and pending issues,
+        notes and account requests. bulk_create skips the GitLab calls in
+        save()."""
+        self.Moderator = User.objects.create(
+            username='Moderator',
+            password='IAmATestPassword',
+            is_staff=True,
+            is_superuser=True,
+        )
+        self.client.force_login(self.Moderator)
+        Project.objects.bulk_create([
+            Project(gitlab_id=1, slug='project-one', name_with_namespace='Group / Project One'),
+        ])
+        self.project = Project.objects.get()
+        self.new_user = UserIdentifier.objects.create(
+            user_identifier = 'duo-atlas-hypnotism-curry-creatable-rubble'
+        )
+
+    def add_pending(self, count):
+        """Add count pending issues, notes and account requests."""
+        start = Issue.objects.count()
+        Issue.objects.bulk_create([
+            Issue(
+                title=f'Issue {number}',
+                description='A description',
+                linked_project=self.project,
+                linked_user=self.new_user,
+            ) for number in range(start, start + count)
+        ])
+        Note.objects.bulk_create([
+            Note(
+                body=f'Note {number}',
+                issue_iid=number,
+                gitlab_issue_title=f'Issue {number}',
+                linked_project=self.project,
+                linked_user=self.new_user,
+            ) for number in range(start, start + count)
+        ])
+        GitlabAccountRequest.objects.bulk_create([
+            GitlabAccountRequest(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+                reason='A reason',
+                linked_user=self.new_user,
+            ) for number in range(start, start + count)
+        ])
+
+    def count_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_moderator_view_query_count(self):
+        """The number of queries does not grow with the number of pending
+        items or rows shown."""
+        url = reverse('moderator')
+        self.add_pending(2)
+        few, response = self.count_queries(url)
+        self.assertEqual(len(response.context['issue_formset'].forms), 2)
+        self.add_pending(10)
+        many, response = self.count_queries(url)
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.context['issue_formset'].forms), 5)
+        self.assertEqual(len(response.context['gitlab_formset'].forms), 5)
+        self.assertContains(response, 'Group / Project One')
+        self.assertContains(response, 'Page 1 of 3')
+
+    def test_moderator_view_pages(self):
+        """Each table is paged on its own, oldest first."""
+        self.add_pending(7)
+        url = reverse('moderator')
+        response = self.client.get(url, {'issue_page': 2})
+        issues = [form.instance.title for form in response.context['issue_formset']]
+        notes = [form.instance.body for form in response.context['note_formset']]
+        self.assertEqual(issues, ['Issue 5', 'Issue 6'])
+        self.assertEqual(notes[0], 'Note 0')
+        self.assertContains(response, 'href="?issue_page=1"')
+        self.assertContains(response, 'href="?issue_page=2&amp;note_page=2"')
+
+    def test_moderator_view_POST_bounded(self):
+        """A POST is read up to the page size, however many forms it
+        claims to have, and redirects back to the same page."""
+        self.add_pending(7)
+        issues = list(Issue.objects.order_by('pk'))
+        form_data = {
+            'issue_formset-TOTAL_FORMS': 7,
+            'issue_formset-INITIAL_FORMS': 7,
+            'issue_formset-MIN_NUM_FORMS': 0,
+            'issue_formset-MAX_NUM_FORMS': 1000,
+        }
+        for prefix in ['note_formset', 'gitlab_formset']:
+            form_data.update({
+                f'{prefix}-TOTAL_FORMS': 0,
+                f'{prefix}-INITIAL_FORMS': 0,
+            })
+        for number, issue in enumerate(issues):
+            form_data[f'issue_formset-{number}-id'] = issue.pk
+            form_data[f'issue_formset-{number}-reviewer_status'] = 'R'
+        url = reverse('moderator') + '?issue_page=1'
+        response = self.client.post(url, form_data)
+        self.assertRedirects(response, url)
+        self.assertEqual(
+            Issue.objects.filter(reviewer_status='R').count(), 5)
+        self.assertEqual(
+            Issue.objects.filter(reviewer_status='P').count(), 2)
+
 # ---------------------7.0-----OTHER TESTS------------------------------
 # Tests for filters, custom template tags, etc.
 # ----------------------------------------------------------------------
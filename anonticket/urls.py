@@ -99,4 +99,7 @@ urlpatterns = [
         'moderator/update-gitlab-account-request/<int:pk>', 
         views.ModeratorGitlabAccountRequestUpdateView.as_view(), 
         name='mod-update-gitlab-account-request'),
+    path(
+        'moderator/gitlab-status/', 
+        views.gitlab_status_view, name='mod-gitlab-status'),
 ]
\ No newline at end of file
@@ -1,15 +1,19 @@
 from __future__ import absolute_import
-import gitlab
 import functools
 from django.conf import settings
 from anonticket.models import (
     UserIdentifier, Project, Issue, Note, GitlabAccountRequest)
+from anonticket.wordlist import get_parsed_wordlist
+from anonticket.pagination import keyset_page
+from anonticket.outbox import job_counts
 from .forms import (
     Anonymous_Ticket_Project_Search_Form, 
     LoginForm,
     CreateIssueForm,
     )
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse
+from django.utils.http import urlencode
 from django.urls import reverse, reverse_lazy
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils.decorators import method_decorator
@@ -18,13 +22,21 @@ from django.views.generic import (
     TemplateView, DetailView, ListView, CreateView, FormView, UpdateView)
 from django.contrib.admin.views.decorators import staff_member_required
 # Imported for Django-Ratelimeit
-from ratelimit.decorators import ratelimit
 from functools import wraps
 from ratelimit import UNSAFE
 from ratelimit.exceptions import Ratelimited
-from ratelimit.core import is_ratelimited
-# Import needed for fail-gracefully on Gitlab Timeout
-from requests.exceptions import ConnectTimeout, ConnectionError
+from shared.ratelimits import is_limited, ratelimit_stats
+from shared.rendering import render_stats
+# Shared, pooled python-gitlab clients
+from gl_bot.client import get_gitlab_client, pool_stats, PUBLIC, PRIVATE
+# Parallel GitLab calls with a shared deadline
+from gl_bot.fanout import fan_out, is_gitlab_down
+# Issue pages with totals read from the same response
+from gl_bot.pagination import list_issues_page
+# TTL cache for read-only GitLab data
+from gl_bot.cache import lookup, cache_stats, CachedObject
+# Circuit breaker around all GitLab calls
+from gl_bot.breaker import breaker_state
 
 # TABLE OF CONTENTS PENDING #
 
@@ -33,42 +45,48 @@ from requests.exceptions import ConnectTimeout, ConnectionError
 # with the exception of gitlab functions, which are below.
 # ----------------------------------------------------------------------
 
-# Set WORD_LIST_CONTENT as global variable with value of None.
-WORD_LIST_CONTENT = None
-
 def get_wordlist():
-    """Returns the wordlist. If wordlist_as_list is not already in memory,
-    fetches the wordlist from file and creates it."""
-    global WORD_LIST_CONTENT
-    if WORD_LIST_CONTENT is None:
-        word_list_path = settings.WORD_LIST_PATH
-        with open(word_list_path) as f:
-            wordlist_as_list = f.read().splitlines()
-    return wordlist_as_list  
+    """Returns the wordlist as a list. The list is read from file once 
+    (see anonticket/wordlist.py) and shared, so it must not be modified."""
+    return get_parsed_wordlist().words
 
 def user_identifier_in_database(find_user):
     """See if user_identifier is in database. Returns True/False."""
     # Try to find the user in the database.
     try:
-        user_to_find = UserIdentifier.objects.get(user_identifier=find_user)
-        user_found = True
+        user_found = UserIdentifier.objects.identified_by(find_user).exists()
     except:
         user_found = False
     return user_found
 
 def get_user_as_object(find_user):
     """Gets the User Identifier from the database. Should only be used if User Identifier exists."""
-    user_to_find = UserIdentifier.objects.get(user_identifier=find_user)
+    user_to_find = UserIdentifier.objects.identified_by(find_user).get()
     return user_to_find
 
 def get_linked_issues(UserIdentifier):
-    """Gets a list of the issues assigned to a User Identifier."""
-    linked_issues = Issue.objects.filter(linked_user=UserIdentifier)
+    """Gets a list of the issues assigned to a User Identifier, oldest 
+    first, fetching each issue's project in the same query. Only the 
+    columns shown on the landing page are loaded."""
+    linked_issues = Issue.objects.filter(
+        linked_user=UserIdentifier
+    ).select_related('linked_project').only(
+        'title', 'gitlab_iid', 'reviewer_status', 'created_at', 
+        'linked_project__slug', 'linked_project__name_with_namespace',
+    ).order_by('created_at', 'pk')
     return linked_issues
 
 def get_linked_notes(UserIdentifier):
-    """Gets a list of the notes assigned to a User Identifier."""
-    linked_notes = Note.objects.filter(linked_user=UserIdentifier)
+    """Gets a list of the notes assigned to a User Identifier, oldest 
+    first, fetching each note's project in the same query. Only the 
+    columns shown on the landing page are loaded."""
+    linked_notes = Note.objects.filter(
+        linked_user=UserIdentifier
+    ).select_related('linked_project').only(
+        'body', 'issue_iid', 'gitlab_id', 'gitlab_issue_title', 
+        'reviewer_status', 'created_at', 
+        'linked_project__slug', 'linked_project__name_with_namespace',
+    ).order_by('created_at', 'pk')
     return linked_notes
 
 def check_user(user_identifier):
@@ -81,11 +99,10 @@ def check_user(user_identifier):
     set_id_to_test = set(id_to_test)
     if len(set_id_to_test) != len(id_to_test):
         return False
-    # Grab the word_list from the path specified in settings.py
-    wordlist_as_list = get_wordlist()
-    # Check that all words are in the dictionary.
-    check_all_words = all(item in wordlist_as_list for item in id_to_test)
-    if check_all_words == False:
+    # Check that all words are in the wordlist, which is parsed once and
+    # kept in memory as a frozenset.
+    wordlist = get_parsed_wordlist()
+    if wordlist.contains_all(id_to_test) == False:
         return False
     else:
         return True
@@ -119,97 +136,31 @@ class PassUserIdentifierMixin:
         return context
 
 # --------------------RATE-LIMITING SETTINGS----------------------------
-# Set variables here so that django-ratelimit settings can be 
-# changed across multiple views.
+# Set variables here so that rate-limiting settings can be changed 
+# across multiple views.
 # ----------------------------------------------------------------------
 
-# All items (groups/issues) currently share from same rate-limiting
-# bucket, which is set by RATE_GROUP. You can change this by using a 
-# different group name in the decorator or by not including a group name 
-# with requests. The custom decorators below allow rate-limiting by 
-# IP and by key:post with Tor preferred settings applied.
-
-RATE_GROUP = settings.MAIN_RATE_GROUP
-BLOCK_ALL = settings.BLOCK_ALL
-
-def custom_ratelimit_ip(
-    group=RATE_GROUP, 
-    key='ip', 
-    rate=None,  
-    method=ratelimit.UNSAFE, 
-    block=True, 
-    block_all = BLOCK_ALL,
-    ):
-    """Custom version of the @ratelimit decorator based on key='ip' and 
-    callable rate function."""
-
-    __all__ = ['ratelimit']
-    ratelimit.UNSAFE = UNSAFE
-
-    def get_rate_limit(group, request, block_all=False):
-        """Callable function to get rate limit to make testing easier."""
-        if block_all == True:
-            return '0/s'
-        else:
-            return settings.LIMIT_RATE
+# Each decorated view is limited by IP, by the data posted and by user
+# identifier at once (see shared/ratelimits.py), with the rates set for
+# its route in settings.RATELIMIT_RATES, or settings.LIMIT_RATE. All 
+# views currently share the same counters, in the group set by 
+# settings.MAIN_RATE_GROUP. If settings.BLOCK_ALL is True, every request
+# is blocked.
 
-    def decorator(fn):
-        @wraps(fn)
-        def _wrapped(request, *args, **kw):
-            old_limited = getattr(request, 'limited', False)
-            ratelimited = is_ratelimited(
-                request=request, 
-                group=group, 
-                fn=fn,
-                key=key, 
-                rate=get_rate_limit(
-                    group=group, request=request, block_all=block_all), 
-                method=method,
-                increment=True)
-            request.limited = ratelimited or old_limited
-            if ratelimited and block:
-                raise Ratelimited()
-            return fn(request, *args, **kw)
-        return _wrapped
-    return decorator
-
-def custom_ratelimit_post(
-    group=RATE_GROUP, 
-    key='post:', 
-    rate=None,  
-    method=ratelimit.UNSAFE, 
-    block=True, 
-    block_all = BLOCK_ALL,
-    ):
-    """Custom version of the @ratelimit decorator with key='post' and
-    callable rate function."""
-
-    __all__ = ['ratelimit']
-    ratelimit.UNSAFE = UNSAFE
-
-    def get_rate_limit(group, request, block_all=False):
-        """Callable function to get rate limit to make testing easier."""
-        if block_all == True:
-            return '0/s'
-        else:
-            return settings.LIMIT_RATE
+def custom_ratelimit(route, method=UNSAFE, block=True):
+    """Rate-limit a view, whose rates are set under route in
+    settings.RATELIMIT_RATES, checking all of its keys in one cache 
+    operation."""
 
     def decorator(fn):
         @wraps(fn)
         def _wrapped(request, *args, **kw):
-            old_limited = getattr(request, 'limited', False)
-            ratelimited = is_ratelimited(
-                request=request, 
-                group=group, 
-                fn=fn,
-                key=key, 
-                rate=get_rate_limit(
-                    group=group, request=request, block_all=block_all), 
-                method=method,
-                increment=True)
-            request.limited = ratelimited or old_limited
-            if ratelimited and block:
-                raise Ratelimited()
+            if request.method in method:
+                old_limited = getattr(request, 'limited', False)
+                ratelimited = is_limited(request, route, kw)
+                request.limited = ratelimited or old_limited
+                if ratelimited and block:
+                    raise Ratelimited()
             return fn(request, *args, **kw)
         return _wrapped
     return decorator
@@ -224,48 +175,112 @@ def custom_ratelimit_post(
 #     GitlabDownNote
 #     )
 
-def gitlab_get_project(project, public=False):
+def gitlab_get_project(project, public=False, lazy=False):
     """Takes an integer, and grabs a gitlab project where gitlab_id
-    matches the integer."""
-    from gl_bot.gitlabdown import GitlabDownObject
-    # Pull timeout value from settings
-    timeout = settings.GITLAB_TIMEOUT
-    # if testing = true, swap URLs
-    gitlab_url = settings.GITLAB_URL
-    # If public == True, create without token.
+    matches the integer. If lazy is True, no API call is made; the
+    returned project can only be used to reach its child endpoints
+    (issues, notes, etc.)."""
+    # If public == True, use the shared client without a token.
     if public == True:
-        gl = gitlab.Gitlab(gitlab_url, timeout=timeout)
+        gl = get_gitlab_client(PUBLIC)
     else:
-        gl = gitlab.Gitlab(
-            gitlab_url, 
-            private_token = settings.GITLAB_SECRET_TOKEN, 
-            timeout=timeout)
+        gl = get_gitlab_client(PRIVATE)
     # Try to get project, if fails, swap to GitlabDownObject.
     try:
-        working_project = gl.projects.get(project)
-    except (ConnectTimeout, ConnectionError):
+        working_project = gl.projects.get(project, lazy=lazy)
+    except Exception as error:
+        if not is_gitlab_down(error):
+            raise
         from gl_bot.gitlabdown import GitlabDownObject
         gl = GitlabDownObject()
         working_project = gl.projects.get(project)
     return working_project
     
-def gitlab_get_issue(project, issue, public=False):
-    """Takes two integers and grabs corresponding gitlab issue."""
-    working_project = gitlab_get_project(project, public=public)
-    try:
-        working_issue = working_project.issues.get(issue)
-    except (ConnectTimeout, ConnectionError):
-        from gl_bot.gitlabdown import GitlabDownObject
-        gl = GitLabDownObject()
-        project = gl.projects.get(project)
-        working_issue = project.issues.get(issue)
-    return working_issue
-
-def gitlab_get_notes_list(project, issue, public=False):
-    """Grabs the notes list for a specific issue."""
-    working_issue = gitlab_get_issue(project, issue, public=public)
-    notes_list = working_issue.notes.list()
-    return notes_list
+# The functions below return cached copies of GitLab data (see 
+# gl_bot/cache.py) as CachedObjects, which can be used like the 
+# python-gitlab objects they were built from. Each returns a tuple of the 
+# data and saved_at: if GitLab is down (or snapshot_only is True), the 
+# last known good copy is returned with the datetime it was saved, or 
+# None if there is no copy, in which case views use the GitlabDown mocks.
+
+def gitlab_cached_project(project, snapshot_only=False):
+    """Returns a cached copy of a gitlab project, fetched with a public call."""
+    def fetch():
+        gl = get_gitlab_client(PUBLIC)
+        return gl.projects.get(project).attributes
+    attributes, saved_at = lookup(
+        'project', {'project': project}, fetch, snapshot_only=snapshot_only)
+    if attributes is None:
+        return None, None
+    return CachedObject(attributes), saved_at
+
+def gitlab_cached_issues_page(project, issue_state, page, snapshot_only=False):
+    """Returns a cached copy of one page of a project's issues, along with
+    the issue totals, fetched with a public call."""
+    def fetch():
+        gl = get_gitlab_client(PUBLIC)
+        gl_project = gl.projects.get(project, lazy=True)
+        issues_page = list_issues_page(gl_project, issue_state, page)
+        issues_page['issues'] = [
+            issue.attributes for issue in issues_page['issues']]
+        return issues_page
+    issues_page, saved_at = lookup(
+        'issue_list', 
+        {'project': project, 'state': issue_state, 'page': page},
+        fetch, snapshot_only=snapshot_only)
+    if issues_page is None:
+        return None, None
+    return {
+        'issues': [CachedObject(issue) for issue in issues_page['issues']],
+        'total': issues_page['total'],
+        'total_pages': issues_page['total_pages'],
+    }, saved_at
+
+def gitlab_cached_issue(project, issue, snapshot_only=False):
+    """Returns a cached copy of a gitlab issue."""
+    def fetch():
+        gl = get_gitlab_client(PRIVATE)
+        gl_project = gl.projects.get(project, lazy=True)
+        return gl_project.issues.get(issue).attributes
+    attributes, saved_at = lookup(
+        'issue', {'project': project, 'issue': issue}, fetch, 
+        snapshot_only=snapshot_only)
+    if attributes is None:
+        return None, None
+    return CachedObject(attributes), saved_at
+
+def gitlab_cached_notes_list(project, issue, snapshot_only=False):
+    """Returns a cached copy of the notes list for a gitlab issue."""
+    def fetch():
+        gl = get_gitlab_client(PRIVATE)
+        gl_project = gl.projects.get(project, lazy=True)
+        gl_issue = gl_project.issues.get(issue, lazy=True)
+        return [note.attributes for note in gl_issue.notes.list()]
+    notes_list, saved_at = lookup(
+        'notes', {'project': project, 'issue': issue}, fetch, 
+        snapshot_only=snapshot_only)
+    if notes_list is None:
+        return None, None
+    return [CachedObject(note) for note in notes_list], saved_at
+
+def oldest_saved_at(*saved_ats):
+    """Returns the oldest of several saved_at values, ignoring None, or 
+    None if all data was live."""
+    saved_ats = [saved_at for saved_at in saved_ats if saved_at is not None]
+    if saved_ats:
+        return min(saved_ats)
+    return None
+
+def database_project_attributes(database_project):
+    """Returns the project attributes used by templates from the database
+    copy of a project, so that no GitLab call is needed for them."""
+    return {
+        'id': database_project.gitlab_id,
+        'name': database_project.name,
+        'name_with_namespace': database_project.name_with_namespace,
+        'description': database_project.description,
+        'web_url': database_project.url,
+    }
 
 # --------------------------SPECIFIC VIEWS------------------------------
 # The functions below are listed in the order that a user is likely to 
@@ -343,21 +358,40 @@ def login_view(request):
     # If everything else fails, just render the form.
     return render (request, 'anonticket/user_login.html', {'form':form})
 
+def page_parameters(issues_after, notes_after):
+    """Returns the GET parameters for a page of the user landing page."""
+    parameters = {}
+    if issues_after:
+        parameters['issues_after'] = issues_after
+    if notes_after:
+        parameters['notes_after'] = notes_after
+    return parameters
+
 @validate_user
 def user_landing_view(request, user_identifier):
     """The 'landing page'. Checks if user_identifier is in database and 
     passes user_found = True to context dictionary if found, along
-    with any issues or comments created by user."""
+    with any issues or comments created by user. Issues and notes are 
+    listed settings.LANDING_PAGE_SIZE at a time; the issues_after and 
+    notes_after GET parameters pick the page of each list."""
     results = {}
-    # Check that entered User Identifier meets validation
-    user_found = user_identifier_in_database(user_identifier)
+    # Fetch the User Identifier from the database (one query), or None if 
+    # it is not there yet.
+    try:
+        working_user = UserIdentifier.objects.identified_by(
+            user_identifier).first()
+    except:
+        working_user = None
     # if user is found, pass 'user_found' to context dictionary
-    if user_found == True:
-        results['user_found'] = user_found
-        # Get linked issues linked to this user identifier and pass into 
-        # results dictionary.
-        working_user = get_user_as_object(user_identifier)
-        linked_issues = get_linked_issues(working_user)
+    if working_user is not None:
+        results['user_found'] = True
+        # Get one page of the issues linked to this user identifier and 
+        # pass into results dictionary.
+        issues_after = request.GET.get('issues_after')
+        notes_after = request.GET.get('notes_after')
+        linked_issues, next_issues = keyset_page(
+            get_linked_issues(working_user), issues_after, 
+            settings.LANDING_PAGE_SIZE)
         # Create a list of issues passed as dicts with urls generated
         results['linked_issues'] = []
         for issue in linked_issues:
@@ -384,7 +418,9 @@ def user_landing_view(request, user_identifier):
                         'issue_url': issue_url
                     }
                 )
-        linked_notes = get_linked_notes(working_user)
+        linked_notes, next_notes = keyset_page(
+            get_linked_notes(working_user), notes_after, 
+            settings.LANDING_PAGE_SIZE)
         results['linked_notes'] = []
         for note in linked_notes:
         # if the issue has a gitlab_iid, generate a link to issue-detail-view
@@ -412,6 +448,17 @@ def user_landing_view(request, user_identifier):
                         'link_text': "(See full note text.)"
                     }
                 )        
+        # Links to the next page of each list, keeping the other list on
+        # its current page, and back to the first page.
+        landing_url = reverse('user-landing', args=[working_user])
+        if next_issues:
+            results['next_issues_url'] = landing_url + '?' + urlencode(
+                page_parameters(next_issues, notes_after))
+        if next_notes:
+            results['next_notes_url'] = landing_url + '?' + urlencode(
+                page_parameters(issues_after, next_notes))
+        if issues_after or notes_after:
+            results['first_page_url'] = landing_url
     # whether user found or not found, pass 'user_identifier' to context dictionary
     results['user_identifier'] = user_identifier
     return render(request, 'anonticket/user_landing.html', {'results': results})
@@ -420,8 +467,7 @@ class UserLoginErrorView(TemplateView):
     """A generic landing page if a username doesn't pass validation tests."""
     template_name = 'anonticket/user_login_error.html'
 
-@method_decorator(custom_ratelimit_ip(), name='post')
-@method_decorator(custom_ratelimit_post(), name='post')
+@method_decorator(custom_ratelimit('create-gitlab-account'), name='post')
 class GitlabAccountRequestCreateView(
     PassUserIdentifierMixin, CreateView):
     """A view for users to create gitlab account requests."""
@@ -444,7 +490,7 @@ class GitlabAccountRequestCreateView(
                 return redirect('user-login-error', user_identifier=user_identifier)
              # Then try to grab the user_identifier from URL from database.
             try: 
-                url_user = UserIdentifier.objects.get(user_identifier=user_identifier)
+                url_user = UserIdentifier.objects.identified_by(user_identifier).get()
                 # if the User Identifier exists, see if has made any account requests
                 gl_requests = GitlabAccountRequest.objects.filter(linked_user=url_user)
                 if len(gl_requests) != 0:
@@ -504,47 +550,71 @@ class ProjectDetailView(DetailView):
         db_project = Project.objects.get(
             slug=project_slug
         )
-        # Grab the gitlab ID from db and create GL project object with
-        # a public API call.
+        # Grab the gitlab ID from db. The project and the open and closed 
+        # issues are all fetched from gitlab (or the cache) at the same time.
         gitlab_id = db_project.gitlab_id
-        gl_project = gitlab_get_project(gitlab_id, public=True)
+        from gl_bot.gitlabdown import GitlabDownProject
+        calls = {
+            'project': lambda: gitlab_cached_project(gitlab_id),
+            'opened': lambda: gitlab_cached_issues_page(
+                gitlab_id, 'opened', page_number),
+            'closed': lambda: gitlab_cached_issues_page(
+                gitlab_id, 'closed', page_number),
+        }
+        # If gitlab is too slow, fall back to the last known good copies.
+        fallbacks = {
+            'project': lambda: gitlab_cached_project(
+                gitlab_id, snapshot_only=True),
+            'opened': lambda: gitlab_cached_issues_page(
+                gitlab_id, 'opened', page_number, snapshot_only=True),
+            'closed': lambda: gitlab_cached_issues_page(
+                gitlab_id, 'closed', page_number, snapshot_only=True),
+        }
+        gitlab_results = fan_out(calls, fallbacks=fallbacks)
+        gl_project, project_saved_at = gitlab_results['project']
+        open_page, open_saved_at = gitlab_results['opened']
+        closed_page, closed_saved_at = gitlab_results['closed']
+        # If gitlab is down and there are no saved copies, fall back to 
+        # the GitlabDownProject.
+        if gl_project is None:
+            gl_project = GitlabDownProject()
+        if open_page is None:
+            open_page = list_issues_page(
+                GitlabDownProject(), 'opened', page_number)
+        if closed_page is None:
+            closed_page = list_issues_page(
+                GitlabDownProject(), 'closed', page_number)
         # Save the project attributes to context dict.
         context['results'] = {'user_identifier': user_identifier}
         context['page_number'] = page_number
         context['gitlab_project'] = gl_project.attributes
-        # Get the open issues and save to dict.
-        context['open_issues']={}
-        check_open = self.get_pagination(
-            user_identifier, project_slug, gl_project, page_number, issue_state='opened')
-        for key, value in check_open.items():
-            context['open_issues'][key] = value
-        # Get the closed issues aqnd save to dict.
-        context['closed_issues'] = {}
-        check_closed = self.get_pagination(
-            user_identifier, project_slug, gl_project, page_number, issue_state='closed'
-        )
-        for key, value in check_closed.items():
-            context['closed_issues'][key] = value
+        # If any of the data is a saved copy, tell the template how old.
+        context['stale_since'] = oldest_saved_at(
+            project_saved_at, open_saved_at, closed_saved_at)
+        # Get the open and closed issues with pagination and save to dict.
+        context['open_issues'] = self.get_pagination(
+            user_identifier, project_slug, open_page, page_number)
+        context['closed_issues'] = self.get_pagination(
+            user_identifier, project_slug, closed_page, page_number)
         return context
 
     def get_pagination(
-        self, user_identifier, project_slug, gl_project, current_page, issue_state
+        self, user_identifier, project_slug, issues_page, current_page
         ):
+        """Build the issue links and pagination links for one page of 
+        issues (as returned by list_issues_page), which also holds 
+        total_pages and total_issues."""
         result_dict = {}
         result_dict['issues']={}
-        #grab issues for current page from gitlab
-        issues_list = gl_project.issues.list(page=current_page, state=issue_state)
         # generate detail_links that will return to current page.
-        for issue in issues_list:
+        for issue in issues_page['issues']:
             detail_url = reverse('issue-detail-view-go-back', args=[
                 user_identifier, project_slug, issue.iid, current_page
             ])
             # and add them to issues in result dict in key/value pairs.
             result_dict['issues'][issue] = detail_url
-        # call generator get total_pages and total_issues.
-        call_generator = gl_project.issues.list(as_list=False, state=issue_state)
-        total_pages = call_generator.total_pages
-        total_issues = call_generator.total
+        total_pages = issues_page['total_pages']
+        total_issues = issues_page['total']
         result_dict['total_pages'] = total_pages
         result_dict['total_issues'] = total_issues
 
@@ -714,8 +784,7 @@ class ProjectDetailView(DetailView):
 # ----------------------------------------------------------------------
 
 @validate_user
-@custom_ratelimit_post()
-@custom_ratelimit_ip()
+@custom_ratelimit('create-issue')
 def create_issue_view(request, user_identifier, *args):
     """View that allows a user to create an issue. Pulls the user_identifier
     from the URL path and tries to pull that UserIdentifier from database, 
@@ -734,7 +803,7 @@ def create_issue_view(request, user_identifier, *args):
             results['user_identifier'] = user_identifier
             # Try to find the user_identifier in database. 
             try: 
-                current_user = UserIdentifier.objects.get(user_identifier=user_to_retrieve)
+                current_user = UserIdentifier.objects.identified_by(user_to_retrieve).get()
             # If lookup fails, create the user.
             except: 
                 current_user = UserIdentifier(user_identifier=user_to_retrieve)
@@ -772,18 +841,42 @@ def issue_detail_view(request, user_identifier, project_slug, gitlab_iid, go_bac
     # return a 404 error.
     database_project = get_object_or_404(Project, slug=project_slug)
     results['user_identifier']=user_identifier
-    # Use the gitlab_id from database project to fetch project from gitlab.
+    # Use the gitlab_id from database project to fetch the issue and notes
+    # from gitlab. The project details come from the database, so the
+    # project itself is never fetched.
     gitlab_id = database_project.gitlab_id
-    working_project = gitlab_get_project(project=gitlab_id, public=True)
-    results['project'] = working_project.attributes
+    results['project'] = database_project_attributes(database_project)
     go_back_url = reverse('project-detail', args=[user_identifier, project_slug, go_back_number])
     results['go_back_url'] = go_back_url
-    working_issue = gitlab_get_issue(project=gitlab_id, issue=gitlab_iid)
+    # Fetch the issue and the notes list at the same time, falling back
+    # to the last known good copies if gitlab is down or too slow.
+    gitlab_results = fan_out(
+        {
+            'issue': lambda: gitlab_cached_issue(gitlab_id, gitlab_iid),
+            'notes': lambda: gitlab_cached_notes_list(gitlab_id, gitlab_iid),
+        },
+        fallbacks={
+            'issue': lambda: gitlab_cached_issue(
+                gitlab_id, gitlab_iid, snapshot_only=True),
+            'notes': lambda: gitlab_cached_notes_list(
+                gitlab_id, gitlab_iid, snapshot_only=True),
+        })
+    working_issue, issue_saved_at = gitlab_results['issue']
+    notes_list, notes_saved_at = gitlab_results['notes']
+    results['stale_since'] = oldest_saved_at(issue_saved_at, notes_saved_at)
+    # If there are no saved copies either, fall back to the GitlabDown 
+    # mocks, and show the mock project along with the mock issue.
+    from gl_bot.gitlabdown import (
+        GitlabDownIssue, GitlabDownNote, GitlabDownProject)
+    if working_issue is None:
+        working_issue = GitlabDownIssue()
+        results['project'] = GitlabDownProject().attributes
+    if notes_list is None:
+        notes_list = GitlabDownNote().list()
     results['issue'] = working_issue.attributes
-    # Get the notes list, and then for every note in the list, grab that
-    # note's attributes, which includes the body text, etc.
+    # For every note in the notes list, grab that note's attributes, 
+    # which includes the body text, etc.
     results['notes'] = []
-    notes_list = gitlab_get_notes_list(project=gitlab_id, issue=gitlab_iid)
     for note in notes_list:
         note_dict = note.attributes
         results['notes'].append(note_dict)
@@ -815,8 +908,7 @@ def issue_search_view(request, user_identifier):
 # ----------------------------------------------------------------------
 
 @method_decorator(validate_user, name='dispatch')
-@method_decorator(custom_ratelimit_ip(), name='post')
-@method_decorator(custom_ratelimit_post(), name='post')
+@method_decorator(custom_ratelimit('create-note'), name='post')
 class NoteCreateView(PassUserIdentifierMixin, CreateView):
     """View to create a note given a user_identifier."""
     model=Note
@@ -828,7 +920,8 @@ class NoteCreateView(PassUserIdentifierMixin, CreateView):
         linked_project = get_object_or_404(Project, slug=self.kwargs['project'])
         form.instance.linked_project = linked_project
         try:
-            linked_user = UserIdentifier.objects.get(user_identifier=self.kwargs['user_identifier'])
+            linked_user = UserIdentifier.objects.identified_by(
+                self.kwargs['user_identifier']).get()
             form.instance.linked_user = linked_user
             # If lookup fails, create the user.
         except: 
@@ -895,11 +988,26 @@ def is_mod_or_approver(user):
  
 login_redirect_url = "/tor_admin/login/?next=/moderator/"
 
+def moderator_page_links(request, name, page):
+    """Returns the URLs of the previous and next pages of one table in the
+    moderator queue, keeping the other tables on the page they are on."""
+    links = {'page': page}
+    for link, has_page, number in [
+        ('previous_url', page.has_previous, page.number - 1),
+        ('next_url', page.has_next, page.number + 1)]:
+        if has_page():
+            params = request.GET.copy()
+            params[name] = number
+            links[link] = f"?{params.urlencode()}"
+    return links
+
 @user_passes_test(
     is_mod_or_approver, login_url=login_redirect_url)
 @staff_member_required
 def moderator_view(request):
-    """View that allows moderators and account approvers to approve pending items."""
+    """View that allows moderators and account approvers to approve pending items.
+    Each table is paged; the page shown is set by the issue_page, note_page
+    and gitlab_page GET parameters."""
     from anonticket.forms import (
         PendingNoteFormSet, 
         PendingIssueFormSet, 
@@ -907,6 +1015,7 @@ def moderator_view(request):
         )
     user = request.user
     messages = {}
+    pages = {}
     if request.method == 'POST':
         # if POST, verify that the user is in the moderators group.
         if is_moderator(user) == True:
@@ -929,13 +1038,20 @@ def moderator_view(request):
                 gitlab_formset.save()
             else:
                 print(gitlab_formset.errors)
-        # Regardless of result, return redirect to 'moderator' 
-        return redirect('/moderator/')
+        # Regardless of result, return redirect to 'moderator', on the
+        # same pages.
+        return redirect(request.get_full_path())
     else:
         # if request method is not POST, pull formsets and render them in the template.
         if is_moderator(user) == True:
-            note_formset = PendingNoteFormSet(prefix="note_formset")
-            issue_formset = PendingIssueFormSet(prefix="issue_formset")
+            note_formset = PendingNoteFormSet(
+                prefix="note_formset", page=request.GET.get('note_page'))
+            issue_formset = PendingIssueFormSet(
+                prefix="issue_formset", page=request.GET.get('issue_page'))
+            pages['note_pages'] = moderator_page_links(
+                request, 'note_page', note_formset.page)
+            pages['issue_pages'] = moderator_page_links(
+                request, 'issue_page', issue_formset.page)
         else:
             note_formset = {}
             issue_formset = {}
@@ -945,7 +1061,9 @@ def moderator_view(request):
             view pending issues at this time."""
         if is_account_approver(user) == True:
             gitlab_formset = PendingGitlabAccountRequestFormSet(
-                prefix="gitlab_formset")
+                prefix="gitlab_formset", page=request.GET.get('gitlab_page'))
+            pages['gitlab_pages'] = moderator_page_links(
+                request, 'gitlab_page', gitlab_formset.page)
         else:
             gitlab_formset = {}
             messages['gitlab_message'] = """You do not 
@@ -954,7 +1072,8 @@ def moderator_view(request):
         "note_formset": note_formset, 
         "issue_formset":issue_formset,
         "gitlab_formset": gitlab_formset, 
-        "messages": messages
+        "messages": messages,
+        **pages,
         })
 
 @method_decorator(user_passes_test(
@@ -997,4 +1116,18 @@ class ModeratorGitlabAccountRequestUpdateView(UpdateView):
     def get_success_url(self):
         """Return the URL to redirect to after processing a valid form."""
         url = reverse('moderator')
-        return url
\ No newline at end of file
+        return url
+
+@staff_member_required
+def gitlab_status_view(request):
+    """Instrumentation for staff: the circuit breaker's state and trip 
+    count, plus connection pool, cache, GitLab job queue, rate limit and 
+    markdown rendering statistics, as JSON."""
+    return JsonResponse({
+        'breaker': breaker_state(),
+        'pools': pool_stats(),
+        'cache': cache_stats(),
+        'jobs': job_counts(),
+        'ratelimit': ratelimit_stats(),
+        'markdown': render_stats(),
+    })
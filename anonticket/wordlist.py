@@ -0,0 +1,81 @@
+"""The wordlist that user identifiers are made from, parsed once and kept
+in memory so that neither checking nor creating an identifier reads the
+file or scans a list."""
+
+from django.conf import settings
+
+class Wordlist:
+    """A parsed wordlist: the words in file order, a frozenset of them for
+    constant-time membership checks, and a mapping of each word to its
+    position in the file."""
+    def __init__(self, words, path=None):
+        self.path = path
+        self.words = list(words)
+        self.word_set = frozenset(self.words)
+        self.index = {word: position for position, word in enumerate(self.words)}
+
+    def __contains__(self, word):
+        return word in self.word_set
+
+    def __len__(self):
+        return len(self.words)
+
+    def contains_all(self, words):
+        """Returns True if every one of words is in the wordlist."""
+        return self.word_set.issuperset(words)
+
+def read_wordlist(path):
+    """Read and parse the wordlist file at path."""
+    with open(path) as f:
+        return Wordlist(f.read().splitlines(), path=path)
+
+_WORDLIST = None
+
+def load_wordlist():
+    """Read settings.WORD_LIST_PATH and keep it in memory. Called from
+    AnonticketConfig.ready()."""
+    global _WORDLIST
+    _WORDLIST = read_wordlist(settings.WORD_LIST_PATH)
+    return _WORDLIST
+
+def get_parsed_wordlist():
+    """Returns the in-memory Wordlist, loading it if it is not loaded yet
+    or if settings.WORD_LIST_PATH has changed since it was loaded."""
+    wordlist = _WORDLIST
+    if wordlist is None or wordlist.path != settings.WORD_LIST_PATH:
+        return load_wordlist()
+    return wordlist
+
+# User identifiers are settings.DICE_ROLLS words from the wordlist, so one 
+# can be packed into a single integer: the position of each of its words 
+# is a digit in base len(wordlist). With 7,603 words and 6 dice rolls that
+# is a 78 bit number, stored as 10 big-endian bytes. Packed identifiers
+# depend on the order of the wordlist, so they must be rebuilt (see
+# migration 0005) if the wordlist file is ever changed.
+
+def packed_length(wordlist):
+    """Returns the number of bytes a packed identifier takes."""
+    largest = len(wordlist) ** settings.DICE_ROLLS - 1
+    return max(1, (largest.bit_length() + 7) // 8)
+
+def pack_identifier(user_identifier):
+    """Returns user_identifier packed into bytes, or None if it is not 
+    settings.DICE_ROLLS words from the wordlist."""
+    wordlist = get_parsed_wordlist()
+    words = user_identifier.lower().split('-')
+    if len(words) != settings.DICE_ROLLS or not wordlist.contains_all(words):
+        return None
+    value = 0
+    for word in words:
+        value = value * len(wordlist) + wordlist.index[word]
+    return value.to_bytes(packed_length(wordlist), 'big')
+
+def unpack_identifier(packed):
+    """Returns the user identifier string that was packed into packed."""
+    wordlist = get_parsed_wordlist()
+    value = int.from_bytes(bytes(packed), 'big')
+    words = []
+    for roll in range(settings.DICE_ROLLS):
+        value, position = divmod(value, len(wordlist))
+        words.append(wordlist.words[position])
+    return '-'.join(reversed(words))
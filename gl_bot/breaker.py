@@ -0,0 +1,116 @@
+"""Circuit breaker for GitLab API calls, with its state in the cache named
+by settings.GITLAB_BREAKER_CACHE (by default a SQLiteCounterCache file,
+see shared/counters.py) so that every worker on the host sees the same
+circuit. Only integers are stored, so the time the circuit opened is kept
+in milliseconds.
+
+After GITLAB_BREAKER_THRESHOLD failures in a row the circuit opens, and
+for GITLAB_BREAKER_COOLDOWN seconds calls fail at once with
+GitlabCircuitOpen instead of waiting for GitLab to time out. After that
+the circuit is half-open: one probe call at a time is let through, and
+its outcome closes the circuit again or restarts the cool-down."""
+
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from requests.exceptions import ConnectionError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class GitlabCircuitOpen(ConnectionError):
+    """Raised instead of calling GitLab while the circuit is open. It is a
+    ConnectionError, so the code that already handles GitLab being down
+    (and the fallbacks in gl_bot/fanout.py) handles it the same way."""
+
+def get_breaker_cache():
+    """Returns the cache that holds the breaker's state."""
+    return caches[settings.GITLAB_BREAKER_CACHE]
+
+def breaker_key(name):
+    """Returns the cache key for one part of the breaker's state. Each
+    GITLAB_URL has its own circuit."""
+    digest = hashlib.sha256(settings.GITLAB_URL.encode()).hexdigest()[:16]
+    return f"gitlab-breaker:{digest}:{name}"
+
+def increment(name):
+    """Add one to a counter that never expires and return the new value."""
+    key = breaker_key(name)
+    cache = get_breaker_cache()
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The counter was deleted between add() and incr().
+        cache.set(key, 1, None)
+        return 1
+
+def get_state():
+    """Returns CLOSED, OPEN or HALF_OPEN."""
+    opened_at_ms = get_breaker_cache().get(breaker_key('opened_at_ms'))
+    if opened_at_ms is None:
+        return CLOSED
+    if time.time() * 1000 < opened_at_ms + settings.GITLAB_BREAKER_COOLDOWN * 1000:
+        return OPEN
+    return HALF_OPEN
+
+def allow_request():
+    """Returns True if a call to GitLab may be made now. While half-open,
+    only the caller that takes the probe lock is let through."""
+    state = get_state()
+    if state == CLOSED:
+        return True
+    if state == HALF_OPEN:
+        return get_breaker_cache().add(
+            breaker_key('probe'), 1, settings.GITLAB_TIMEOUT)
+    return False
+
+def trip():
+    """Open the circuit and start the cool-down."""
+    cache = get_breaker_cache()
+    cache.set(breaker_key('opened_at_ms'), int(time.time() * 1000), None)
+    cache.delete(breaker_key('probe'))
+    increment('trips')
+
+def record_success():
+    """Close the circuit and reset the failure count. Every successful
+    call lands here, so nothing is written unless there is state to
+    clear."""
+    cache = get_breaker_cache()
+    keys = [
+        breaker_key('failures'),
+        breaker_key('opened_at_ms'),
+        breaker_key('probe'),
+    ]
+    if cache.get_many(keys):
+        cache.delete_many(keys)
+
+def record_failure():
+    """Count a failed call, opening the circuit if the threshold is
+    reached or if the failed call was a half-open probe."""
+    failures = increment('failures')
+    state = get_state()
+    if state == HALF_OPEN:
+        trip()
+    elif state == CLOSED and failures >= settings.GITLAB_BREAKER_THRESHOLD:
+        trip()
+
+def breaker_state():
+    """Returns the breaker's state, failure count and number of trips."""
+    cache = get_breaker_cache()
+    opened_at_ms = cache.get(breaker_key('opened_at_ms'))
+    return {
+        'state': get_state(),
+        'failures': cache.get(breaker_key('failures'), 0),
+        'trips': cache.get(breaker_key('trips'), 0),
+        'opened_at': None if opened_at_ms is None else opened_at_ms / 1000,
+        'threshold': settings.GITLAB_BREAKER_THRESHOLD,
+        'cooldown': settings.GITLAB_BREAKER_COOLDOWN,
+    }
+
+def reset_breaker():
+    """Close the circuit and clear the trip count. Used by tests."""
+    record_success()
+    get_breaker_cache().delete(breaker_key('trips'))
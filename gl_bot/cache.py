@@ -0,0 +1,248 @@
+"""TTL cache for read-only GitLab data, stored in Django's default cache.
+
+Entries are kept for their kind's TTL (settings.GITLAB_CACHE_TTLS) and
+then served stale for up to settings.GITLAB_CACHE_STALE seconds while a
+background thread fetches a fresh copy. Only one upstream call is made
+for a cold key at a time, however many requests ask for it. Fetched
+values are also saved as snapshots (gl_bot/snapshots.py) for lookup() to
+fall back on when GitLab is down. local_cached() adds a small LRU in
+each process in front of all that, for lookups that are repeated a lot
+(e.g., a user refreshing a search); its values are not snapshotted, as
+they are never served from a snapshot and are too many to keep."""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from gl_bot.fanout import get_refresh_executor, is_gitlab_down
+from gl_bot.snapshots import save_snapshot, load_snapshot
+
+logger = logging.getLogger(__name__)
+
+class CachedObject:
+    """A read-only stand-in for a python-gitlab object, rebuilt from the
+    attributes dictionary that was cached for it."""
+    def __init__(self, attributes):
+        self.__dict__['attributes'] = attributes
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['attributes'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+class CacheStats:
+    """Thread-safe hit/miss counters for one kind of cached data."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.snapshots = 0
+        self.local_hits = 0
+
+    def record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def as_dict(self):
+        hits = self.local_hits + self.hits + self.stale_hits
+        lookups = hits + self.misses
+        return {
+            'local_hits': self.local_hits,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'snapshots': self.snapshots,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+        }
+
+class LocalLRU:
+    """A thread-safe in-process cache of up to max_size entries, each kept
+    for ttl seconds, that drops the least recently used entry when full.
+    Values are returned as stored, so callers must not change them."""
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Returns the value for key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+_STATS = {}
+_STATS_LOCK = threading.Lock()
+_LOCAL = {}
+# Threads in this process that miss on the same key queue up on the same
+# lock; a fixed number of striped locks keeps memory bounded.
+_KEY_LOCKS = [threading.Lock() for i in range(64)]
+
+def get_stats(kind):
+    """Returns the CacheStats for a kind, creating it on first use."""
+    with _STATS_LOCK:
+        return _STATS.setdefault(kind, CacheStats())
+
+def cache_stats():
+    """Returns hit/miss counts and hit ratio for every kind of data."""
+    return {kind: stats.as_dict() for kind, stats in _STATS.items()}
+
+def reset_stats():
+    """Clear all counters and local caches. Used by tests."""
+    with _STATS_LOCK:
+        _STATS.clear()
+        _LOCAL.clear()
+
+def get_local_cache(kind):
+    """Returns the LocalLRU for a kind, creating it on first use with
+    settings.GITLAB_LOCAL_CACHE_SIZE entries and the kind's TTL."""
+    with _STATS_LOCK:
+        if kind not in _LOCAL:
+            _LOCAL[kind] = LocalLRU(
+                settings.GITLAB_LOCAL_CACHE_SIZE, settings.GITLAB_CACHE_TTLS[kind])
+        return _LOCAL[kind]
+
+def make_key(kind, params):
+    """Build a cache key from the GitLab URL, the kind of data (which
+    stands for the endpoint) and the call's parameters."""
+    raw = json.dumps(
+        [settings.GITLAB_URL, kind, params], sort_keys=True, default=str)
+    digest = hashlib.sha256(raw.encode()).hexdigest()
+    return f"gitlab:{kind}:{digest}"
+
+def store(key, kind, value, snapshot=True):
+    """Save a freshly fetched value along with the time it goes stale, and
+    (if snapshot is True) keep it as the last known good copy."""
+    ttl = settings.GITLAB_CACHE_TTLS[kind]
+    entry = {'value': value, 'fresh_until': time.time() + ttl}
+    cache.set(key, entry, ttl + settings.GITLAB_CACHE_STALE)
+    if snapshot:
+        save_snapshot(key, value)
+
+def refresh(key, kind, fetch, snapshot=True):
+    """Fetch and store a value, then release the key's fetch lock."""
+    try:
+        store(key, kind, fetch(), snapshot)
+    except Exception:
+        logger.warning("Background refresh of %s failed.", key, exc_info=True)
+    finally:
+        cache.delete(f"{key}:lock")
+
+def refresh_in_background(key, kind, fetch, snapshot=True):
+    """Start a background refresh, unless one is already running."""
+    if cache.add(f"{key}:lock", 1, settings.GITLAB_TIMEOUT):
+        get_refresh_executor().submit(refresh, key, kind, fetch, snapshot)
+
+def fetch_single_flight(key, kind, fetch, snapshot=True):
+    """Fetch a missing value so that concurrent requests for the same key,
+    in this process or others sharing the cache, make only one call."""
+    lock_key = f"{key}:lock"
+    with _KEY_LOCKS[hash(key) % len(_KEY_LOCKS)]:
+        # Another thread may have fetched it while this one was waiting.
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+        # Wait while another process is fetching, but not for longer than
+        # the upstream call itself could take.
+        give_up_at = time.time() + settings.GITLAB_TIMEOUT
+        have_lock = cache.add(lock_key, 1, settings.GITLAB_TIMEOUT)
+        while not have_lock and time.time() < give_up_at:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry['value']
+            have_lock = cache.add(lock_key, 1, settings.GITLAB_TIMEOUT)
+        try:
+            value = fetch()
+            store(key, kind, value, snapshot)
+        finally:
+            if have_lock:
+                cache.delete(lock_key)
+        return value
+
+def cached(kind, params, fetch, snapshot=True):
+    """Returns the cached value for kind and params, calling fetch() to get
+    it if needed. fetch() must return picklable data (e.g., attribute
+    dictionaries rather than python-gitlab objects); exceptions it raises
+    are passed on and nothing is cached. Fetched values are saved as
+    snapshots unless snapshot is False."""
+    key = make_key(kind, params)
+    stats = get_stats(kind)
+    entry = cache.get(key)
+    if entry is not None:
+        if entry['fresh_until'] > time.time():
+            stats.record('hits')
+        else:
+            stats.record('stale_hits')
+            refresh_in_background(key, kind, fetch, snapshot)
+        return entry['value']
+    stats.record('misses')
+    return fetch_single_flight(key, kind, fetch, snapshot)
+
+def peek(kind, params):
+    """Returns the cached value for kind and params, or failing that its
+    last known good copy, without ever calling GitLab. Returns None if
+    neither was saved."""
+    key = make_key(kind, params)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry['value']
+    snapshot = load_snapshot(key)
+    if snapshot is not None:
+        return snapshot['value']
+    return None
+
+def local_cached(kind, params, fetch):
+    """Like cached(), but first looks in this process's LocalLRU for the
+    kind, so that repeated lookups don't go to the shared cache at all.
+    The values are not saved as snapshots."""
+    key = make_key(kind, params)
+    local = get_local_cache(kind)
+    value = local.get(key)
+    if value is not None:
+        get_stats(kind).record('local_hits')
+        return value
+    value = cached(kind, params, fetch, snapshot=False)
+    local.set(key, value)
+    return value
+
+def lookup(kind, params, fetch, snapshot_only=False):
+    """Like cached(), but if GitLab is down (or snapshot_only is True), 
+    serve the last known good copy instead. Returns a (value, saved_at)
+    tuple: saved_at is None for live or cached data, or the datetime the
+    snapshot was saved. Returns (None, None) if GitLab is down and no 
+    snapshot was ever saved."""
+    if not snapshot_only:
+        try:
+            return cached(kind, params, fetch), None
+        except Exception as error:
+            if not is_gitlab_down(error):
+                raise
+    snapshot = load_snapshot(make_key(kind, params))
+    if snapshot is None:
+        return None, None
+    get_stats(kind).record('snapshots')
+    return snapshot['value'], snapshot['saved_at']
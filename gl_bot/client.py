@@ -0,0 +1,149 @@
+"""Process-wide registry of python-gitlab clients with pooled connections."""
+
+import threading
+import gitlab
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from django.conf import settings
+from gl_bot import breaker
+
+# Access levels understood by get_gitlab_client().
+PUBLIC = 'public'
+PRIVATE = 'private'
+ACCOUNTS = 'accounts'
+
+class PoolStats:
+    """Thread-safe counters for connection checkouts from a client's pool.
+    A checkout that had to open a new connection is a miss, all others are
+    hits (an already open keep-alive connection was reused)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.misses = 0
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    @property
+    def hits(self):
+        return max(self.checkouts - self.misses, 0)
+
+    def as_dict(self):
+        return {
+            'checkouts': self.checkouts,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+def counting_pool_class(base, stats):
+    """Returns a subclass of a urllib3 connection pool that records
+    checkouts and new connections in stats."""
+    class CountingConnectionPool(base):
+        def _get_conn(self, timeout=None):
+            stats.record_checkout()
+            return super()._get_conn(timeout=timeout)
+
+        def _new_conn(self):
+            stats.record_miss()
+            return super()._new_conn()
+    return CountingConnectionPool
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that keeps up to pool_maxsize keep-alive connections
+    per host, counts pool hits/misses, and sends every request through
+    the circuit breaker (gl_bot/breaker.py)."""
+    def __init__(self, stats, *args, **kwargs):
+        self.stats = stats
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': counting_pool_class(HTTPConnectionPool, self.stats),
+            'https': counting_pool_class(HTTPSConnectionPool, self.stats),
+        }
+
+    def send(self, request, *args, **kwargs):
+        if not breaker.allow_request():
+            raise breaker.GitlabCircuitOpen(
+                "GitLab circuit breaker is open.", request=request)
+        try:
+            response = super().send(request, *args, **kwargs)
+        except (ConnectionError, Timeout):
+            breaker.record_failure()
+            raise
+        # A server error means GitLab is in trouble; any other response
+        # (including a 404) means it is up.
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+# Registry of clients, keyed by access level plus the settings that were
+# used to build them, so that changed settings (e.g., a patched GITLAB_URL
+# in tests) produce a fresh client instead of a stale one.
+_CLIENTS = {}
+_STATS = {}
+_LOCK = threading.Lock()
+
+def get_token(access):
+    """Returns the token that matches an access level."""
+    if access == PUBLIC:
+        return None
+    elif access == ACCOUNTS:
+        return settings.GITLAB_ACCOUNTS_SECRET_TOKEN
+    return settings.GITLAB_SECRET_TOKEN
+
+def build_session(stats):
+    """Create a requests.Session whose connections are pooled and kept alive."""
+    pool_size = settings.GITLAB_POOL_SIZE
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(
+        stats, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_gitlab_client(access=PRIVATE):
+    """Returns the shared gitlab.Gitlab object for an access level
+    (PUBLIC, PRIVATE or ACCOUNTS), creating it on first use."""
+    token = get_token(access)
+    key = (access, settings.GITLAB_URL, token, settings.GITLAB_TIMEOUT)
+    client = _CLIENTS.get(key)
+    if client is None:
+        with _LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                stats = _STATS.setdefault(access, PoolStats())
+                client = gitlab.Gitlab(
+                    settings.GITLAB_URL,
+                    private_token=token,
+                    timeout=settings.GITLAB_TIMEOUT,
+                    session=build_session(stats),
+                )
+                _CLIENTS[key] = client
+    return client
+
+def pool_stats():
+    """Returns the pool hit/miss counters for every access level."""
+    results = {}
+    for access, stats in _STATS.items():
+        results[access] = stats.as_dict()
+        results[access]['pool_size'] = settings.GITLAB_POOL_SIZE
+    return results
+
+def reset_clients():
+    """Drop all clients and counters. Used by tests."""
+    with _LOCK:
+        for client in _CLIENTS.values():
+            client.session.close()
+        _CLIENTS.clear()
+        _STATS.clear()
@@ -0,0 +1,84 @@
+"""Bounded thread pool for making independent GitLab calls in parallel."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FanOutTimeout
+from django.conf import settings
+from gitlab.exceptions import GitlabError
+from requests.exceptions import ConnectionError, Timeout
+
+# Exceptions that mean GitLab could not be reached or did not answer in
+# time (a connect or read timeout).
+GITLAB_DOWN_ERRORS = (ConnectionError, Timeout)
+
+def is_gitlab_down(error):
+    """Returns True if error means GitLab is down rather than that the
+    request was wrong: it could not be reached, timed out, or answered
+    with a server error (5xx). A call that fails like this is replaced by
+    its fallback, if one was given."""
+    if isinstance(error, GITLAB_DOWN_ERRORS):
+        return True
+    return isinstance(error, GitlabError) and (error.response_code or 0) >= 500
+
+# Executors by name: 'fanout' for the calls behind a page, and 'refresh'
+# for background refreshes of cached data, which must not take threads
+# that pages are waiting on.
+_EXECUTORS = {}
+_LOCK = threading.Lock()
+
+def _get_pool(name, max_workers):
+    """Returns the process-wide executor called name, creating it on first
+    use so that each gunicorn worker builds its own threads after 
+    forking."""
+    executor = _EXECUTORS.get(name)
+    if executor is None:
+        with _LOCK:
+            executor = _EXECUTORS.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix=f'gitlab-{name}',
+                )
+                _EXECUTORS[name] = executor
+    return executor
+
+def get_executor():
+    """Returns the executor for the GitLab calls behind a page, with
+    settings.GITLAB_FANOUT_WORKERS threads."""
+    return _get_pool('fanout', settings.GITLAB_FANOUT_WORKERS)
+
+def get_refresh_executor():
+    """Returns the executor for background refreshes, with
+    settings.GITLAB_REFRESH_WORKERS threads."""
+    return _get_pool('refresh', settings.GITLAB_REFRESH_WORKERS)
+
+def fan_out(calls, fallbacks=None, deadline=None):
+    """Run every callable in the calls dictionary at the same time and
+    return a dictionary of their results under the same keys.
+
+    All calls share one deadline (settings.GITLAB_FANOUT_DEADLINE seconds
+    by default). A call that misses the deadline or finds GitLab down (see
+    is_gitlab_down) is replaced by calling fallbacks[key]; without a
+    fallback, the timeout or error is raised. Any other exception is raised as-is."""
+    fallbacks = fallbacks or {}
+    if deadline is None:
+        deadline = settings.GITLAB_FANOUT_DEADLINE
+    executor = get_executor()
+    futures = {key: executor.submit(call) for key, call in calls.items()}
+    wait(futures.values(), timeout=deadline)
+    results = {}
+    for key, future in futures.items():
+        if not future.done():
+            # Leave the call to finish on its own; its result is not used.
+            future.cancel()
+            if key not in fallbacks:
+                raise FanOutTimeout(f"GitLab call '{key}' missed the deadline.")
+            results[key] = fallbacks[key]()
+            continue
+        try:
+            results[key] = future.result()
+        except Exception as error:
+            if key not in fallbacks or not is_gitlab_down(error):
+                raise
+            results[key] = fallbacks[key]()
+    return results
@@ -29,7 +29,7 @@ class GitlabDownProject:
         }
         self.issues = GitlabDownIssue()
 
-    def get(self, id):
+    def get(self, id, **kwargs):
         return self
 
     def __strt__(self):
@@ -80,7 +80,7 @@ class GitlabDownIssue:
             }
         self.notes = GitlabDownNote()
 
-    def get(self, id):
+    def get(self, id, **kwargs):
         """A mocked version of the .get method, which just returns self."""
         return self
 
@@ -99,7 +99,8 @@ class GitlabDownIssue:
                 return blank_list
         else:
             if state=='opened':
-                instantiate_generator = self.GitlabDownIssueGenerator(total=1)
+                instantiate_generator = self.GitlabDownIssueGenerator(
+                    total=1, issues=[self])
                 return instantiate_generator
             else:
                 instantiate_generator = self.GitlabDownIssueGenerator(total=0)
@@ -110,9 +111,16 @@ class GitlabDownIssue:
 
     class GitlabDownIssueGenerator:
         """A mocked version of the Issue Generator Object in Gitlab."""
-        def __init__(self, total):
+        def __init__(self, total, issues=None):
             self.total_pages = total
             self.total = total
+            self.per_page = 20
+            self.next_page = None
+            self.issues = issues or []
+
+        def __iter__(self):
+            """Iterate over the mocked issues on the (only) page."""
+            return iter(self.issues)
 
 class GitlabDownNote:
     """A mocked version of a GitLab note for when GitLab is down."""
@@ -0,0 +1,54 @@
+"""Fetch one page of a project's issues together with the issue totals."""
+
+from itertools import islice
+from django.conf import settings
+from django.core.cache import cache
+
+def totals_cache_key(project_id, issue_state):
+    """Returns the cache key for a project's issue totals."""
+    return f"gitlab-issue-totals:{project_id}:{issue_state}"
+
+def read_header(listing, attribute):
+    """Returns a pagination header from a listing as an int, or None if
+    GitLab did not send it (it leaves out X-Total and X-Total-Pages for
+    lists of more than 10,000 items)."""
+    try:
+        return getattr(listing, attribute)
+    except TypeError:
+        return None
+
+def list_issues_page(gl_project, issue_state, page):
+    """Returns a dictionary with the issues on one page of a project, plus
+    'total' and 'total_pages', all read from a single GitLab response.
+
+    The totals are cached per (project, state) for GITLAB_TOTALS_TTL
+    seconds and used when GitLab does not send them."""
+    # Passing the page inside query_parameters (rather than as page=)
+    # keeps python-gitlab from discarding the response headers.
+    listing = gl_project.issues.list(
+        as_list=False,
+        state=issue_state,
+        query_parameters={'state': issue_state, 'page': page},
+    )
+    # Only read the rows on this page, so no further pages are fetched.
+    issues = list(islice(listing, read_header(listing, 'per_page') or 0))
+    total = read_header(listing, 'total')
+    total_pages = read_header(listing, 'total_pages')
+    project_id = getattr(gl_project, 'id', None)
+    if project_id is not None:
+        key = totals_cache_key(project_id, issue_state)
+        if total_pages is not None:
+            cache.set(
+                key,
+                {'total': total, 'total_pages': total_pages},
+                settings.GITLAB_TOTALS_TTL)
+        else:
+            cached_totals = cache.get(key)
+            if cached_totals:
+                total = cached_totals['total']
+                total_pages = cached_totals['total_pages']
+    # Without any totals, only offer a link to the next page if there is one.
+    if total_pages is None:
+        next_page = read_header(listing, 'next_page')
+        total_pages = next_page if next_page else page
+    return {'issues': issues, 'total': total, 'total_pages': total_pages}
@@ -0,0 +1,44 @@
+"""Persistent last-known-good copies of GitLab data.
+
+Every successful fetch made through gl_bot/cache.py is also saved here,
+in the cache named by settings.GITLAB_SNAPSHOT_CACHE (a SnapshotFileCache
+that never expires, so it survives restarts and is shared by all
+workers). When GitLab is down, views serve these snapshots, marked with
+the time they were saved, instead of the GitlabDown mocks."""
+
+import logging
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+class SnapshotFileCache(FileBasedCache):
+    """FileBasedCache that never culls. The stock one lists its whole
+    directory on every set and, past MAX_ENTRIES, deletes a random third
+    of the files, which could throw away the only copy of a project.
+    Here each key is one file, replaced (atomically, as in FileBasedCache)
+    when its value is saved again, so the directory holds one snapshot
+    per GitLab object fetched and only grows with them."""
+
+    def _cull(self):
+        pass
+
+def get_snapshot_cache():
+    """Returns the cache that holds the snapshots."""
+    return caches[settings.GITLAB_SNAPSHOT_CACHE]
+
+def save_snapshot(key, value):
+    """Save value as the last known good copy for key."""
+    try:
+        get_snapshot_cache().set(
+            key, {'value': value, 'saved_at': timezone.now()}, None)
+    except OSError:
+        # A full or read-only disk should not break a successful fetch.
+        logger.warning("Could not save GitLab snapshot %s.", key, exc_info=True)
+
+def load_snapshot(key):
+    """Returns {'value': ..., 'saved_at': datetime} for key, or None if
+    nothing was ever saved."""
+    return get_snapshot_cache().get(key)
@@ -2,19 +2,34 @@
 
 from django.conf import settings
 from django.test import SimpleTestCase, Client, tag, override_settings
-from test_plus.test import TestCase, CBVTestCase
-from django.urls import reverse, resolve
+from test_plus.test import TestCase
+from django.urls import reverse
 from django.core.cache import cache
-from anonticket.models import Project, Issue, Note, UserIdentifier
-from anonticket.views import ProjectDetailView
+from anonticket.models import (
+    Project, Issue, Note, UserIdentifier, GitlabAccountRequest, GitlabJob,
+    GitlabUsernameTaken)
+from anonticket import outbox
 # Import necessary functions from views
 from anonticket.views import gitlab_get_project
 # Import gitlab and relevant gl_bot functions.
 import gitlab
-from gl_bot.gitlabdown import (
-    GitlabDownObject, GitlabDownProject, GitlabDownIssue, GitlabDownNote)
-from requests.exceptions import ConnectTimeout, ConnectionError
+from gl_bot.gitlabdown import GitlabDownObject, GitlabDownIssue
+from requests.exceptions import ConnectTimeout, ConnectionError, ReadTimeout
 from unittest.mock import patch
+from gl_bot import client as gl_client
+from gl_bot.fanout import fan_out, FanOutTimeout, get_refresh_executor
+from gl_bot.pagination import list_issues_page
+from gl_bot import cache as gl_cache
+from gl_bot.snapshots import get_snapshot_cache, save_snapshot, load_snapshot
+from gl_bot import breaker
+from django.contrib.auth.models import User
+import time
+import json
+from io import StringIO
+from django.core.management import call_command
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 
 # import get functions from view
 
@@ -24,6 +39,28 @@ from unittest.mock import patch
 #   $ python manage.py test --tag url 
 #   (or with coverage) $ coverage run manage.py --tag url.)
 
+# Keep snapshots, rate limit counters and the circuit breaker in memory
+# during tests rather than on disk.
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'gitlab_snapshots': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gitlab-snapshots-test',
+        'TIMEOUT': None,
+    },
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit-test',
+    },
+    # Shares the default cache's (unnamed) LocMem store, so that 
+    # cache.clear() also resets the circuit breaker between tests.
+    'gitlab_breaker': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
 # ---------------------GITLAB BOT ATTRIBUTES----------------------------
 # Basic tests for API calls with GitlabBot
 # ----------------------------------------------------------------------
@@ -116,6 +153,7 @@ class TestGitLabBotBasic(SimpleTestCase):
             self.assertEqual(note.attributes['id'],9999999)
 
 @tag('gitlab-bot-views')
+@override_settings(CACHES=TEST_CACHES)
 class TestGitlabBotProjectViewGet(TestCase):
     """Test that GitLabDown Object is called when data is mocked"""
 
@@ -186,6 +224,1189 @@ class TestGitlabBotProjectViewGet(TestCase):
             len(self.context['results']['notes']), 1)
         notes_list = self.context['results']['notes']
         for note in notes_list:
-            self.assertIn("""***If you're seeing this note""", note['body'])  
+            self.assertIn("""***If you're seeing this note""", note['body'])
+
+# ---------------------GITLAB CLIENT REGISTRY---------------------------
+# Tests for the shared, pooled gitlab clients in gl_bot/client.py. These
+# run against a small local HTTP server instead of GitLab.
+# ----------------------------------------------------------------------
+
+FAKE_PROJECT = {'id': 1, 'name': 'Fake Project', 
+    'name_with_namespace': 'Fakes / Fake Project', 
+    'description': 'A fake project.', 'web_url': ''}
+FAKE_ISSUE = {'id': 10, 'iid': 2, 'project_id': 1, 'title': 'Fake Issue',
+    'description': 'A fake issue.', 'state': 'opened', 
+    'created_at': '2021-01-01T00:00:00.000Z', 'labels': [],
+    'author': {'username': 'fake'}}
+FAKE_NOTE = {'id': 100, 'body': 'A fake note.', 'noteable_type': 'Issue',
+    'author': {'username': 'fake'}}
+
+class FakeGitlabHandler(BaseHTTPRequestHandler):
+    """Answers GETs for a project, its issues and an issue's notes, keeps
+    the connection alive between requests, and records every path 
+    requested in the class attribute 'paths'. Issues, notes and users 
+    POSTed to it are kept in 'created' and listed by later GETs."""
+    protocol_version = 'HTTP/1.1'
+    paths = []
+    created = {'issues': [], 'notes': [], 'users': []}
+    # Issue lists report 45 issues over 3 pages, unless send_totals is 
+    # False, in which case the X-Total headers are left out like GitLab 
+    # does for very long lists.
+    send_totals = True
+    # Seconds to wait before answering a GET, to act like a hung GitLab,
+    # and the status to answer GETs with instead of their data, if any.
+    delay = 0
+    error_status = None
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        FakeGitlabHandler.paths.append(path)
+        time.sleep(FakeGitlabHandler.delay)
+        if FakeGitlabHandler.error_status:
+            return self.send_json(
+                FakeGitlabHandler.error_status, {'message': 'GitLab is unwell.'})
+        headers = {}
+        if path.endswith('/notes'):
+            payload = [FAKE_NOTE] + FakeGitlabHandler.created['notes']
+        elif path.endswith('/users'):
+            username = parse_qs(urlparse(self.path).query).get('username')
+            payload = [
+                user for user in FakeGitlabHandler.created['users']
+                if username is None or user['username'] in username]
+        elif path.endswith('/issues'):
+            payload = [FAKE_ISSUE] + FakeGitlabHandler.created['issues']
+            headers = {'X-Per-Page': '20', 'X-Page': '1', 'X-Next-Page': '2'}
+            if FakeGitlabHandler.send_totals:
+                headers['X-Total'] = '45'
+                headers['X-Total-Pages'] = '3'
+        elif '/issues/' in path:
+            payload = FAKE_ISSUE
+        elif path.endswith('/search'):
+            payload = [FAKE_ISSUE]
+        else:
+            payload = FAKE_PROJECT
+        self.send_json(200, payload, headers)
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        FakeGitlabHandler.paths.append(path)
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        kind = path.rsplit('/', 1)[-1]
+        created = FakeGitlabHandler.created[kind]
+        if kind == 'users' and any(
+                user['username'] == payload.get('username') for user in created):
+            return self.send_json(
+                409, {'message': 'Username has already been taken'})
+        payload.update({'id': 200 + len(created), 'iid': 3 + len(created)})
+        created.append(payload)
+        self.send_json(201, payload)
+
+    def do_PUT(self):
+        path = self.path.split('?')[0]
+        FakeGitlabHandler.paths.append(path)
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        payload['id'] = int(path.rsplit('/', 1)[-1])
+        self.send_json(200, payload)
+
+    def send_json(self, status, payload, headers={}):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_fake_gitlab():
+    """Start a FakeGitlabHandler server in a thread and return it."""
+    FakeGitlabHandler.paths = []
+    FakeGitlabHandler.created = {'issues': [], 'notes': [], 'users': []}
+    FakeGitlabHandler.send_totals = True
+    FakeGitlabHandler.delay = 0
+    FakeGitlabHandler.error_status = None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGitlabHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+@tag('gitlab-client')
+@override_settings(CACHES=TEST_CACHES)
+class TestGitlabClientRegistry(SimpleTestCase):
+    """Test that gitlab clients are shared and reuse their connections."""
+
+    def setUp(self):
+        gl_client.reset_clients()
+        self.server = start_fake_gitlab()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def test_same_client_returned(self):
+        """The registry hands out one client per access level."""
+        with override_settings(GITLAB_URL=self.url):
+            first = gl_client.get_gitlab_client(gl_client.PUBLIC)
+            second = gl_client.get_gitlab_client(gl_client.PUBLIC)
+            private = gl_client.get_gitlab_client(gl_client.PRIVATE)
+        self.assertIs(first, second)
+        self.assertIsNot(first, private)
+        self.assertIsNone(first.private_token)
+
+    def test_new_client_when_url_changes(self):
+        """Changing GITLAB_URL produces a client for the new URL."""
+        first = gl_client.get_gitlab_client(gl_client.PUBLIC)
+        with override_settings(GITLAB_URL=self.url):
+            second = gl_client.get_gitlab_client(gl_client.PUBLIC)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.url, self.url)
+
+    def test_no_client_built_at_import(self):
+        """Importing the forms builds no GitLab client; one is only built
+        when a search needs it."""
+        import importlib
+        import anonticket.forms
+        gl_client.reset_clients()
+        importlib.reload(anonticket.forms)
+        self.assertEqual(gl_client.pool_stats(), {})
+
+    def test_parse_importtime(self):
+        """The startup benchmark reads python -X importtime output."""
+        from anonticket.management.commands.benchmark_startup import (
+            parse_importtime)
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       100 |        100 |   gitlab.const\n"
+            "import time:       300 |        400 | gitlab\n")
+        self.assertEqual(parse_importtime(output), [
+            ('gitlab.const', 100, 100, 1), ('gitlab', 300, 400, 0)])
+
+    def test_pool_hits_and_misses(self):
+        """Repeated calls reuse one keep-alive connection."""
+        with override_settings(GITLAB_URL=self.url):
+            gl = gl_client.get_gitlab_client(gl_client.PUBLIC)
+            for attempt in range(5):
+                project = gl.projects.get(1)
+                self.assertEqual(project.name, 'Fake Project')
+        stats = gl_client.pool_stats()[gl_client.PUBLIC]
+        self.assertEqual(stats['checkouts'], 5)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 4)
+        self.assertEqual(stats['pool_size'], settings.GITLAB_POOL_SIZE)
+
+    def tearDown(self):
+        gl_client.reset_clients()
+        cache.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+@tag('gitlab-client')
+@override_settings(CACHES=TEST_CACHES)
+class TestIssueDetailGitlabCalls(TestCase):
+    """Test how many GitLab calls the issue detail view makes."""
+
+    def setUp(self):
+        gl_client.reset_clients()
+        cache.clear()
+        gl_cache.reset_stats()
+        self.server = start_fake_gitlab()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        with override_settings(GITLAB_URL=self.url):
+            self.project = Project(gitlab_id=1)
+            self.project.save()
+        self.user = 'duo-atlas-hypnotism-curry-creatable-rubble'
+
+    def test_project_detail_view_three_calls(self):
+        """The project detail view fetches the project and one page of 
+        opened and closed issues, with totals read from the same response."""
+        FakeGitlabHandler.paths = []
+        url = reverse('project-detail', args=[self.user, self.project.slug, 1])
+        with override_settings(GITLAB_URL=self.url):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertCountEqual(FakeGitlabHandler.paths, [
+            '/api/v4/projects/1',
+            '/api/v4/projects/1/issues',
+            '/api/v4/projects/1/issues',
+        ])
+        self.assertEqual(response.context['open_issues']['total_issues'], 45)
+        self.assertEqual(response.context['open_issues']['total_pages'], 3)
+        self.assertEqual(len(response.context['open_issues']['issues']), 1)
+
+    def test_list_issues_page_cached_totals(self):
+        """Totals are cached and used when GitLab leaves them out."""
+        with override_settings(GITLAB_URL=self.url):
+            gl_project = gitlab_get_project(1, public=True, lazy=True)
+            first = list_issues_page(gl_project, 'opened', 1)
+            FakeGitlabHandler.send_totals = False
+            second = list_issues_page(gl_project, 'opened', 2)
+            cache.clear()
+            third = list_issues_page(gl_project, 'opened', 2)
+        self.assertEqual(first['total_pages'], 3)
+        self.assertEqual(second['total'], 45)
+        self.assertEqual(second['total_pages'], 3)
+        # With nothing cached, only the next page is known.
+        self.assertIsNone(third['total'])
+        self.assertEqual(third['total_pages'], 2)
+
+    def test_issue_detail_view_cached(self):
+        """A second view of the same issue is served from the cache."""
+        url = reverse('issue-detail-view', args=[
+            self.user, self.project.slug, 2])
+        with override_settings(GITLAB_URL=self.url):
+            self.client.get(url)
+            FakeGitlabHandler.paths = []
+            response = self.client.get(url)
+        self.assertEqual(FakeGitlabHandler.paths, [])
+        self.assertEqual(
+            response.context['results']['issue']['title'], 'Fake Issue')
+
+    def test_issue_detail_view_two_calls(self):
+        """The issue detail view fetches only the issue and its notes."""
+        FakeGitlabHandler.paths = []
+        url = reverse('issue-detail-view', args=[
+            self.user, self.project.slug, 2])
+        with override_settings(GITLAB_URL=self.url):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertCountEqual(FakeGitlabHandler.paths, [
+            '/api/v4/projects/1/issues/2',
+            '/api/v4/projects/1/issues/2/notes',
+        ])
+        results = response.context['results']
+        self.assertEqual(results['issue']['title'], 'Fake Issue')
+        self.assertEqual(
+            results['project']['name_with_namespace'], 'Fakes / Fake Project')
+        self.assertEqual(results['notes'][0]['body'], 'A fake note.')
+
+    def test_issue_search_view_one_call(self):
+        """A search is made by project id without fetching the project, and
+        the same search, with other case and spacing, is served from the
+        local cache."""
+        FakeGitlabHandler.paths = []
+        url = reverse('issue-search', args=[self.user])
+        with override_settings(GITLAB_URL=self.url):
+            response = self.client.get(url, {
+                'choose_project': self.project.pk, 'search_terms': 'Fake issue'})
+            second = self.client.get(url, {
+                'choose_project': self.project.pk, 'search_terms': ' fake  ISSUE'})
+        self.assertEqual(FakeGitlabHandler.paths, ['/api/v4/projects/1/search'])
+        self.assertEqual(gl_cache.cache_stats()['search']['local_hits'], 1)
+        for results in (response.context['results'], second.context['results']):
+            self.assertEqual(results['status'], 'success')
+            self.assertEqual(
+                results['matching_project']['name'], self.project.name)
+            self.assertEqual(
+                results['matching_issues'][0]['title'], 'Fake Issue')
+        self.assertIn(self.user, second.context['results'][
+            'matching_issues'][0]['detail_url'])
+
+    def test_local_lru_evicts_least_recently_used(self):
+        """The local cache keeps max_size entries, dropping the least
+        recently used, and forgets entries after their TTL."""
+        lru = gl_cache.LocalLRU(2, 60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(len(lru), 2)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        expired = gl_cache.LocalLRU(2, 0)
+        expired.set('a', 1)
+        self.assertIsNone(expired.get('a'))
+
+    def tearDown(self):
+        gl_client.reset_clients()
+        cache.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+# ---------------------------GITLAB FAN-OUT-----------------------------
+# Tests for running independent GitLab calls in parallel (gl_bot/fanout.py)
+# ----------------------------------------------------------------------
+
+def slow_call(seconds, value):
+    """Returns a callable that sleeps for seconds and then returns value."""
+    def call():
+        time.sleep(seconds)
+        return value
+    return call
+
+def down_call():
+    """A callable that behaves like an unreachable GitLab."""
+    raise ConnectTimeout('GitLab is down.')
+
+@tag('gitlab-fanout')
+class TestFanOut(SimpleTestCase):
+    """Test the fan_out function."""
+
+    def test_fan_out_runs_calls_in_parallel(self):
+        """Total time is the slowest call, not the sum of the calls."""
+        start = time.monotonic()
+        results = fan_out({
+            'first': slow_call(0.3, 1),
+            'second': slow_call(0.3, 2),
+            'third': slow_call(0.3, 3),
+        }, deadline=5)
+        elapsed = time.monotonic() - start
+        self.assertEqual(results, {'first': 1, 'second': 2, 'third': 3})
+        self.assertLess(elapsed, 0.8)
+
+    def test_fan_out_deadline_uses_fallback(self):
+        """A call that misses the deadline is replaced by its fallback."""
+        start = time.monotonic()
+        results = fan_out(
+            {'fast': slow_call(0, 'fast'), 'slow': slow_call(1, 'slow')},
+            fallbacks={'slow': lambda: 'fallback'},
+            deadline=0.2)
+        self.assertEqual(results, {'fast': 'fast', 'slow': 'fallback'})
+        self.assertLess(time.monotonic() - start, 0.8)
+
+    def test_fan_out_deadline_without_fallback_raises(self):
+        """A call that misses the deadline without a fallback raises."""
+        with self.assertRaises(FanOutTimeout):
+            fan_out({'slow': slow_call(1, 'slow')}, deadline=0.1)
+
+    def test_fan_out_gitlab_down_uses_fallback(self):
+        """A call that cannot reach GitLab is replaced by its fallback."""
+        results = fan_out(
+            {'down': down_call}, fallbacks={'down': lambda: 'fallback'})
+        self.assertEqual(results['down'], 'fallback')
+
+    def test_fan_out_not_held_up_by_refreshes(self):
+        """Background refreshes of stale cached data run in their own pool,
+        so a page's calls start at once even while every refresh thread is
+        busy."""
+        threads = []
+        def refresh():
+            threads.append(threading.current_thread().name)
+            time.sleep(0.5)
+            return 'new'
+        with override_settings(CACHES=TEST_CACHES, GITLAB_CACHE_TTLS={'issue': 0}):
+            busy = get_refresh_executor()._max_workers
+            for issue in range(busy):
+                gl_cache.cached('issue', {'issue': issue}, lambda: 'old')
+                gl_cache.cached('issue', {'issue': issue}, refresh)
+            start = time.monotonic()
+            results = fan_out({'page': slow_call(0, 'page')}, deadline=5)
+            self.assertLess(time.monotonic() - start, 0.3)
+            time.sleep(0.6)
+            cache.clear()
+        self.assertEqual(results, {'page': 'page'})
+        self.assertEqual(len(threads), busy)
+        self.assertTrue(all(name.startswith('gitlab-refresh') for name in threads))
+
+    def test_fan_out_gitlab_errors(self):
+        """A read timeout or a server error counts as GitLab being down;
+        other GitLab errors are raised."""
+        def timed_out_call():
+            raise ReadTimeout('GitLab did not answer.')
+        def server_error_call():
+            raise gitlab.exceptions.GitlabGetError('Bad gateway', 502)
+        def not_found_call():
+            raise gitlab.exceptions.GitlabGetError('Not found', 404)
+        results = fan_out(
+            {'timed_out': timed_out_call, 'server_error': server_error_call},
+            fallbacks={
+                'timed_out': lambda: 'fallback', 
+                'server_error': lambda: 'fallback'})
+        self.assertEqual(
+            results, {'timed_out': 'fallback', 'server_error': 'fallback'})
+        with self.assertRaises(gitlab.exceptions.GitlabGetError):
+            fan_out({'missing': not_found_call}, fallbacks={'missing': lambda: 1})
+
+    def test_fan_out_other_errors_raise(self):
+        """Errors other than GitLab being down are raised."""
+        def broken_call():
+            raise ValueError('Broken.')
+        with self.assertRaises(ValueError):
+            fan_out({'broken': broken_call}, fallbacks={'broken': lambda: 1})
+
+# ---------------------------GITLAB DATA CACHE--------------------------
+# Tests for the TTL cache of read-only GitLab data (gl_bot/cache.py)
+# ----------------------------------------------------------------------
+
+class CountingFetch:
+    """A fetch callable that counts its calls, optionally sleeping first."""
+    def __init__(self, value, seconds=0):
+        self.value = value
+        self.seconds = seconds
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.seconds)
+        return self.value
+
+@tag('gitlab-cache')
+@override_settings(CACHES=TEST_CACHES)
+class TestGitlabCache(SimpleTestCase):
+    """Test the cached function and its statistics."""
+
+    def setUp(self):
+        cache.clear()
+        gl_cache.reset_stats()
+
+    def test_cached_hit_after_miss(self):
+        """The second lookup is a hit and does not call fetch."""
+        fetch = CountingFetch({'title': 'Cached'})
+        first = gl_cache.cached('issue', {'project': 1, 'issue': 2}, fetch)
+        second = gl_cache.cached('issue', {'issue': 2, 'project': 1}, fetch)
+        self.assertEqual(first, second)
+        self.assertEqual(fetch.calls, 1)
+        stats = gl_cache.cache_stats()['issue']
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_cached_keys_by_params(self):
+        """Different parameters are cached separately."""
+        fetch = CountingFetch('value')
+        gl_cache.cached('issue', {'project': 1, 'issue': 2}, fetch)
+        gl_cache.cached('issue', {'project': 1, 'issue': 3}, fetch)
+        gl_cache.cached('notes', {'project': 1, 'issue': 2}, fetch)
+        self.assertEqual(fetch.calls, 3)
+
+    def test_cached_single_flight(self):
+        """Fifty concurrent lookups of a cold key make one fetch."""
+        fetch = CountingFetch('value', seconds=0.2)
+        results = []
+        def lookup():
+            results.append(gl_cache.cached('issue', {'issue': 1}, fetch))
+        threads = [threading.Thread(target=lookup) for i in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(fetch.calls, 1)
+        self.assertEqual(results, ['value'] * 50)
+
+    @override_settings(GITLAB_CACHE_TTLS={'issue': 0})
+    def test_cached_stale_while_revalidate(self):
+        """Stale data is served at once while it is refreshed."""
+        gl_cache.cached('issue', {'issue': 1}, CountingFetch('old'))
+        fetch = CountingFetch('new', seconds=0.1)
+        stale = gl_cache.cached('issue', {'issue': 1}, fetch)
+        self.assertEqual(stale, 'old')
+        self.assertEqual(gl_cache.cache_stats()['issue']['stale_hits'], 1)
+        # Wait for the background refresh to store the new value.
+        for attempt in range(50):
+            entry = cache.get(gl_cache.make_key('issue', {'issue': 1}))
+            if entry['value'] == 'new':
+                break
+            time.sleep(0.05)
+        self.assertEqual(entry['value'], 'new')
+        self.assertEqual(fetch.calls, 1)
+
+    def test_cached_errors_not_cached(self):
+        """Nothing is cached when fetch raises."""
+        with self.assertRaises(ConnectTimeout):
+            gl_cache.cached('issue', {'issue': 1}, down_call)
+        fetch = CountingFetch('value')
+        self.assertEqual(gl_cache.cached('issue', {'issue': 1}, fetch), 'value')
+        self.assertEqual(fetch.calls, 1)
+
+    def tearDown(self):
+        cache.clear()
+
+@tag('gitlab-cache')
+@override_settings(CACHES=TEST_CACHES)
+class TestGitlabSnapshots(TestCase):
+    """Test that the last known good copy is served when GitLab is down."""
+
+    def setUp(self):
+        gl_client.reset_clients()
+        gl_cache.reset_stats()
+        cache.clear()
+        get_snapshot_cache().clear()
+        self.server = start_fake_gitlab()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        with override_settings(GITLAB_URL=self.url):
+            self.project = Project(gitlab_id=1)
+            self.project.save()
+        self.user = 'duo-atlas-hypnotism-curry-creatable-rubble'
+
+    def stop_gitlab(self):
+        """Shut the fake server down and empty the TTL cache, so that 
+        only the snapshots are left."""
+        gl_client.reset_clients()
+        self.server.shutdown()
+        self.server.server_close()
+        cache.clear()
+
+    def test_lookup_saves_and_serves_snapshot(self):
+        """A fetched value is saved and served, with its time, once
+        fetching fails."""
+        value, saved_at = gl_cache.lookup(
+            'issue', {'issue': 1}, CountingFetch('saved'))
+        self.assertEqual(value, 'saved')
+        self.assertIsNone(saved_at)
+        cache.clear()
+        value, saved_at = gl_cache.lookup('issue', {'issue': 1}, down_call)
+        self.assertEqual(value, 'saved')
+        self.assertIsNotNone(saved_at)
+        self.assertEqual(gl_cache.cache_stats()['issue']['snapshots'], 1)
+
+    def test_local_cached_not_snapshotted(self):
+        """Values reached through local_cached() (e.g., searches) are not
+        saved as snapshots."""
+        params = {'project': 1, 'search': 'fake issue'}
+        gl_cache.local_cached('search', params, CountingFetch(['found']))
+        self.assertIsNone(load_snapshot(gl_cache.make_key('search', params)))
+        gl_cache.cached('issue', {'issue': 1}, CountingFetch('saved'))
+        self.assertIsNotNone(
+            load_snapshot(gl_cache.make_key('issue', {'issue': 1})))
+
+    def test_snapshots_not_culled(self):
+        """The on-disk store keeps every snapshot past MAX_ENTRIES, and
+        saving a key again replaces its file."""
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(CACHES={
+                    **TEST_CACHES,
+                    'gitlab_snapshots': {
+                        'BACKEND': 'gl_bot.snapshots.SnapshotFileCache',
+                        'LOCATION': directory,
+                        'TIMEOUT': None,
+                        'OPTIONS': {'MAX_ENTRIES': 2},
+                    }}):
+                for issue in range(5):
+                    save_snapshot(f"issue-{issue}", issue)
+                save_snapshot('issue-0', 'replaced')
+                self.assertEqual(len(os.listdir(directory)), 5)
+                self.assertEqual(load_snapshot('issue-0')['value'], 'replaced')
+                self.assertEqual(load_snapshot('issue-4')['value'], 4)
+
+    def test_lookup_without_snapshot(self):
+        """With GitLab down and nothing saved, lookup returns None."""
+        self.assertEqual(
+            gl_cache.lookup('issue', {'issue': 1}, down_call), (None, None))
+
+    def test_issue_detail_view_serves_snapshot(self):
+        """When GitLab goes down, the issue detail view shows the saved 
+        issue and notes along with a notice of their age."""
+        url = reverse('issue-detail-view', args=[
+            self.user, self.project.slug, 2])
+        with override_settings(GITLAB_URL=self.url):
+            live = self.client.get(url)
+            self.stop_gitlab()
+            response = self.client.get(url)
+        self.assertIsNone(live.context['results']['stale_since'])
+        results = response.context['results']
+        self.assertIsNotNone(results['stale_since'])
+        self.assertEqual(results['issue']['title'], 'Fake Issue')
+        self.assertEqual(results['notes'][0]['body'], 'A fake note.')
+        self.assertContains(response, 'GitLab could not be reached')
+
+    def test_project_detail_view_serves_snapshot(self):
+        """When GitLab goes down, the project detail view shows the saved
+        project and issues."""
+        url = reverse('project-detail', args=[self.user, self.project.slug, 1])
+        with override_settings(GITLAB_URL=self.url):
+            self.client.get(url)
+            self.stop_gitlab()
+            response = self.client.get(url)
+        self.assertIsNotNone(response.context['stale_since'])
+        self.assertEqual(response.context['gitlab_project']['id'], 1)
+        self.assertEqual(response.context['open_issues']['total_issues'], 45)
+        self.assertContains(response, 'GitLab could not be reached')
+
+    def test_issue_detail_view_serves_snapshot_gitlab_hung(self):
+        """When GitLab stops answering, or answers with server errors, the
+        issue detail view shows the saved issue instead of failing."""
+        url = reverse('issue-detail-view', args=[
+            self.user, self.project.slug, 2])
+        with override_settings(GITLAB_URL=self.url, GITLAB_TIMEOUT=0.2):
+            self.client.get(url)
+            for delay, error_status in ((1, None), (0, 502)):
+                cache.clear()
+                FakeGitlabHandler.delay = delay
+                FakeGitlabHandler.error_status = error_status
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                results = response.context['results']
+                self.assertIsNotNone(results['stale_since'])
+                self.assertEqual(results['issue']['title'], 'Fake Issue')
+
+    def test_issue_detail_view_without_snapshot(self):
+        """With GitLab down and nothing saved, the GitlabDown mocks are
+        still shown."""
+        url = reverse('issue-detail-view', args=[
+            self.user, self.project.slug, 2])
+        with override_settings(GITLAB_URL=self.url):
+            self.stop_gitlab()
+            response = self.client.get(url)
+        results = response.context['results']
+        self.assertIsNone(results['stale_since'])
+        self.assertEqual(results['issue']['title'], GitlabDownIssue().title)
+        self.assertNotContains(response, 'GitLab could not be reached')
+
+    def tearDown(self):
+        gl_client.reset_clients()
+        cache.clear()
+        get_snapshot_cache().clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+# ---------------------------GITLAB CIRCUIT BREAKER---------------------
+# Tests for the circuit breaker around GitLab calls (gl_bot/breaker.py)
+# ----------------------------------------------------------------------
+
+@tag('gitlab-breaker')
+@override_settings(
+    CACHES=TEST_CACHES, GITLAB_BREAKER_THRESHOLD=2, GITLAB_BREAKER_COOLDOWN=60)
+class TestGitlabBreaker(TestCase):
+    """Test that the circuit breaker opens, short-circuits and closes."""
+
+    def setUp(self):
+        gl_client.reset_clients()
+        cache.clear()
+        self.server = start_fake_gitlab()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        # Nothing listens on port 1, so connections are refused at once.
+        self.down_url = 'http://127.0.0.1:1'
+
+    def test_breaker_opens_after_threshold(self):
+        """After two failures, calls fail without contacting GitLab."""
+        with override_settings(GITLAB_URL=self.down_url):
+            gl = gl_client.get_gitlab_client(gl_client.PUBLIC)
+            for attempt in range(2):
+                with self.assertRaises(ConnectionError):
+                    gl.projects.get(1)
+            self.assertEqual(breaker.get_state(), breaker.OPEN)
+            misses = gl_client.pool_stats()[gl_client.PUBLIC]['misses']
+            with self.assertRaises(breaker.GitlabCircuitOpen):
+                gl.projects.get(1)
+            state = breaker.breaker_state()
+        self.assertEqual(
+            gl_client.pool_stats()[gl_client.PUBLIC]['misses'], misses)
+        self.assertEqual(state['trips'], 1)
+
+    def test_breaker_per_gitlab_url(self):
+        """A circuit open for one GitLab URL does not affect another."""
+        with override_settings(GITLAB_URL=self.down_url):
+            breaker.trip()
+        with override_settings(GITLAB_URL=self.url):
+            self.assertEqual(breaker.get_state(), breaker.CLOSED)
+            project = gl_client.get_gitlab_client(
+                gl_client.PUBLIC).projects.get(1)
+        self.assertEqual(project.name, 'Fake Project')
+
+    def test_breaker_half_open_probe(self):
+        """After the cool-down one probe is let through, and its success
+        closes the circuit."""
+        with override_settings(GITLAB_URL=self.url):
+            breaker.trip()
+            with override_settings(GITLAB_BREAKER_COOLDOWN=0):
+                self.assertEqual(breaker.get_state(), breaker.HALF_OPEN)
+                self.assertTrue(breaker.allow_request())
+                # The probe lock is taken, so no one else gets through.
+                self.assertFalse(breaker.allow_request())
+                breaker.get_breaker_cache().delete(breaker.breaker_key('probe'))
+                gl_client.get_gitlab_client(gl_client.PUBLIC).projects.get(1)
+            self.assertEqual(breaker.get_state(), breaker.CLOSED)
+
+    def test_breaker_failed_probe_reopens(self):
+        """A failed probe restarts the cool-down."""
+        with override_settings(GITLAB_URL=self.down_url):
+            breaker.trip()
+            with override_settings(GITLAB_BREAKER_COOLDOWN=0):
+                with self.assertRaises(ConnectionError):
+                    gl_client.get_gitlab_client(
+                        gl_client.PUBLIC).projects.get(1)
+            self.assertEqual(breaker.get_state(), breaker.OPEN)
+            self.assertEqual(breaker.breaker_state()['trips'], 2)
+
+    def test_breaker_shared_between_processes(self):
+        """With the SQLite store, a circuit opened by one worker is open
+        for the others, which read the same file."""
+        from shared.counters import SQLiteCounterCache
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            location = directory + '/gitlab_breaker.sqlite3'
+            with override_settings(GITLAB_URL=self.down_url, CACHES={
+                    **TEST_CACHES, 
+                    'gitlab_breaker': {
+                        'BACKEND': 'shared.counters.SQLiteCounterCache',
+                        'LOCATION': location,
+                    }}):
+                gl = gl_client.get_gitlab_client(gl_client.PUBLIC)
+                for attempt in range(2):
+                    with self.assertRaises(ConnectionError):
+                        gl.projects.get(1)
+                # What another worker would see.
+                other_worker = SQLiteCounterCache(location, {})
+                self.assertIsNotNone(
+                    other_worker.get(breaker.breaker_key('opened_at_ms')))
+                self.assertEqual(breaker.get_state(), breaker.OPEN)
+                breaker.record_success()
+                self.assertIsNone(
+                    other_worker.get(breaker.breaker_key('opened_at_ms')))
+
+    def test_issue_detail_view_with_open_breaker(self):
+        """With the circuit open, the issue detail view makes no GitLab
+        calls and shows the GitlabDown mocks."""
+        with override_settings(GITLAB_URL=self.url):
+            project = Project(gitlab_id=1)
+            project.save()
+            breaker.trip()
+            FakeGitlabHandler.paths = []
+            url = reverse('issue-detail-view', args=[
+                'duo-atlas-hypnotism-curry-creatable-rubble', project.slug, 2])
+            response = self.client.get(url)
+        self.assertEqual(FakeGitlabHandler.paths, [])
+        self.assertEqual(
+            response.context['results']['issue']['title'], 
+            GitlabDownIssue().title)
+
+    def test_gitlab_status_view(self):
+        """The status view is for staff only and reports the breaker."""
+        url = reverse('mod-gitlab-status')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        staff = User.objects.create(username='Staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['breaker']['state'], breaker.CLOSED)
+        self.assertIn('pools', response.json())
+        self.assertIn('cache', response.json())
+        self.assertIn('fingerprint_us', response.json()['ratelimit'])
+        self.assertIn('hit_ratio', response.json()['markdown'])
+
+    def tearDown(self):
+        gl_client.reset_clients()
+        cache.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+# ---------------------------GITLAB JOB QUEUE---------------------------
+# Tests for posting approved items through the job queue 
+# (anonticket/outbox.py)
+# ----------------------------------------------------------------------
+
+@tag('gitlab-jobs')
+@override_settings(
+    CACHES=TEST_CACHES, GITLAB_BREAKER_THRESHOLD=100, GITLAB_JOB_MAX_ATTEMPTS=2)
+class TestGitlabJobs(TestCase):
+    """Test that approvals only queue jobs, and that the worker posts them,
+    retries and records the outcome."""
+
+    def setUp(self):
+        gl_client.reset_clients()
+        cache.clear()
+        self.server = start_fake_gitlab()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        # Nothing listens on port 1, so connections are refused at once.
+        self.down_url = 'http://127.0.0.1:1'
+        with override_settings(GITLAB_URL=self.url):
+            self.project = Project(gitlab_id=1)
+            self.project.save()
+        self.user = UserIdentifier.objects.create(
+            user_identifier='duo-atlas-hypnotism-curry-creatable-rubble')
+        self.issue = Issue.objects.create(
+            title='A Pending Issue',
+            description='A description of a pending issue',
+            linked_project=self.project,
+            linked_user=self.user)
+
+    def approve_issue(self):
+        """Approve the issue, checking that GitLab is not called."""
+        FakeGitlabHandler.paths = []
+        with override_settings(GITLAB_URL=self.url):
+            self.issue.reviewer_status = 'A'
+            self.issue.save()
+        self.assertEqual(FakeGitlabHandler.paths, [])
+        self.issue.refresh_from_db()
+
+    def test_approval_queues_job(self):
+        """Approving an issue queues one job, however often it is saved."""
+        self.approve_issue()
+        self.issue.save()
+        self.assertEqual(self.issue.gitlab_status, 'Q')
+        job = GitlabJob.objects.get()
+        self.assertEqual(job.idempotency_key, f'issue-{self.issue.pk}')
+        self.assertEqual(job.status, GitlabJob.QUEUED)
+
+    def test_approve_reject_approve(self):
+        """An item rejected before its job ran, then approved again, is
+        posted: the cancelled job is queued again."""
+        self.approve_issue()
+        self.issue.reviewer_status = 'R'
+        self.issue.save()
+        with override_settings(GITLAB_URL=self.url):
+            outbox.process_jobs()
+        self.assertEqual(GitlabJob.objects.get().status, GitlabJob.CANCELLED)
+        self.approve_issue()
+        job = GitlabJob.objects.get()
+        self.assertEqual(job.status, GitlabJob.QUEUED)
+        self.assertEqual(job.attempts, 0)
+        with override_settings(GITLAB_URL=self.url):
+            outbox.process_jobs()
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.gitlab_status, 'S')
+        self.assertEqual(GitlabJob.objects.get().status, GitlabJob.DONE)
+        self.assertEqual(len(FakeGitlabHandler.created['issues']), 1)
+
+    def test_marker_is_opaque(self):
+        """The marker posted with an issue is the job's random key, not
+        anything from the database."""
+        self.approve_issue()
+        with override_settings(GITLAB_URL=self.url):
+            outbox.process_jobs()
+        job = GitlabJob.objects.get()
+        description = FakeGitlabHandler.created['issues'][0]['description']
+        self.assertTrue(description.endswith(
+            f'<!-- anonticket-job {job.marker_key} -->'))
+        self.assertNotIn(job.idempotency_key, description)
+        self.assertNotEqual(
+            GitlabJob.objects.create(
+                kind=GitlabJob.NOTE, object_id=1, idempotency_key='note-1'
+            ).marker_key, job.marker_key)
+
+    def test_approval_rolled_back_without_job(self):
+        """If the job cannot be queued, the approval is not saved either."""
+        self.issue.reviewer_status = 'A'
+        with patch.object(
+                GitlabJob, 'enqueue', side_effect=RuntimeError('No queue.')):
+            with self.assertRaises(RuntimeError):
+                self.issue.save()
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.reviewer_status, 'P')
+        self.assertEqual(self.issue.gitlab_status, '')
+
+    def test_worker_posts_issue(self):
+        """The worker posts the issue and records it on the issue and job."""
+        self.approve_issue()
+        with override_settings(GITLAB_URL=self.url):
+            jobs = outbox.process_jobs()
+        self.assertEqual(len(jobs), 1)
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.gitlab_status, 'S')
+        self.assertTrue(self.issue.posted_to_GitLab)
+        self.assertEqual(self.issue.gitlab_iid, 3)
+        self.assertEqual(GitlabJob.objects.get().status, GitlabJob.DONE)
+        posted = FakeGitlabHandler.created['issues'][0]
+        self.assertTrue(posted['description'].startswith(
+            'A description of a pending issue'))
+        # Nothing is left to run.
+        with override_settings(GITLAB_URL=self.url):
+            self.assertEqual(outbox.process_jobs(), [])
+
+    def test_retry_does_not_post_twice(self):
+        """If an attempt posted the issue but was not recorded, the retry
+        finds the issue by its job's marker instead of posting again."""
+        self.approve_issue()
+        with override_settings(GITLAB_URL=self.url):
+            outbox.process_jobs()
+            # Forget the outcome, as if the worker died after posting.
+            Issue.objects.filter(pk=self.issue.pk).update(
+                gitlab_iid=None, posted_to_GitLab=False, gitlab_status='Q')
+            GitlabJob.objects.update(status=GitlabJob.QUEUED)
+            outbox.process_jobs()
+        self.assertEqual(len(FakeGitlabHandler.created['issues']), 1)
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.gitlab_iid, 3)
+        self.assertEqual(GitlabJob.objects.get().attempts, 2)
+
+    def test_failed_job_retried_then_failed(self):
+        """A failed attempt is retried later, and after 
+        GITLAB_JOB_MAX_ATTEMPTS the job and issue are marked failed."""
+        self.approve_issue()
+        with override_settings(GITLAB_URL=self.down_url):
+            outbox.process_jobs()
+            job = GitlabJob.objects.get()
+            self.assertEqual(job.status, GitlabJob.QUEUED)
+            self.assertEqual(job.attempts, 1)
+            self.assertIn('ConnectionError', job.last_error)
+            # Not ready until the backoff has passed.
+            self.assertEqual(outbox.process_jobs(), [])
+            GitlabJob.objects.update(run_after=job.created_at)
+            outbox.process_jobs()
+        self.assertEqual(GitlabJob.objects.get().status, GitlabJob.FAILED)
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.gitlab_status, 'F')
+        self.assertEqual(outbox.requeue_failed(), 1)
+        with override_settings(GITLAB_URL=self.url):
+            outbox.process_jobs()
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.gitlab_status, 'S')
+
+    def test_circuit_open_does_not_use_attempt(self):
+        """While the circuit is open, jobs wait without using attempts."""
+        self.approve_issue()
+        with override_settings(GITLAB_URL=self.url):
+            breaker.trip()
+            outbox.process_jobs()
+            breaker.reset_breaker()
+        job = GitlabJob.objects.get()
+        self.assertEqual(job.status, GitlabJob.QUEUED)
+        self.assertEqual(job.attempts, 0)
+        self.assertEqual(FakeGitlabHandler.created['issues'], [])
+
+    def test_claimed_job_not_claimed_again(self):
+        """A job claimed by one worker is not claimed by another until
+        its lease runs out."""
+        self.approve_issue()
+        self.assertEqual(len(outbox.claim_jobs(10)), 1)
+        self.assertEqual(outbox.claim_jobs(10), [])
+        GitlabJob.objects.update(locked_until=self.issue.created_at)
+        self.assertEqual(len(outbox.claim_jobs(10)), 1)
+
+    def test_worker_posts_note_and_account(self):
+        """Notes and account requests are run the same way."""
+        with override_settings(GITLAB_URL=self.url):
+            note = Note.objects.create(
+                body='An approved note',
+                linked_project=self.project,
+                linked_user=self.user,
+                issue_iid=2,
+                reviewer_status='A')
+            account = GitlabAccountRequest.objects.create(
+                username='newuser',
+                email='newuser@example.com',
+                reason='A reason',
+                reviewer_status='A')
+            outbox.process_jobs(workers=1)
+        note.refresh_from_db()
+        account.refresh_from_db()
+        self.assertEqual(note.gitlab_status, 'S')
+        self.assertEqual(note.gitlab_id, 200)
+        self.assertTrue(account.approved_to_GitLab)
+        self.assertEqual(account.gitlab_status, 'S')
+        self.assertEqual(
+            FakeGitlabHandler.created['users'][0]['username'], 'newuser')
+        self.assertEqual(outbox.job_counts()['done'], 2)
+
+    def test_account_username_taken(self):
+        """A GitLab user with the requested username but another email is
+        not taken over: the job fails at once, on the first attempt and on
+        a retry, and the other user is left alone."""
+        FakeGitlabHandler.created['users'].append({
+            'id': 150, 'name': 'newuser', 'username': 'newuser',
+            'email': 'someone@example.com'})
+        with override_settings(GITLAB_URL=self.url):
+            account = GitlabAccountRequest.objects.create(
+                username='newuser',
+                email='newuser@example.com',
+                reason='A reason',
+                reviewer_status='A')
+            FakeGitlabHandler.paths = []
+            outbox.process_jobs(workers=1)
+            with self.assertRaises(GitlabUsernameTaken):
+                account.approve_request('account-1', retry=True)
+        job = GitlabJob.objects.get()
+        self.assertEqual(job.status, GitlabJob.FAILED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('GitlabUsernameTaken', job.last_error)
+        account.refresh_from_db()
+        self.assertEqual(account.gitlab_status, 'F')
+        self.assertFalse(account.approved_to_GitLab)
+        self.assertNotIn('/api/v4/users/150', FakeGitlabHandler.paths)
+        self.assertEqual(len(FakeGitlabHandler.created['users']), 1)
+
+    def test_account_retry_reuses_own_user(self):
+        """A retry finds the user an earlier attempt created, by username
+        and email, instead of creating it again."""
+        FakeGitlabHandler.created['users'].append({
+            'id': 150, 'name': 'newuser', 'username': 'newuser',
+            'email': 'NewUser@example.com'})
+        account = GitlabAccountRequest(
+            username='newuser', email='newuser@example.com', reason='A reason')
+        with override_settings(GITLAB_URL=self.url):
+            account.approve_request('account-1', retry=True)
+        self.assertTrue(account.approved_to_GitLab)
+        self.assertEqual(len(FakeGitlabHandler.created['users']), 1)
+
+    def test_requeued_account_finds_existing_user(self):
+        """An account request approved before the job queue existed (so
+        marked failed, with no job) whose user was created is requeued
+        and finds that user on its first attempt."""
+        FakeGitlabHandler.created['users'].append({
+            'id': 150, 'name': 'olduser', 'username': 'olduser',
+            'email': 'olduser@example.com'})
+        account = GitlabAccountRequest.objects.create(
+            username='olduser', email='olduser@example.com', reason='A reason')
+        GitlabAccountRequest.objects.filter(pk=account.pk).update(
+            reviewer_status='A', gitlab_status='F')
+        self.assertEqual(outbox.requeue_failed(), 1)
+        self.assertTrue(GitlabJob.objects.get().maybe_sent)
+        with override_settings(GITLAB_URL=self.url):
+            outbox.process_jobs(workers=1)
+        account.refresh_from_db()
+        self.assertEqual(account.gitlab_status, 'S')
+        self.assertTrue(account.approved_to_GitLab)
+        self.assertEqual(GitlabJob.objects.get().attempts, 1)
+        self.assertEqual(len(FakeGitlabHandler.created['users']), 1)
+
+    @override_settings(GITLAB_JOB_WORKERS=1)
+    def test_admin_bulk_approve(self):
+        """The admin action approves the selected issues at once, posts 
+        them and reports the outcome."""
+        Issue.objects.bulk_create([
+            Issue(
+                title=f'Issue {number}',
+                description='A description',
+                linked_project=self.project,
+                linked_user=self.user,
+            ) for number in range(3)
+        ])
+        admin = User.objects.create(
+            username='Admin', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        url = reverse('admin:anonticket_issue_changelist')
+        with override_settings(GITLAB_URL=self.url):
+            response = self.client.post(url, {
+                'action': 'bulk_approve_issues',
+                '_selected_action': list(
+                    Issue.objects.values_list('pk', flat=True)),
+            }, follow=True)
+        self.assertContains(response, 'Approved 4 items and posted 4 of 4')
+        self.assertEqual(len(FakeGitlabHandler.created['issues']), 4)
+        self.assertEqual(
+            Issue.objects.filter(reviewer_status='A', gitlab_status='S').count(), 4)
+        self.assertEqual(outbox.job_counts()['done'], 4)
+
+    def test_approve_items_requeues_failed(self):
+        """Approving items again queues their failed jobs again."""
+        self.approve_issue()
+        GitlabJob.objects.update(status=GitlabJob.FAILED, attempts=2)
+        Issue.objects.update(gitlab_status='F')
+        jobs = outbox.approve_items(GitlabJob.ISSUE, list(Issue.objects.all()))
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0].status, GitlabJob.QUEUED)
+        self.assertEqual(jobs[0].attempts, 0)
+        self.assertEqual(Issue.objects.get().gitlab_status, 'Q')
+
+    def test_note_create_no_gitlab_calls(self):
+        """Submitting a note makes no GitLab calls; the worker fills in
+        its issue title afterwards, fetching each issue once."""
+        url = reverse('create-note', args=[
+            self.user.user_identifier, self.project.slug, 2])
+        FakeGitlabHandler.paths = []
+        with override_settings(GITLAB_URL=self.url):
+            for number in range(2):
+                response = self.client.post(url, {'body': f'Note {number}'})
+                self.assertEqual(response.status_code, 302)
+        self.assertEqual(FakeGitlabHandler.paths, [])
+        self.assertEqual(Note.objects.filter(gitlab_issue_title='').count(), 2)
+        with override_settings(GITLAB_URL=self.url):
+            self.assertEqual(outbox.resolve_issue_titles(), 2)
+        self.assertEqual(FakeGitlabHandler.paths, ['/api/v4/projects/1/issues/2'])
+        self.assertEqual(
+            Note.objects.filter(gitlab_issue_title='Fake Issue').count(), 2)
+
+    def test_note_create_uses_cached_issue(self):
+        """A note on an issue the user just viewed gets its title from the
+        cache."""
+        detail_url = reverse('issue-detail-view', args=[
+            self.user.user_identifier, self.project.slug, 2])
+        url = reverse('create-note', args=[
+            self.user.user_identifier, self.project.slug, 2])
+        with override_settings(GITLAB_URL=self.url):
+            self.client.get(detail_url)
+            FakeGitlabHandler.paths = []
+            self.client.post(url, {'body': 'A note'})
+        self.assertEqual(FakeGitlabHandler.paths, [])
+        self.assertEqual(Note.objects.get().gitlab_issue_title, 'Fake Issue')
+
+    def test_resolve_issue_titles_gitlab_down(self):
+        """Titles are left blank while GitLab is down, to be tried again."""
+        Note.objects.create(
+            body='A note', linked_project=self.project, 
+            linked_user=self.user, issue_iid=2)
+        with override_settings(GITLAB_URL=self.down_url):
+            self.assertEqual(outbox.resolve_issue_titles(), 0)
+        self.assertEqual(Note.objects.get().gitlab_issue_title, '')
+
+    def test_resolve_issue_titles_gitlab_hung(self):
+        """A read timeout is not taken to mean the issue does not exist."""
+        Note.objects.create(
+            body='A note', linked_project=self.project, 
+            linked_user=self.user, issue_iid=2)
+        FakeGitlabHandler.delay = 1
+        with override_settings(GITLAB_URL=self.url, GITLAB_TIMEOUT=0.2):
+            self.assertEqual(outbox.resolve_issue_titles(), 0)
+        self.assertEqual(Note.objects.get().gitlab_issue_title, '')
+
+    def tearDown(self):
+        gl_client.reset_clients()
+        cache.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+# ---------------------------PROJECT SYNC-------------------------------
+# Tests for fetching project details on save and in bulk 
+# (anonticket/sync.py)
+# ----------------------------------------------------------------------
+
+@tag('gitlab-sync')
+@override_settings(CACHES=TEST_CACHES)
+class TestProjectSync(TestCase):
+    """Test when projects are fetched from GitLab."""
+
+    def setUp(self):
+        gl_client.reset_clients()
+        cache.clear()
+        self.server = start_fake_gitlab()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def test_save_fetches_only_when_needed(self):
+        """New projects and changed gitlab ids are fetched; other saves
+        are not, unless refresh is asked for."""
+        with override_settings(GITLAB_URL=self.url):
+            project = Project(gitlab_id=1)
+            project.save()
+            self.assertEqual(FakeGitlabHandler.paths, ['/api/v4/projects/1'])
+            project = Project.objects.get()
+            project.description = 'Edited in the admin panel.'
+            project.save()
+            self.assertEqual(len(FakeGitlabHandler.paths), 1)
+            project.gitlab_id = 2
+            project.save()
+            self.assertEqual(FakeGitlabHandler.paths[-1], '/api/v4/projects/2')
+            project.save(refresh=True)
+        self.assertEqual(len(FakeGitlabHandler.paths), 3)
+
+    def test_sync_projects_command(self):
+        """The command refreshes every project, fetching each once, and
+        keeps their slugs unique."""
+        Project.objects.bulk_create([
+            Project(gitlab_id=number, slug=f'old-{number}') 
+            for number in range(1, 4)
+        ])
+        out = StringIO()
+        with override_settings(GITLAB_URL=self.url):
+            call_command('sync_projects', workers=3, stdout=out)
+        self.assertIn('Refreshed 3 of 3 projects', out.getvalue())
+        self.assertCountEqual(FakeGitlabHandler.paths, [
+            '/api/v4/projects/1', '/api/v4/projects/2', '/api/v4/projects/3'])
+        # The fake GitLab gives every project the same name.
+        self.assertEqual(
+            list(Project.objects.order_by('gitlab_id').values_list('slug', flat=True)),
+            ['fake-project', 'fake-project-2', 'fake-project-3'])
+        self.assertEqual(
+            Project.objects.filter(name_with_namespace='Fakes / Fake Project').count(), 3)
 
+    def test_sync_projects_reports_failures(self):
+        """Projects that can't be fetched are reported and left as they are."""
+        Project.objects.bulk_create([Project(gitlab_id=1, slug='old-1')])
+        out = StringIO()
+        err = StringIO()
+        with override_settings(GITLAB_URL='http://127.0.0.1:1'):
+            call_command('sync_projects', stdout=out, stderr=err)
+        self.assertIn('Refreshed 0 of 1 projects', out.getvalue())
+        self.assertIn('Could not fetch project 1', err.getvalue())
+        self.assertEqual(Project.objects.get().slug, 'old-1')
 
+    def tearDown(self):
+        gl_client.reset_clients()
+        cache.clear()
+        self.server.shutdown()
+        self.server.server_close()
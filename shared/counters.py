@@ -0,0 +1,184 @@
+"""A Django cache backend for counters that all the processes on a host
+share, e.g., the rate limits' (see shared/ratelimits.py). The counters
+are kept in a SQLite database in WAL mode, so no memcached or redis server
+is needed. Operations that take more than one SQL statement (add, incr and
+hit_windows) run in a BEGIN IMMEDIATE transaction, so they are atomic
+without needing RETURNING or upserts from newer SQLite versions.
+
+LocMemCache keeps a separate copy of the counters in each gunicorn worker,
+which lets a client make LIMIT_RATE requests to every worker. Only
+integers can be stored."""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires REAL)"""
+
+WINDOWS_SCHEMA = """CREATE TABLE IF NOT EXISTS windows (
+    key TEXT PRIMARY KEY, window INTEGER NOT NULL, current INTEGER NOT NULL,
+    previous INTEGER NOT NULL, allowed INTEGER NOT NULL, expires REAL)"""
+
+# Matches rows that have not expired; expires is NULL for no expiry.
+LIVE = "(expires IS NULL OR expires > ?)"
+
+# The counts of a sliding window once moved on to :window, and whether a
+# hit is allowed; the same sums as shared.ratelimits.slide(). A window seen
+# for the first time is inserted empty and then hit like any other.
+PREVIOUS = """(CASE WHEN window = :window THEN previous
+    WHEN window = :window - 1 THEN current ELSE 0 END)"""
+CURRENT = "(CASE WHEN window = :window THEN current ELSE 0 END)"
+ALLOWED = f"({PREVIOUS} * :weight + {CURRENT} + 1 <= :limit)"
+NEW_WINDOW = """INSERT OR IGNORE INTO windows VALUES (
+    :key, :window, 0, 0, 0, :expires)"""
+HIT_WINDOW = f"""UPDATE windows SET previous = {PREVIOUS},
+    current = {CURRENT} + {ALLOWED}, allowed = {ALLOWED}, window = :window,
+    expires = :expires WHERE key = :key"""
+
+
+class SQLiteCounterCache(BaseCache):
+    """Cache backend storing integers in the SQLite database at LOCATION."""
+
+    # Expired rows are deleted after every cull_every writes in a process.
+    cull_every = 1000
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def connection(self):
+        """This thread's connection, opened on first use. A process forked
+        after the connection was opened (e.g., by gunicorn --preload)
+        opens its own."""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self.location, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(SCHEMA)
+            connection.execute(WINDOWS_SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def execute(self, sql, params):
+        return self.connection.execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        """Run the statements in the block as one write transaction,
+        taking the database's write lock at the start."""
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def expiry(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def check_value(self, value):
+        if not isinstance(value, int):
+            raise TypeError(f"{self.__class__.__name__} only stores integers.")
+        return value
+
+    def wrote(self):
+        """Count a write, deleting expired rows every cull_every writes."""
+        self._writes += 1
+        if self._writes % self.cull_every == 0:
+            now = time.time()
+            self.execute("DELETE FROM counters WHERE expires <= ?", (now,))
+            self.execute("DELETE FROM windows WHERE expires <= ?", (now,))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        value = self.check_value(value)
+        # Replaces an expired row, but not a live one.
+        with self.transaction():
+            self.execute(
+                "DELETE FROM counters WHERE key = ? AND expires <= ?",
+                (key, time.time()))
+            cursor = self.execute(
+                "INSERT OR IGNORE INTO counters VALUES (?, ?, ?)",
+                (key, value, self.expiry(timeout)))
+        self.wrote()
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self.execute(
+            f"SELECT value FROM counters WHERE key = ? AND {LIVE}",
+            (key, time.time())).fetchone()
+        return default if row is None else row[0]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.execute(
+            "INSERT OR REPLACE INTO counters VALUES (?, ?, ?)",
+            (key, self.check_value(value), self.expiry(timeout)))
+        self.wrote()
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        cursor = self.execute(
+            f"UPDATE counters SET expires = ? WHERE key = ? AND {LIVE}",
+            (self.expiry(timeout), key, time.time()))
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self.transaction():
+            cursor = self.execute(
+                f"UPDATE counters SET value = value + ? WHERE key = ? AND {LIVE}",
+                (delta, key, time.time()))
+            if cursor.rowcount != 1:
+                raise ValueError(f"Key '{key}' not found")
+            return self.execute(
+                "SELECT value FROM counters WHERE key = ?", (key,)).fetchone()[0]
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self.execute(
+            "DELETE FROM counters WHERE key = ?", (key,)).rowcount == 1
+
+    def clear(self):
+        self.execute("DELETE FROM counters", ())
+        self.execute("DELETE FROM windows", ())
+
+    def hit_windows(self, hits):
+        """Count a hit on several sliding windows in one transaction. hits
+        is a list of (key, window, weight, limit, expires) tuples (see
+        shared.ratelimits.hit_windows); returns whether each hit was
+        allowed."""
+        allowed = []
+        with self.transaction():
+            for key, window, weight, limit, expires in hits:
+                key = self.make_key(key)
+                self.validate_key(key)
+                params = {
+                    'key': key, 'window': window, 'weight': weight, 
+                    'limit': limit, 'expires': expires,
+                }
+                self.execute(NEW_WINDOW, params)
+                self.execute(HIT_WINDOW, params)
+                allowed.append(bool(self.execute(
+                    "SELECT allowed FROM windows WHERE key = :key", params
+                ).fetchone()[0]))
+        self.wrote()
+        return allowed
@@ -1,40 +1,77 @@
-from django.core.validators import validate_ipv46_address
-from django.core.exceptions import ValidationError
+from functools import lru_cache
+import ipaddress
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+
+# Longest text form of an IP address (IPv6 ending in an IPv4 address).
+MAX_IP_LENGTH = 45
+
+@lru_cache(maxsize=1024)
+def _parse_ip(value):
+    try:
+        return ipaddress.ip_address(value)
+    except ValueError:
+        return None
+
+def parse_ip(value):
+    """Returns value as an ipaddress address, or None if it isn't one.
+    Recently parsed values are kept in a small LRU; values too long to be
+    addresses are turned down without parsing or caching them."""
+    value = value.strip()
+    if not value or len(value) > MAX_IP_LENGTH:
+        return None
+    return _parse_ip(value)
 
 
 class XForwardedForMiddleware:
     """
     Set REMOTE_ADDR if it's missing because of a reverse proxy (nginx + gunicorn) deployment.
     https://stackoverflow.com/questions/34251298/empty-remote-addr-value-in-django-application-when-using-nginx-as-reverse-proxy
+
+    Each proxy adds the address it got the request from to the right of
+    X-Forwarded-For, so the client is the first address from the right
+    that isn't in settings.TRUSTED_PROXIES. Entries to the left of it were
+    sent by the client and are not parsed, and no more than
+    settings.XFF_MAX_HOPS entries are looked at, so a long spoofed header
+    costs no more than a short one. The header is only used when the
+    request comes from a trusted proxy (or a unix socket).
     """
     def __init__(self, get_response):
         self.get_response = get_response
+        self.trusted_proxies = [
+            ipaddress.ip_network(network) for network in settings.TRUSTED_PROXIES]
+        self.max_hops = settings.XFF_MAX_HOPS
 
     def __call__(self, request):
-        if 'HTTP_X_FORWARDED_FOR' in request.META:
-            remote_addrs = request.META['HTTP_X_FORWARDED_FOR'].split(',')
-            remote_addr = None
-
-            # for some bots, 'unknown' was prepended as the first value: `unknown, ***.***.***.***`
-            # in which case the second value actually is the correct one
-            for ip in remote_addrs:
-                ip = self._validated_ip(ip)
-                if ip is not None:
-                    remote_addr = ip
-                    break
-
-            if remote_addr is None:
-                raise SuspiciousOperation('Malformed X-Forwarded-For.')
-
-            request.META['HTTP_X_PROXY_REMOTE_ADDR'] = request.META['REMOTE_ADDR']
-            request.META['REMOTE_ADDR'] = remote_addr
+        forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded_for:
+            proxy_addr = request.META.get('REMOTE_ADDR', '')
+            if not proxy_addr or self._is_trusted(parse_ip(proxy_addr)):
+                remote_addr = self._client_ip(forwarded_for)
+                if remote_addr is None:
+                    raise SuspiciousOperation('Malformed X-Forwarded-For.')
+                request.META['HTTP_X_PROXY_REMOTE_ADDR'] = proxy_addr
+                request.META['REMOTE_ADDR'] = remote_addr
 
         return self.get_response(request)
 
-    def _validated_ip(self, ip):
-        ip = ip.strip()
-        try:
-            validate_ipv46_address(ip)
-        except ValidationError:
-            return None
-        return ip
\ No newline at end of file
+    def _is_trusted(self, ip):
+        return ip is not None and any(
+            ip in network for network in self.trusted_proxies)
+
+    def _client_ip(self, forwarded_for):
+        """Returns the first valid address from the right of forwarded_for
+        that isn't a trusted proxy (or the leftmost one looked at, if all
+        of them are), or None if there are no valid addresses."""
+        client_ip = None
+        # for some bots, 'unknown' was prepended as the first value:
+        # `unknown, ***.***.***.***`, so entries that aren't addresses are
+        # skipped.
+        for entry in reversed(forwarded_for.rsplit(',', self.max_hops)):
+            ip = parse_ip(entry)
+            if ip is None:
+                continue
+            client_ip = ip
+            if not self._is_trusted(ip):
+                break
+        return None if client_ip is None else str(client_ip)
@@ -0,0 +1,164 @@
+"""Rate limits for the views that take posts, checked for several keys of a
+request at once (its IP address, the data posted, and its user
+identifier) with one batched cache operation.
+
+Each key has a sliding window: the count of the current period, plus the
+count of the previous period weighted by how much of it still falls within
+the last period. A request is limited if any of its windows is full, and
+is only counted in the windows that let it through. The rates are set per
+view (by the route name given to its decorator) in 
+settings.RATELIMIT_RATES, and default to settings.LIMIT_RATE. Counts of
+the checks made, and the time they take, are kept by ratelimit_stats()."""
+
+import hashlib
+import re
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+RATE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+class RateLimitStats:
+    """Thread-safe counts of the rate limit checks made by this process,
+    and the time spent on them."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.limited = 0
+        self.check_seconds = 0.0
+        self.fingerprint_seconds = 0.0
+
+    def record(self, limited, check_seconds, fingerprint_seconds):
+        with self._lock:
+            self.checks += 1
+            self.limited += limited
+            self.check_seconds += check_seconds
+            self.fingerprint_seconds += fingerprint_seconds
+
+    def as_dict(self):
+        checks = self.checks or 1
+        return {
+            'checks': self.checks,
+            'limited': self.limited,
+            'check_us': self.check_seconds / checks * 1e6,
+            'fingerprint_us': self.fingerprint_seconds / checks * 1e6,
+        }
+
+_STATS = RateLimitStats()
+
+def ratelimit_stats():
+    """Returns this process's rate limit statistics: the number of checks,
+    how many were limited, and the average microseconds taken by a check,
+    and by fingerprinting the data posted."""
+    return _STATS.as_dict()
+
+def reset_stats():
+    """Clear the statistics. Used by tests."""
+    global _STATS
+    _STATS = RateLimitStats()
+
+def post_key(request, kwargs):
+    """A fingerprint of the data posted by a user identifier, leaving out
+    the CSRF token, so that the same post made over and over is limited.
+    Only the length and the first RATELIMIT_POST_PREFIX characters of 
+    each field are hashed, so a long description costs no more to check
+    than a short one."""
+    prefix = settings.RATELIMIT_POST_PREFIX
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(kwargs.get('user_identifier', '').encode())
+    for name, values in sorted(request.POST.lists()):
+        if name == 'csrfmiddlewaretoken':
+            continue
+        for value in values:
+            digest.update(f'\0{name}\0{len(value)}\0'.encode())
+            digest.update(value[:prefix].encode())
+    return digest.hexdigest()
+
+# The keys a request is limited by, and how to get each from the request
+# and the view's keyword arguments. Keys with no value are skipped.
+RATE_KEYS = {
+    'ip': lambda request, kwargs: request.META.get('REMOTE_ADDR'),
+    'post': post_key,
+    'user_identifier': lambda request, kwargs: kwargs.get('user_identifier'),
+}
+
+def parse_rate(rate):
+    """Returns the (limit, period in seconds) of a rate like '100/m' or
+    '5/10m'."""
+    match = re.fullmatch(r'(\d+)/(\d*)([smhd])', str(rate))
+    if match is None:
+        raise ImproperlyConfigured(f"Could not understand rate {rate!r}.")
+    limit, multiple, unit = match.groups()
+    return int(limit), int(multiple or 1) * RATE_UNITS[unit]
+
+def get_rates(route):
+    """Returns the rate of each key for a route."""
+    if settings.BLOCK_ALL:
+        return {name: '0/s' for name in RATE_KEYS}
+    rates = settings.RATELIMIT_RATES.get(route, {})
+    return {name: rates.get(name, settings.LIMIT_RATE) for name in RATE_KEYS}
+
+def slide(state, window, weight, limit):
+    """Count a hit on a sliding window. state is the window's (window,
+    current, previous) counts, or None. Returns whether the hit is allowed
+    and the new state."""
+    if state is None:
+        state = (window, 0, 0)
+    last_window, current, previous = state
+    if last_window != window:
+        previous = current if last_window == window - 1 else 0
+        current = 0
+    allowed = previous * weight + current + 1 <= limit
+    return allowed, (window, current + allowed, previous)
+
+def hit_windows(cache, hits):
+    """Count a hit on several sliding windows. hits is a list of (key,
+    window, weight, limit, expires) tuples; returns whether each hit was
+    allowed. Caches that can do it atomically (SQLiteCounterCache) do so;
+    others take one get_many and one set_many."""
+    if hasattr(cache, 'hit_windows'):
+        return cache.hit_windows(hits)
+    states = cache.get_many([hit[0] for hit in hits])
+    allowed, new_states = [], {}
+    for key, window, weight, limit, expires in hits:
+        hit_allowed, new_states[key] = slide(
+            states.get(key), window, weight, limit)
+        allowed.append(hit_allowed)
+    cache.set_many(
+        new_states, max(hit[4] for hit in hits) - time.time())
+    return allowed
+
+def is_limited(request, route, kwargs, now=None):
+    """Count a request to a route against each of its keys' windows.
+    Returns True if any of them is full."""
+    started = time.perf_counter()
+    if now is None:
+        now = time.time()
+    hits = []
+    fingerprint_seconds = 0.0
+    for name, rate in get_rates(route).items():
+        if name == 'post':
+            fingerprinted = time.perf_counter()
+            value = post_key(request, kwargs)
+            fingerprint_seconds = time.perf_counter() - fingerprinted
+        else:
+            value = RATE_KEYS[name](request, kwargs)
+        if not value:
+            continue
+        limit, period = parse_rate(rate)
+        window = int(now // period)
+        hits.append((
+            f'rl:{settings.MAIN_RATE_GROUP}:{name}:{period}:{value}',
+            window,
+            1 - (now - window * period) / period,
+            limit,
+            # The window's counts matter until the period after next.
+            (window + 2) * period,
+        ))
+    limited = bool(hits) and not all(
+        hit_windows(caches[settings.RATELIMIT_USE_CACHE], hits))
+    _STATS.record(
+        limited, time.perf_counter() - started, fingerprint_seconds)
+    return limited
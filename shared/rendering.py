@@ -0,0 +1,85 @@
+"""Renders markdown to sanitized HTML with django-markdownify (and its
+settings) once per distinct text. The HTML is kept in an LRU of
+MARKDOWN_CACHE_SIZE entries in each process, keyed by a hash of the text,
+so the notes of a popular issue aren't rendered and bleached again on
+every page view. Issues and notes saved in the database keep their HTML
+in description_html and body_html instead."""
+
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.utils.safestring import mark_safe
+from markdownify.templatetags.markdownify import markdownify
+from gl_bot.cache import LocalLRU
+
+# Rendered HTML only changes with the MARKDOWNIFY settings, which need a
+# restart, so entries are only dropped to make room.
+RENDER_TTL = 24 * 60 * 60
+
+class RenderStats:
+    """Thread-safe counts of cached and fresh renders, and the time spent
+    rendering."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.render_seconds = 0.0
+
+    def record(self, hit, render_seconds=0.0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.render_seconds += render_seconds
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'render_ms': (
+                self.render_seconds / self.misses * 1000 if self.misses else 0.0),
+        }
+
+_STATS = RenderStats()
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def get_render_cache():
+    """Returns this process's LocalLRU of rendered HTML, creating it on
+    first use."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = LocalLRU(settings.MARKDOWN_CACHE_SIZE, RENDER_TTL)
+        return _CACHE
+
+def render_markdown(text):
+    """Returns text rendered as sanitized, safe HTML."""
+    text = text or ''
+    key = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    render_cache = get_render_cache()
+    html = render_cache.get(key)
+    if html is not None:
+        _STATS.record(hit=True)
+        return mark_safe(html)
+    started = time.perf_counter()
+    html = markdownify(text)
+    _STATS.record(hit=False, render_seconds=time.perf_counter() - started)
+    render_cache.set(key, str(html))
+    return html
+
+def render_stats():
+    """Returns this process's render statistics: cache hits and misses,
+    the hit ratio, and the average milliseconds taken by a fresh render."""
+    return _STATS.as_dict()
+
+def reset_render_cache():
+    """Clear the cache and the statistics. Used by tests."""
+    global _CACHE, _STATS
+    with _CACHE_LOCK:
+        _CACHE = None
+    _STATS = RenderStats()
@@ -3,6 +3,7 @@
 
 from django import template
 from django.template.defaultfilters import stringfilter
+from shared.rendering import render_markdown
 register = template.Library()
 
 # Custom filters go here.
@@ -10,6 +11,12 @@ register = template.Library()
 # Register filter with library and define it as a function that only 
 # takes strings to avoid AttributeErrors
 
+@register.filter(is_safe=True)
+def cached_markdownify(text):
+    """The markdownify filter, rendering each distinct text only once (see
+    shared/rendering.py)."""
+    return render_markdown(text)
+
 @register.filter(is_safe=True)
 @stringfilter
 def pretty_datetime(iso_string):
@@ -1,3 +1,54 @@
-from django.test import TestCase
+from django.core.exceptions import SuspiciousOperation
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings, tag
+from io import StringIO
 
-# Create your tests here.
+from shared.middleware.reverse_proxy_ip import XForwardedForMiddleware
+
+@tag('forwarded-for')
+@override_settings(TRUSTED_PROXIES=['127.0.0.1/32', '10.0.0.0/8'])
+class TestXForwardedForMiddleware(SimpleTestCase):
+    """Test reading the client's address from X-Forwarded-For."""
+
+    def setUp(self):
+        self.middleware = XForwardedForMiddleware(lambda request: HttpResponse())
+        self.factory = RequestFactory()
+
+    def remote_addr(self, forwarded_for, proxy='127.0.0.1'):
+        request = self.factory.get(
+            '/', HTTP_X_FORWARDED_FOR=forwarded_for, REMOTE_ADDR=proxy)
+        self.middleware(request)
+        return request.META['REMOTE_ADDR']
+
+    def test_first_untrusted_from_the_right(self):
+        """Trusted proxies are skipped, and client-sent entries are not
+        used."""
+        self.assertEqual(self.remote_addr('198.51.100.7'), '198.51.100.7')
+        self.assertEqual(
+            self.remote_addr('1.2.3.4, 198.51.100.7, 10.0.0.2'), '198.51.100.7')
+        self.assertEqual(self.remote_addr('unknown, 198.51.100.7'), '198.51.100.7')
+        self.assertEqual(self.remote_addr('10.0.0.3, 10.0.0.2'), '10.0.0.3')
+
+    def test_untrusted_remote_addr(self):
+        """The header is ignored unless it comes from a trusted proxy."""
+        self.assertEqual(
+            self.remote_addr('198.51.100.7', proxy='203.0.113.1'), '203.0.113.1')
+
+    def test_malformed(self):
+        with self.assertRaises(SuspiciousOperation):
+            self.remote_addr('unknown, not-an-ip')
+
+    def test_long_spoofed_header_not_parsed(self):
+        """Only XFF_MAX_HOPS entries are looked at."""
+        with override_settings(XFF_MAX_HOPS=2):
+            self.middleware = XForwardedForMiddleware(lambda request: HttpResponse())
+            self.assertEqual(
+                self.remote_addr('1.1.1.1, ' * 1000 + '10.0.0.2, 10.0.0.3'),
+                '10.0.0.2')
+
+    def test_benchmark_forwarded_for(self):
+        output = StringIO()
+        call_command(
+            'benchmark_forwarded_for', requests=200, max_ratio=1000, stdout=output)
+        self.assertIn('spoofed', output.getvalue())
@@ -87,12 +87,35 @@ DATABASES = {
     }
 }
 
-# Caching - necessary for Django-Ratelimit
+# Caching - necessary for Django-Ratelimit and the GitLab data cache
 
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    # Last known good copies of GitLab data, served when GitLab is down.
+    # Kept on disk with no expiry so they survive restarts, and never
+    # culled (see gl_bot/snapshots.py), so MAX_ENTRIES does not apply.
+    'gitlab_snapshots': {
+        'BACKEND': 'gl_bot.snapshots.SnapshotFileCache',
+        'LOCATION': config(
+            'GITLAB_SNAPSHOT_DIR', 
+            default=os.path.join(BASE_DIR, 'gitlab_snapshots')),
+        'TIMEOUT': None,
+    },
+    # Django-Ratelimit's counters, shared by all the gunicorn workers.
+    'ratelimit': {
+        'BACKEND': 'shared.counters.SQLiteCounterCache',
+        'LOCATION': config(
+            'RATELIMIT_DB', default=os.path.join(BASE_DIR, 'ratelimit.sqlite3')),
+    },
+    # The GitLab circuit breaker's state, shared by all the gunicorn workers.
+    'gitlab_breaker': {
+        'BACKEND': 'shared.counters.SQLiteCounterCache',
+        'LOCATION': config(
+            'GITLAB_BREAKER_DB', 
+            default=os.path.join(BASE_DIR, 'gitlab_breaker.sqlite3')),
+    },
 }
 
 # Password validation
@@ -143,6 +166,72 @@ GITLAB_ACCOUNTS_SECRET_TOKEN = config('GITLAB_ACCOUNTS_SECRET_TOKEN', default=''
 
 # Set amount of seconds before timeout when making GitLab API calls
 GITLAB_TIMEOUT = config('GITLAB_TIMEOUT', default=10, cast=int)
+# Number of threads per gunicorn worker (--threads), each of which may be
+# serving a page that calls GitLab.
+GUNICORN_THREADS = config('GUNICORN_THREADS', default=10, cast=int)
+# Independent GitLab calls behind one page (up to GITLAB_FANOUT_WIDTH of
+# them; the project detail page makes three) are made in parallel, and all
+# of them share a single deadline of GITLAB_FANOUT_DEADLINE seconds. Each
+# worker runs them in a pool of GITLAB_FANOUT_WORKERS threads, by default
+# GUNICORN_THREADS * GITLAB_FANOUT_WIDTH, so that every request thread can
+# fan out at once without queueing behind another page's calls.
+GITLAB_FANOUT_WIDTH = config('GITLAB_FANOUT_WIDTH', default=3, cast=int)
+GITLAB_FANOUT_WORKERS = config(
+    'GITLAB_FANOUT_WORKERS', default=GUNICORN_THREADS * GITLAB_FANOUT_WIDTH, 
+    cast=int)
+GITLAB_FANOUT_DEADLINE = config(
+    'GITLAB_FANOUT_DEADLINE', default=GITLAB_TIMEOUT, cast=float)
+# Background refreshes of stale cached GitLab data run in a separate pool
+# of GITLAB_REFRESH_WORKERS threads, so they never hold up a page.
+GITLAB_REFRESH_WORKERS = config('GITLAB_REFRESH_WORKERS', default=4, cast=int)
+# Number of keep-alive connections each shared GitLab client keeps open:
+# by default, one for every thread that may be calling GitLab.
+GITLAB_POOL_SIZE = config(
+    'GITLAB_POOL_SIZE', default=GITLAB_FANOUT_WORKERS + GITLAB_REFRESH_WORKERS, 
+    cast=int)
+# Seconds to keep a project's issue totals, used when GitLab leaves the
+# X-Total headers out of a response.
+GITLAB_TOTALS_TTL = config('GITLAB_TOTALS_TTL', default=60, cast=int)
+# Seconds that each kind of read-only GitLab data stays fresh in the cache.
+GITLAB_CACHE_TTLS = {
+    'project': config('GITLAB_CACHE_TTL_PROJECT', default=300, cast=int),
+    'issue_list': config('GITLAB_CACHE_TTL_ISSUE_LIST', default=60, cast=int),
+    'issue': config('GITLAB_CACHE_TTL_ISSUE', default=60, cast=int),
+    'notes': config('GITLAB_CACHE_TTL_NOTES', default=30, cast=int),
+    'search': config('GITLAB_CACHE_TTL_SEARCH', default=60, cast=int),
+}
+# Number of entries in each process's own LRU of repeated lookups (e.g.,
+# issue searches), in front of the shared cache.
+GITLAB_LOCAL_CACHE_SIZE = config(
+    'GITLAB_LOCAL_CACHE_SIZE', default=256, cast=int)
+# Number of rendered markdown texts (e.g., GitLab note bodies) kept by 
+# each process (see shared/rendering.py).
+MARKDOWN_CACHE_SIZE = config('MARKDOWN_CACHE_SIZE', default=1024, cast=int)
+# Seconds that expired data may still be served while it is refreshed in
+# the background.
+GITLAB_CACHE_STALE = config('GITLAB_CACHE_STALE', default=300, cast=int)
+# Name of the cache (see CACHES) that holds last known good GitLab data.
+GITLAB_SNAPSHOT_CACHE = 'gitlab_snapshots'
+# After GITLAB_BREAKER_THRESHOLD failed GitLab calls in a row, stop calling
+# GitLab for GITLAB_BREAKER_COOLDOWN seconds. The breaker's state is kept
+# in the GITLAB_BREAKER_CACHE cache (see CACHES), which every worker on the
+# host shares.
+GITLAB_BREAKER_CACHE = 'gitlab_breaker'
+GITLAB_BREAKER_THRESHOLD = config(
+    'GITLAB_BREAKER_THRESHOLD', default=5, cast=int)
+GITLAB_BREAKER_COOLDOWN = config(
+    'GITLAB_BREAKER_COOLDOWN', default=30, cast=int)
+# Approved items are posted to GitLab by the process_gitlab_jobs command:
+# GITLAB_JOB_WORKERS jobs at a time, each tried up to 
+# GITLAB_JOB_MAX_ATTEMPTS times, waiting GITLAB_JOB_RETRY_DELAY seconds
+# (doubled after each failure) between attempts. A job whose worker dies
+# is run again after GITLAB_JOB_LEASE seconds.
+GITLAB_JOB_WORKERS = config('GITLAB_JOB_WORKERS', default=4, cast=int)
+GITLAB_JOB_MAX_ATTEMPTS = config(
+    'GITLAB_JOB_MAX_ATTEMPTS', default=6, cast=int)
+GITLAB_JOB_RETRY_DELAY = config(
+    'GITLAB_JOB_RETRY_DELAY', default=30, cast=int)
+GITLAB_JOB_LEASE = config('GITLAB_JOB_LEASE', default=300, cast=int)
 # Timeout URL used for testing GL bot 
 TIMEOUT_URL = config('TIMEOUT_URL', default='')
 
@@ -150,7 +239,36 @@ TIMEOUT_URL = config('TIMEOUT_URL', default='')
 MAIN_RATE_GROUP = config('MAIN_RATE_GROUP', default='')
 LIMIT_RATE = config('LIMIT_RATE', default='100/m')
 BLOCK_ALL = config('BLOCK_ALL', default=False, cast=bool)
+RATELIMIT_USE_CACHE = 'ratelimit'
+# Rates of each rate-limited route ('create-issue', 'create-note' and 
+# 'create-gitlab-account') by key ('ip', 'post' and 'user_identifier'), 
+# e.g., {'create-note': {'post': '5/h'}}. Others are LIMIT_RATE.
+RATELIMIT_RATES = {}
+# Posts are fingerprinted by the length and the first 
+# RATELIMIT_POST_PREFIX characters of each field.
+RATELIMIT_POST_PREFIX = config(
+    'RATELIMIT_POST_PREFIX', default=1024, cast=int)
+# Networks of the reverse proxies whose X-Forwarded-For entries are
+# trusted (see shared/middleware/reverse_proxy_ip.py), and the most
+# entries of that header looked at.
+TRUSTED_PROXIES = config(
+    'TRUSTED_PROXIES', 
+    default='127.0.0.1/32, ::1/128',
+    cast=lambda v: [s.strip() for s in v.split(',') if s.strip()]
+    )
+XFF_MAX_HOPS = config('XFF_MAX_HOPS', default=5, cast=int)
 
 # Wordlist Settings for generating wordlist
 WORD_LIST_PATH = os.path.join(BASE_DIR, 'shared/wordlist.txt')
-DICE_ROLLS = 6
\ No newline at end of file
+DICE_ROLLS = 6
+
+# Number of issues and of notes listed on each page of the user landing page.
+LANDING_PAGE_SIZE = config('LANDING_PAGE_SIZE', default=25, cast=int)
+
+# Number of pending issues, notes and account requests shown (and accepted
+# in one POST) on each page of the moderator queue.
+MODERATOR_PAGE_SIZE = config('MODERATOR_PAGE_SIZE', default=50, cast=int)
+
+# Most milliseconds a worker's imports may take at startup, as measured by
+# the benchmark_startup command.
+STARTUP_IMPORT_BUDGET = config('STARTUP_IMPORT_BUDGET', default=1000, cast=int)